@@ -0,0 +1,36 @@
+"""Compare memory and sample() runtime of object and categorical id columns.
+
+Usage: poetry run python benchmarks/bench_categorical.py [--rows 10000000]
+"""
+
+import argparse
+import time
+from datetime import date
+
+import pandas as pd
+from synthetic import generate_events
+
+from sampler.parser import CATEGORICAL_COLUMNS
+from sampler.process import sample
+
+
+def run(label: str, df: pd.DataFrame) -> None:
+    memory = df.memory_usage(deep=True).sum() / 2**20
+
+    start = time.perf_counter()
+    sample(df, 1000, after=date(2022, 1, 1), until=date(2024, 4, 1), include_all_in_output=True)
+    elapsed = time.perf_counter() - start
+
+    print(f"{label}: {memory:.0f} MiB, sample() {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    events = generate_events(args.rows)
+    print(f"rows: {len(events)}")
+
+    run("object", events.astype(dict.fromkeys(CATEGORICAL_COLUMNS, object)))
+    run("categorical", events.astype(dict.fromkeys(CATEGORICAL_COLUMNS, "category")))
@@ -0,0 +1,55 @@
+"""Compare the vectorized parse_events against the per-cell converter path.
+
+Usage: poetry run python benchmarks/bench_parser.py [--repeat 500]
+
+The fixture CSV is repeated ``--repeat`` times to build a larger input.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from functools import partial
+
+import pandas as pd
+
+from sampler.parser import as_iso_timestamp, as_str, as_yyyymmdd, parse_events
+
+FIXTURE = "tests/data/example_data_20240306.csv"
+
+
+def parse_events_with_converters(filename: str) -> pd.DataFrame:
+    return pd.read_csv(
+        filename,
+        converters={
+            "organization_id": partial(as_str, "organization_id"),
+            "professional_id": partial(as_str, "professional_id"),
+            "professional_cohort": partial(as_yyyymmdd, "professional_cohort"),
+            "ts": partial(as_iso_timestamp, "ts"),
+            "event_type": partial(as_str, "event_type"),
+        },
+    )
+
+
+def timed(label: str, func: partial) -> pd.DataFrame:
+    start = time.perf_counter()
+    df = func()
+    print(f"{label}: {time.perf_counter() - start:.2f}s")
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+
+    fixture = pd.read_csv(FIXTURE, dtype=str)
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "events.csv")
+        pd.concat([fixture] * args.repeat).to_csv(filename, index=False)
+        print(f"rows: {len(fixture) * args.repeat}")
+
+        converters = timed("converters", partial(parse_events_with_converters, filename))
+        vectorized = timed("vectorized", partial(parse_events, filename))
+
+    pd.testing.assert_frame_equal(converters, vectorized)
@@ -0,0 +1,30 @@
+"""Throughput of anonymized id generation.
+
+Usage: poetry run python benchmarks/bench_privacy.py [--ids 1000000]
+"""
+
+import argparse
+import time
+from uuid import uuid4
+
+from sampler.privacy import generate_anonymized_id_mapping
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ids", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    ids = [f"professional-{i}" for i in range(args.ids)]
+
+    start = time.perf_counter()
+    mapping = {v: str(uuid4()) for v in ids}
+    collisions = len(mapping) - len(set(mapping.values()))
+    print(f"uuid4 per id: {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    generate_anonymized_id_mapping(ids)
+    print(f"random batch: {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    generate_anonymized_id_mapping(ids, key=b"benchmark key")
+    print(f"keyed: {time.perf_counter() - start:.2f}s")
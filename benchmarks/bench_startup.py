@@ -0,0 +1,45 @@
+"""Start up time of the CLI commands that do not read any data.
+
+Usage: poetry run python benchmarks/bench_startup.py [--runs 20]
+
+Each command runs in a fresh interpreter, the best wall time of ``--runs`` is reported next to a bare
+``import pandas`` for reference.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMANDS = {
+    "--help": ["sampler/main.py", "--help"],
+    "check_config": ["sampler/main.py", "check_config", "tests/data/config.json"],
+    "mappings": ["sampler/main.py", "mappings", "tests/data/id_mappings.json"],
+    "import pandas": ["-c", "import pandas"],
+}
+
+
+def best_wall_time(arguments: list[str], runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(  # noqa: S603
+            [sys.executable, *arguments],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            cwd=ROOT,
+            env={**os.environ, "PYTHONPATH": ROOT},
+        )
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    for name, arguments in COMMANDS.items():
+        print(f"{name:<14} {best_wall_time(arguments, args.runs) * 1000:7.1f}ms")
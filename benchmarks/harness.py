@@ -0,0 +1,120 @@
+"""Times the main pipeline steps on synthetic data and compares them against the baselines of this machine.
+
+Usage: poetry run python benchmarks/harness.py [--rows 100000 ...] [--save]
+
+Every benchmark reports the best of ``--repeat`` timeit measurements. Without ``--save`` the timings are compared
+against the baselines recorded on the same machine and environment, and the script exits with 1 when a step got
+slower than ``--threshold`` times its baseline. With ``--save`` the timings become the new baselines. Baselines are
+kept under benchmarks/baselines/, one file per machine, and are not committed: absolute timings do not compare
+between machines.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import timeit
+from collections.abc import Callable
+from datetime import date
+
+import pandas as pd
+from synthetic import write_events
+
+from sampler.parser import parse_events
+from sampler.privacy import anonymize_dataset
+from sampler.process import extend_mapping, filter_events, sample
+
+BASELINES_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+AFTER, UNTIL = date(2022, 1, 1), date(2024, 4, 1)
+
+
+def best_of(repeat: int, run: Callable[[], object]) -> float:
+    # fast steps are looped until a measurement takes at least 0.2s, like python -m timeit
+    timer = timeit.Timer(run)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def run_benchmarks(rows: int, repeat: int, directory: str) -> dict[str, float]:
+    filename = f"{directory}/events_{rows}.csv"
+    write_events(filename, rows)
+
+    df = parse_events(filename)
+    excluded_ids = df["professional_id"].cat.categories[:100].to_list()
+    result = sample(df, max(rows // 1000, 10), AFTER, UNTIL, seed=0)
+
+    selected = df[df["professional_id"].isin(df["professional_id"].cat.categories[::10])]
+    professionals = extend_mapping(selected["professional_id"].to_list(), {})
+    organizations = extend_mapping(selected["organization_id"].to_list(), {})
+
+    benchmarks: dict[str, Callable[[], object]] = {
+        "parse_events": lambda: parse_events(filename),
+        "filter_events": lambda: filter_events(df, AFTER, UNTIL, excluded_ids),
+        "sample": lambda: sample(df, max(rows // 1000, 10), AFTER, UNTIL, seed=0),
+        "anonymize_dataset": lambda: anonymize_dataset(selected, professionals, organizations),
+        "save_to": lambda: result.save_to(f"{directory}/out"),
+    }
+    return {name: best_of(repeat, run) for name, run in benchmarks.items()}
+
+
+def machine() -> dict[str, object]:
+    return {
+        "node": platform.node(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "cpus": os.cpu_count(),
+    }
+
+
+def baselines_filename(recorded_on: dict[str, object]) -> str:
+    # a new environment, e.g. another pandas version, starts without baselines instead of comparing against old ones
+    digest = hashlib.blake2b(json.dumps(recorded_on, sort_keys=True).encode(), digest_size=8).hexdigest()
+    return os.path.join(BASELINES_DIR, f"{digest}.json")
+
+
+def compare(timings: dict[str, dict[str, float]], baselines: dict[str, dict[str, float]], threshold: float) -> bool:
+    regressed = False
+    for rows, steps in timings.items():
+        for name, seconds in steps.items():
+            baseline = baselines.get(rows, {}).get(name)
+            if baseline is None:
+                print(f"{rows:>10} {name:<18} {seconds:8.3f}s  (no baseline)")
+                continue
+
+            ratio = seconds / baseline
+            marker = "  REGRESSION" if ratio > threshold else ""
+            print(f"{rows:>10} {name:<18} {seconds:8.3f}s  baseline {baseline:8.3f}s  x{ratio:.2f}{marker}")
+            regressed = regressed or ratio > threshold
+    return regressed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, action="append", help="Input sizes to run, repeatable (default 100000)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=1.5)
+    parser.add_argument("--save", action="store_true", help="Store the timings as the new baselines")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        timings = {str(rows): run_benchmarks(rows, args.repeat, directory) for rows in args.rows or [100_000]}
+
+    current = machine()
+    baselines = baselines_filename(current)
+    stored: dict = {"machine": current, "timings": {}}
+    if os.path.exists(baselines):
+        with open(baselines) as file:
+            stored = json.load(file)
+
+    if args.save:
+        stored = {"machine": current, "timings": {**stored["timings"], **timings}}
+        os.makedirs(BASELINES_DIR, exist_ok=True)
+        with open(baselines, "w") as file:
+            json.dump(stored, file, indent=4)
+        compare(timings, {}, args.threshold)
+    elif compare(timings, stored["timings"], args.threshold):
+        sys.exit(1)
@@ -0,0 +1,110 @@
+"""Synthetic event data shaped like the production exports.
+
+Usage: poetry run python benchmarks/synthetic.py --rows 100000000 <output>.csv
+
+Professionals have a heavy tailed number of events, belong to one of many organizations and have cohorts spread
+over nine years. Large files are generated and written in chunks, so any size fits in memory.
+"""
+
+import argparse
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+EVENT_TYPES = [
+    "feedback_sent",
+    "client_account_created",
+    "message_sent",
+    "intervention_added",
+    "videocall_started",
+]
+EVENTS_PER_PROFESSIONAL = 50
+PROFESSIONALS_PER_ORGANIZATION = 20
+
+
+def uuids(rng: np.random.Generator, count: int) -> np.ndarray:
+    raw = rng.integers(0, 256, size=(count, 16), dtype=np.uint8)
+    hexes = [row.tobytes().hex() for row in raw]
+    return np.array([f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}" for h in hexes], dtype=object)
+
+
+@dataclass
+class Population:
+    organization_ids: np.ndarray
+    professional_ids: np.ndarray
+    professional_organization: np.ndarray
+    professional_cohort: np.ndarray
+    # cumulative share of the events, for drawing the professional of every event
+    event_share: np.ndarray
+
+
+def generate_population(rows: int, rng: np.random.Generator) -> Population:
+    professionals = max(rows // EVENTS_PER_PROFESSIONAL, 1)
+    organizations = max(professionals // PROFESSIONALS_PER_ORGANIZATION, 1)
+
+    cohorts = pd.date_range("2015-01-01", "2024-01-01", freq="MS").strftime("%Y-%m-%d").to_numpy()
+    # heavy tailed number of events per professional
+    weights = rng.pareto(1.2, size=professionals) + 1
+
+    return Population(
+        organization_ids=uuids(rng, organizations),
+        professional_ids=uuids(rng, professionals),
+        professional_organization=rng.integers(0, organizations, size=professionals),
+        professional_cohort=cohorts[rng.integers(0, len(cohorts), size=professionals)],
+        event_share=np.cumsum(weights / weights.sum()),
+    )
+
+
+def generate_event_chunks(rows: int, seed: int = 0, chunksize: int = 1_000_000) -> Iterator[pd.DataFrame]:
+    rng = np.random.default_rng(seed)
+    population = generate_population(rows, rng)
+
+    start = pd.Timestamp("2021-01-01").value // 10**9
+    end = pd.Timestamp("2024-04-01").value // 10**9
+    event_types = np.array(EVENT_TYPES, dtype=object)
+
+    for offset in range(0, rows, chunksize):
+        size = min(chunksize, rows - offset)
+        professional = np.minimum(
+            np.searchsorted(population.event_share, rng.random(size), side="right"),
+            len(population.professional_ids) - 1,
+        )
+
+        yield pd.DataFrame(
+            {
+                "organization_id": population.organization_ids[population.professional_organization[professional]],
+                "professional_id": population.professional_ids[professional],
+                "professional_cohort": population.professional_cohort[professional],
+                "ts": pd.to_datetime(rng.integers(start, end, size=size), unit="s"),
+                "event_type": event_types[rng.integers(0, len(EVENT_TYPES), size=size)],
+            }
+        )
+
+
+def generate_events(rows: int, seed: int = 0) -> pd.DataFrame:
+    return pd.concat(generate_event_chunks(rows, seed), ignore_index=True)
+
+
+def write_events(filename: str, rows: int, seed: int = 0, chunksize: int = 1_000_000) -> None:
+    # the timestamps are written in the export format the parser expects
+    for chunk_number, chunk in enumerate(generate_event_chunks(rows, seed, chunksize)):
+        chunk.to_csv(
+            filename,
+            mode="w" if chunk_number == 0 else "a",
+            header=chunk_number == 0,
+            index=False,
+            date_format="%Y-%m-%dT%H:%M:%S",
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("output", help="Path of the CSV file to write")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunksize", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    write_events(args.output, args.rows, args.seed, args.chunksize)
@@ -0,0 +1,72 @@
+import os
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from typing import Optional
+
+import pandas as pd
+
+from sampler.config import Config, Mappings, read_config
+from sampler.event_store import build_event_store
+from sampler.process import Result, index_by_time, sample
+from sampler.profiling import Profiler
+
+
+@dataclass
+class Wave:
+    name: str
+    config: Config
+
+
+def read_waves(filenames: Iterable[str]) -> list[Wave]:
+    # a wave is named after its file, which names its output directory, so two waves cannot share a name
+    filenames = list(filenames)
+    names = [os.path.splitext(os.path.basename(filename))[0] for filename in filenames]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        err_msg = f"Several configuration files name the same wave: {', '.join(duplicates)}"
+        raise ValueError(err_msg)
+
+    return [Wave(name, read_config(filename)) for name, filename in zip(names, filenames)]
+
+
+def sample_waves(
+    df: pd.DataFrame,
+    waves: list[Wave],
+    excluded_ids: Optional[Iterable[str]] = None,
+    mappings: Optional[Mappings] = None,
+    include_all_in_output: bool = False,
+    id_key: Optional[bytes] = None,
+    seed: Optional[int] = None,
+    profiler: Optional[Profiler] = None,
+    engine: str = "pandas",
+    allocation: str = "ceil",
+    index_events: bool = False,
+) -> Iterator[tuple[Wave, Result]]:
+    # Runs the waves in order on one parsed input, yielding each wave's result before the next one is drawn so it can
+    # be saved and dropped first. The events are put on a time index once so that every wave's date window is a
+    # slice, and each wave starts from the mappings produced by the previous one. With index_events the time ordered
+    # events are also indexed by professional once, for every wave to take its output events from.
+    events = index_by_time(df)
+    event_store = build_event_store(events) if index_events else None
+    excluded_ids = list(excluded_ids) if excluded_ids else []
+
+    for wave in waves:
+        result = sample(
+            events,
+            wave.config.number_of_samples,
+            after=wave.config.start_period,
+            until=wave.config.end_period,
+            excluded_ids=excluded_ids,
+            mappings=mappings,
+            include_all_in_output=include_all_in_output,
+            id_key=id_key,
+            seed=seed,
+            profiler=profiler.scope(wave.name) if profiler is not None else None,
+            engine=engine,
+            allocation=allocation,
+            event_store=event_store,
+        )
+        mappings = result.id_mappings
+        yield wave, result
+        # only the mappings are carried over to the next wave
+        del result
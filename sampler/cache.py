@@ -0,0 +1,74 @@
+import glob
+import hashlib
+import os
+from collections.abc import Callable
+
+import pandas as pd
+
+from sampler.writers import atomic_path
+
+CACHE_SUFFIX = "arrow"
+# key of DataFrame.attrs holding the digest of the input a cached frame was loaded from, so the files kept next to
+# the cache, e.g. event_store.load_event_store, are named without hashing the input again
+DIGEST_ATTR = "input_digest"
+
+
+def file_digest(filename: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filename, "rb") as file:
+        while block := file.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_filename(filename: str, digest: str, version: int) -> str:
+    return f"{filename}.{digest}.v{version}.{CACHE_SUFFIX}"
+
+
+def stale_cache_filenames(filename: str, current: str) -> list[str]:
+    candidates = glob.glob(f"{glob.escape(filename)}.*.v*.{CACHE_SUFFIX}")
+    return [candidate for candidate in candidates if candidate != current]
+
+
+def _require_pyarrow() -> None:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        err_msg = "Caching parsed events requires pyarrow, install it with `poetry install --extras cache`"
+        raise ImportError(err_msg) from e
+
+
+def write_cache(df: pd.DataFrame, path: str) -> None:
+    from pyarrow import feather
+
+    # write next to the destination and rename, so a crash never leaves a truncated cache behind
+    with atomic_path(path) as tmp_path:
+        feather.write_feather(df, tmp_path, compression="uncompressed")
+
+
+def read_cache(path: str) -> pd.DataFrame:
+    from pyarrow import feather
+
+    # uncompressed Arrow IPC files are memory mapped instead of read into a buffer first
+    df: pd.DataFrame = feather.read_table(path, memory_map=True).to_pandas()
+    return df
+
+
+def load_cached(filename: str, version: int, load: Callable[[], pd.DataFrame], rebuild: bool = False) -> pd.DataFrame:
+    # The cache is keyed by the content of the input file and the parser version, so any change to either one
+    # produces a new cache file. Older cache files of the same input are removed when a new one is written.
+    _require_pyarrow()
+
+    digest = file_digest(filename)
+    path = cache_filename(filename, digest, version)
+    if not rebuild and os.path.exists(path):
+        df = read_cache(path)
+    else:
+        df = load()
+        write_cache(df, path)
+
+        for stale in stale_cache_filenames(filename, path):
+            os.remove(stale)
+
+    df.attrs[DIGEST_ATTR] = digest
+    return df
@@ -1,4 +1,7 @@
 import json
+import os
+import re
+from collections.abc import Iterable
 from dataclasses import dataclass
 from datetime import date
 
@@ -21,6 +24,22 @@ def read_config(filename: str) -> Config:
     )
 
 
+def _natural_key(filename: str) -> list:
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", filename)]
+
+
+def config_files(paths: Iterable[str]) -> list[str]:
+    # directories expand to the JSON files they contain, in wave order (wave_1.json, wave_2.json, ..., wave_10.json)
+    filenames: list[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            json_files = [filename for filename in os.listdir(path) if filename.endswith(".json")]
+            filenames.extend(os.path.join(path, filename) for filename in sorted(json_files, key=_natural_key))
+        else:
+            filenames.append(path)
+    return filenames
+
+
 @dataclass
 class Mappings:
     organizations: dict[str, str]
@@ -32,6 +51,21 @@ class Mappings:
             "professionals": self.professionals,
         }
 
+    def added_to(self, previous: "Mappings") -> "Mappings":
+        # the ids mapped here that previous did not map yet
+        return Mappings(
+            organizations={
+                original_id: anonymized_id
+                for original_id, anonymized_id in self.organizations.items()
+                if original_id not in previous.organizations
+            },
+            professionals={
+                original_id: anonymized_id
+                for original_id, anonymized_id in self.professionals.items()
+                if original_id not in previous.professionals
+            },
+        )
+
     @classmethod
     def load_from_file(cls, filename: str) -> "Mappings":
         with open(filename) as file:
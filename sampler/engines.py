@@ -0,0 +1,230 @@
+import importlib
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import date
+from typing import Any
+
+import pandas as pd
+
+from sampler.keys import BUCKET_KEYS, HISTORY_KEYS
+from sampler.metrics import event_type_history
+from sampler.process import (
+    calculate_bucket_size,
+    filter_events,
+    history_from_event_types,
+    history_length_per_professional,
+)
+
+# The engines run the row level stages of process.sample: the date window and exclusions, the history length per
+# professional, per professional and event type for the reports, and the bucket sizes. They take and return pandas
+# frames at the edges, so allocating, drawing and anonymizing stay the same whatever the engine. Keys come back
+# sorted like the pandas groupby sorts them, so every engine hands the same tables to the draw and samples the same
+# professionals for a seed.
+
+
+class Engine:
+    # the pandas reference implementation, the other engines must match its results
+
+    def filter_events(self, events: pd.DataFrame, after: date, until: date, excluded_ids: Iterable[str]) -> Any:
+        return filter_events(events, after, until, excluded_ids)
+
+    def count_events(self, filtered: Any) -> int:
+        return len(filtered)
+
+    def history_length_per_professional(self, filtered: Any) -> pd.DataFrame:
+        return history_length_per_professional(filtered)
+
+    def event_type_history(self, filtered: Any) -> pd.DataFrame:
+        return event_type_history(filtered)
+
+    def histories(self, filtered: Any) -> tuple[pd.DataFrame, pd.DataFrame]:
+        # both histories of process.sample, the events are grouped once and the lengths per professional summed from
+        # the much smaller table per event type
+        event_types = self.event_type_history(filtered)
+        return history_from_event_types(event_types), event_types
+
+    def calculate_bucket_size(self, history: pd.DataFrame) -> pd.DataFrame:
+        return calculate_bucket_size(history)
+
+    def select_events(self, filtered: Any, professional_ids: Iterable[str]) -> pd.DataFrame:
+        selected: pd.DataFrame = filtered[filtered["professional_id"].isin(list(professional_ids))]
+        return selected
+
+
+def _require(module: str, extra: str) -> None:
+    try:
+        importlib.import_module(module)
+    except ImportError as e:
+        err_msg = f"The {module} engine requires {module}, install it with `poetry install --extras {extra}`"
+        raise ImportError(err_msg) from e
+
+
+class ArrowEngine(Engine):
+    # pyarrow.compute kernels, the filters and the hash aggregations run multi-threaded
+
+    def __init__(self) -> None:
+        _require("pyarrow", "engines")
+
+    def filter_events(self, events: pd.DataFrame, after: date, until: date, excluded_ids: Iterable[str]) -> Any:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        table = pa.Table.from_pandas(events, preserve_index=False)
+        ts_type = table.schema.field("ts").type
+        mask = pc.and_(
+            pc.greater_equal(table["ts"], pa.scalar(pd.Timestamp(after), type=ts_type)),
+            pc.less_equal(table["ts"], pa.scalar(pd.Timestamp(until), type=ts_type)),
+        )
+
+        excluded_ids = list(excluded_ids)
+        if excluded_ids:
+            excluded = pc.is_in(table["professional_id"], value_set=pa.array(excluded_ids, type=pa.string()))
+            mask = pc.and_(mask, pc.invert(excluded))
+
+        return table.filter(mask)
+
+    def count_events(self, filtered: Any) -> int:
+        rows: int = filtered.num_rows
+        return rows
+
+    def history_length_per_professional(self, filtered: Any) -> pd.DataFrame:
+        history = filtered.group_by(HISTORY_KEYS).aggregate([("ts", "count")])
+        return _sorted_frame(history.rename_columns([*HISTORY_KEYS, "history_length"]), HISTORY_KEYS)
+
+    def event_type_history(self, filtered: Any) -> pd.DataFrame:
+        keys = [*HISTORY_KEYS, "event_type"]
+        history = filtered.group_by(keys).aggregate([("ts", "count")])
+        return _sorted_frame(history.rename_columns([*keys, "history_length"]), keys)
+
+    def histories(self, filtered: Any) -> tuple[pd.DataFrame, pd.DataFrame]:
+        # the multi-threaded aggregations are cheap enough to run on the events twice
+        return self.history_length_per_professional(filtered), self.event_type_history(filtered)
+
+    def calculate_bucket_size(self, history: pd.DataFrame) -> pd.DataFrame:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        table = pa.Table.from_pandas(history[[*BUCKET_KEYS, "history_length"]], preserve_index=False)
+        buckets = table.group_by(BUCKET_KEYS).aggregate(
+            [
+                ("history_length", "count"),
+                ("history_length", "mean"),
+                ("history_length", "stddev", pc.VarianceOptions(ddof=1)),
+            ]
+        )
+        columns = [*BUCKET_KEYS, "bucket_size", "avg_history_length", "std_history_length"]
+        return _sorted_frame(buckets.rename_columns(columns), BUCKET_KEYS)
+
+    def select_events(self, filtered: Any, professional_ids: Iterable[str]) -> pd.DataFrame:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        selected = pc.is_in(filtered["professional_id"], value_set=pa.array(list(professional_ids), type=pa.string()))
+        df: pd.DataFrame = filtered.filter(selected).to_pandas()
+        return df
+
+
+def _sorted_frame(table: Any, keys: list[str]) -> pd.DataFrame:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    # plain strings, sorted by code point like the categories of the parsed events
+    for key in keys:
+        position = table.schema.get_field_index(key)
+        table = table.set_column(position, key, pc.cast(table[key], pa.string()))
+
+    df: pd.DataFrame = table.sort_by([(key, "ascending") for key in keys]).to_pandas()
+    return df
+
+
+@dataclass
+class DuckDBWindow:
+    connection: Any
+    events: pd.DataFrame
+    after: date
+    until: date
+    excluded_ids: list[str]
+
+
+class DuckDBEngine(Engine):
+    # an in-process DuckDB database scanning the pandas frames in place, no server involved
+
+    def __init__(self) -> None:
+        _require("duckdb", "engines")
+
+    def filter_events(self, events: pd.DataFrame, after: date, until: date, excluded_ids: Iterable[str]) -> Any:
+        import duckdb
+
+        excluded_ids = list(excluded_ids)
+        connection = duckdb.connect()
+        connection.register("events", events)
+        connection.register("excluded_ids", pd.DataFrame({"professional_id": pd.Series(excluded_ids, dtype=object)}))
+        # the bounds are dates formatted here, never input from a user
+        connection.execute(
+            "CREATE TEMP VIEW filtered AS SELECT * FROM events "  # noqa: S608
+            f"WHERE ts >= TIMESTAMP '{after.isoformat()}' AND ts <= TIMESTAMP '{until.isoformat()}' "
+            "AND CAST(professional_id AS VARCHAR) NOT IN (SELECT professional_id FROM excluded_ids)"
+        )
+        return DuckDBWindow(connection, events, after, until, excluded_ids)
+
+    def count_events(self, filtered: Any) -> int:
+        rows: int = filtered.connection.execute("SELECT count(*) FROM filtered").fetchone()[0]
+        return rows
+
+    def history_length_per_professional(self, filtered: Any) -> pd.DataFrame:
+        history: pd.DataFrame = filtered.connection.execute(
+            "SELECT CAST(organization_id AS VARCHAR) AS organization_id, "
+            "CAST(professional_id AS VARCHAR) AS professional_id, "
+            "CAST(professional_cohort AS VARCHAR) AS professional_cohort, "
+            "count(*) AS history_length "
+            "FROM filtered GROUP BY 1, 2, 3 ORDER BY 1, 2, 3"
+        ).df()
+        return history
+
+    def event_type_history(self, filtered: Any) -> pd.DataFrame:
+        history: pd.DataFrame = filtered.connection.execute(
+            "SELECT CAST(organization_id AS VARCHAR) AS organization_id, "
+            "CAST(professional_id AS VARCHAR) AS professional_id, "
+            "CAST(professional_cohort AS VARCHAR) AS professional_cohort, "
+            "CAST(event_type AS VARCHAR) AS event_type, "
+            "count(*) AS history_length "
+            "FROM filtered GROUP BY 1, 2, 3, 4 ORDER BY 1, 2, 3, 4"
+        ).df()
+        return history
+
+    def histories(self, filtered: Any) -> tuple[pd.DataFrame, pd.DataFrame]:
+        # the queries aggregate in the database, only their results come back as frames
+        return self.history_length_per_professional(filtered), self.event_type_history(filtered)
+
+    def calculate_bucket_size(self, history: pd.DataFrame) -> pd.DataFrame:
+        import duckdb
+
+        connection = duckdb.connect()
+        connection.register("history", history[[*BUCKET_KEYS, "history_length"]])
+        buckets: pd.DataFrame = connection.execute(
+            "SELECT CAST(organization_id AS VARCHAR) AS organization_id, "
+            "CAST(professional_cohort AS VARCHAR) AS professional_cohort, "
+            "count(*) AS bucket_size, avg(history_length) AS avg_history_length, "
+            "stddev_samp(history_length) AS std_history_length "
+            "FROM history GROUP BY 1, 2 ORDER BY 1, 2"
+        ).df()
+        return buckets
+
+    def select_events(self, filtered: Any, professional_ids: Iterable[str]) -> pd.DataFrame:
+        # a query gives no guarantee on the row order, the output keeps the input order through the pandas frame
+        events = filter_events(filtered.events, filtered.after, filtered.until, filtered.excluded_ids)
+        return events[events["professional_id"].isin(list(professional_ids))]
+
+
+ENGINES: dict[str, type[Engine]] = {
+    "pandas": Engine,
+    "arrow": ArrowEngine,
+    "duckdb": DuckDBEngine,
+}
+
+
+def get_engine(name: str) -> Engine:
+    if name not in ENGINES:
+        err_msg = f"Unknown engine: {name}, expected one of {', '.join(ENGINES)}"
+        raise ValueError(err_msg)
+    return ENGINES[name]()
@@ -0,0 +1,109 @@
+import os
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from sampler.cache import CACHE_SUFFIX, DIGEST_ATTR, file_digest
+from sampler.parser import PARSER_VERSION
+from sampler.writers import atomic_path
+
+# A per professional index of a parsed events frame in CSR layout: rows[offsets[i]:offsets[i + 1]] are the row
+# positions of the events of professional_ids[i], in input order. Taking the events of some professionals is then a
+# gather of their row ranges, proportional to the events taken instead of to the events scanned, and the number of
+# events per professional is the difference of consecutive offsets. The index refers to row positions, so it belongs
+# to one frame in one row order, e.g. a parse of a file, and is saved next to the cached parse of that file.
+
+
+@dataclass
+class EventStore:
+    professional_ids: pd.Index
+    offsets: np.ndarray
+    rows: np.ndarray
+
+    def history_lengths(self) -> pd.Series:
+        # events per professional over the whole frame, before any date window
+        return pd.Series(np.diff(self.offsets), index=self.professional_ids, name="history_length")
+
+    def take(self, events: pd.DataFrame, professional_ids: Iterable[str]) -> pd.DataFrame:
+        # the events of the professionals in input order, the same rows as events["professional_id"].isin(...)
+        if self.offsets[-1] != len(events):
+            err_msg = f"The event store indexes {self.offsets[-1]} events, got {len(events)}"
+            raise ValueError(err_msg)
+
+        found = self.professional_ids.get_indexer(pd.Index(list(professional_ids)).unique())
+        found = found[found >= 0]
+        starts = self.offsets[found]
+        lengths = self.offsets[found + 1] - starts
+
+        # every range as one flat array of indices into rows, without a loop over the professionals
+        range_starts = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        positions = np.sort(self.rows[range_starts + np.arange(lengths.sum())])
+        return events.iloc[positions]
+
+
+def build_event_store(events: pd.DataFrame) -> EventStore:
+    professionals = events["professional_id"]
+    if isinstance(professionals.dtype, pd.CategoricalDtype):
+        codes = professionals.cat.codes.to_numpy()
+        professional_ids = pd.Index(professionals.cat.categories)
+    else:
+        codes, professional_ids = pd.factorize(professionals, sort=True)
+
+    counts = np.bincount(codes, minlength=len(professional_ids))
+    return EventStore(
+        professional_ids=pd.Index(professional_ids),
+        offsets=np.concatenate([[0], np.cumsum(counts)]),
+        rows=np.argsort(codes, kind="stable"),
+    )
+
+
+def event_store_filename(filename: str, digest: str, version: int) -> str:
+    # named like the cached parse of the same input, so it is removed with it when the input or the parser changes
+    return f"{filename}.{digest}.v{version}.events.{CACHE_SUFFIX}"
+
+
+def write_event_store(store: EventStore, path: str) -> None:
+    import pyarrow as pa
+    from pyarrow import feather
+
+    # an Arrow list column is a CSR layout itself, its offsets and values are the store's offsets and rows
+    table = pa.table(
+        {
+            "professional_id": pa.array(store.professional_ids.to_numpy(dtype=object), type=pa.string()),
+            "rows": pa.ListArray.from_arrays(pa.array(store.offsets, type=pa.int64()), pa.array(store.rows)),
+        }
+    )
+    with atomic_path(path) as tmp_path:
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+
+
+def read_event_store(path: str) -> EventStore:
+    from pyarrow import feather
+
+    table = feather.read_table(path, memory_map=True)
+    rows = table["rows"].combine_chunks()
+    return EventStore(
+        professional_ids=pd.Index(table["professional_id"].to_numpy(zero_copy_only=False)),
+        offsets=rows.offsets.to_numpy(),
+        rows=rows.values.to_numpy(),
+    )
+
+
+def load_event_store(filename: str, events: pd.DataFrame, cache: bool = False, rebuild: bool = False) -> EventStore:
+    # events must be the parse of filename, as parser.parse_events returns it. A cached parse carries the digest of
+    # the input, only other frames need it hashed again.
+    if not cache:
+        return build_event_store(events)
+
+    digest = events.attrs.get(DIGEST_ATTR) or file_digest(filename)
+    path = event_store_filename(filename, digest, PARSER_VERSION)
+    if not rebuild and os.path.exists(path):
+        store = read_event_store(path)
+        if store.offsets[-1] == len(events):
+            return store
+
+    store = build_event_store(events)
+    write_event_store(store, path)
+    return store
@@ -0,0 +1,172 @@
+import json
+from datetime import date
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from sampler.config import Mappings
+from sampler.keys import BUCKET_KEYS, HISTORY_KEYS
+from sampler.privacy import anonymize_dataset
+from sampler.process import (
+    STATE_DIR,
+    Result,
+    assign_sample_count,
+    calculate_bucket_size,
+    exclude_professionals,
+    extend_mapping,
+    filter_events,
+    history_length_per_professional,
+    professionals_for_output,
+    sample_professionals,
+)
+from sampler.streaming import merge_histories
+
+
+def read_state(output_dir: str) -> tuple[pd.DataFrame, pd.DataFrame]:
+    population_history = pd.read_csv(
+        f"{output_dir}/{STATE_DIR}/population_history.csv", dtype=dict.fromkeys(HISTORY_KEYS, str), na_filter=False
+    )
+    # the spread of a single professional bucket is undefined and written as an empty field
+    buckets = pd.read_csv(
+        f"{output_dir}/{STATE_DIR}/buckets.csv",
+        dtype=dict.fromkeys(BUCKET_KEYS, str),
+        keep_default_na=False,
+        na_values={"std_history_length": [""]},
+    )
+    return population_history, buckets
+
+
+def update_buckets(buckets: pd.DataFrame, history: pd.DataFrame, changed: pd.DataFrame) -> pd.DataFrame:
+    # only the buckets of the changed professionals are recomputed, from their rows of the merged history
+    affected = changed[BUCKET_KEYS].drop_duplicates()
+    if affected.empty:
+        return buckets
+
+    marked = buckets.merge(affected, on=BUCKET_KEYS, how="left", indicator=True)
+    unchanged = marked[marked["_merge"] == "left_only"].drop(columns="_merge")
+    recomputed = calculate_bucket_size(history.merge(affected, on=BUCKET_KEYS))
+
+    return pd.concat([unchanged, recomputed], ignore_index=True).sort_values(BUCKET_KEYS, ignore_index=True)
+
+
+def draw_top_up(
+    buckets: pd.DataFrame,
+    history: pd.DataFrame,
+    previous_history: pd.DataFrame,
+    changed: pd.DataFrame,
+    sampled_professionals: list[str],
+    configuration: dict,
+) -> list[str]:
+    # The affected buckets get the sample size of the rate the earlier runs sampled at, spread with the run's
+    # allocation, and each bucket is topped up to its new share. Only professionals the earlier runs never saw can
+    # be drawn: all of their events are in the delta, while the earlier events of the others were never kept.
+    affected = changed[BUCKET_KEYS].drop_duplicates()
+    if affected.empty or previous_history.empty:
+        return []
+
+    rate = len(sampled_professionals) / len(previous_history)
+    affected_history = history.merge(affected, on=BUCKET_KEYS)
+    sample_size = round(rate * len(affected_history))
+    if sample_size == 0:
+        return []
+
+    quotas = assign_sample_count(
+        buckets.merge(affected, on=BUCKET_KEYS), sample_size, configuration.get("allocation", "ceil")
+    )
+    already_sampled = affected_history[affected_history["professional_id"].isin(sampled_professionals)]
+    new = affected_history[~affected_history["professional_id"].isin(previous_history["professional_id"])]
+    counts = quotas.merge(
+        already_sampled.groupby(BUCKET_KEYS).size().rename("sampled").reset_index(), on=BUCKET_KEYS, how="left"
+    ).merge(new.groupby(BUCKET_KEYS).size().rename("available").reset_index(), on=BUCKET_KEYS)
+
+    missing = (counts["expected_samples"] - counts["sampled"].fillna(0)).clip(lower=0)
+    top_up = counts[BUCKET_KEYS].assign(expected_samples=np.minimum(missing, counts["available"]).astype(int))
+    return sample_professionals(new, top_up, configuration["seed"])
+
+
+def sample_delta(
+    delta: pd.DataFrame,
+    output_dir: str,
+    until: Optional[date] = None,
+    mappings: Optional[Mappings] = None,
+    id_key: Optional[bytes] = None,
+) -> Result:
+    # Updates the run saved in output_dir with the events of a delta file instead of sampling the full export again.
+    # The delta must only hold events the previous input did not have. It is merged into the stored history and only
+    # the buckets with new events are recomputed. The sampled professionals are kept and those buckets are topped up
+    # with professionals that first appear in the delta, see draw_top_up. The samples are just the new events of the
+    # output professionals, for Result.save_to(output_dir, append=True) to add to the existing dataset.
+    with open(f"{output_dir}/arguments_to_sampler_function.json") as file:
+        configuration = json.load(file)
+
+    after = date.fromisoformat(configuration["after"])
+    previous_until = date.fromisoformat(configuration["until"])
+    if until is None:
+        until = previous_until
+
+    if until < previous_until:
+        err_msg = f"The delta cannot end before the previous run, got {until} before {previous_until}"
+        raise ValueError(err_msg)
+
+    if configuration["deterministic_ids"] != (id_key is not None):
+        err_msg = "The delta must derive anonymized ids from a key exactly when the previous run did"
+        raise ValueError(err_msg)
+
+    if mappings is None:
+        mappings = Mappings.load_from_file(f"{output_dir}/id_mappings.json")
+
+    input_mappings = Mappings(**configuration["input_mappings"])
+    excluded_ids = configuration["excluded_ids"]
+
+    sampled_professionals = pd.read_csv(
+        f"{output_dir}/sampled_professionals.csv", dtype=str, na_filter=False
+    )["professional_id"].to_list()
+
+    previous_history, previous_buckets = read_state(output_dir)
+    filtered = filter_events(delta, after, until, excluded_ids)
+    # plain strings like the stored history, whatever categories the delta was parsed with
+    delta_history = history_length_per_professional(filtered).astype(dict.fromkeys(HISTORY_KEYS, object))
+    population_history = merge_histories([previous_history, delta_history])
+
+    history = exclude_professionals(population_history, input_mappings.professionals.keys())
+    changed = exclude_professionals(delta_history, input_mappings.professionals.keys())
+    buckets = update_buckets(previous_buckets, history, changed)
+
+    drawn = draw_top_up(
+        buckets,
+        history,
+        exclude_professionals(previous_history, input_mappings.professionals.keys()),
+        changed,
+        sampled_professionals,
+        configuration,
+    )
+    sampled_professionals = [*sampled_professionals, *drawn]
+    professionals_in_output = professionals_for_output(
+        sampled_professionals, excluded_ids, input_mappings, configuration["include_all_in_output"]
+    )
+
+    professionals_mappings = extend_mapping(drawn, mappings.professionals, id_key)
+    selected_entries = filtered[filtered["professional_id"].isin(professionals_in_output)]
+    organizations_mappings = extend_mapping(
+        selected_entries["organization_id"].to_list(), mappings.organizations, id_key
+    )
+    anonymized_selected_entries = anonymize_dataset(selected_entries, professionals_mappings, organizations_mappings)
+
+    deltas = [
+        *configuration.get("deltas", []),
+        {"until": until.isoformat(), "events": len(filtered), "sampled": len(drawn)},
+    ]
+
+    return Result(
+        sampled_professionals=sampled_professionals,
+        samples=anonymized_selected_entries,
+        id_mappings=Mappings(
+            organizations=organizations_mappings,
+            professionals=professionals_mappings,
+        ),
+        configuration={**configuration, "until": until.isoformat(), "deltas": deltas},
+        population_history=population_history,
+        sample_history=population_history[population_history["professional_id"].isin(professionals_in_output)],
+        buckets=buckets,
+    )
@@ -0,0 +1,3 @@
+# the columns the histories and the buckets are grouped by, kept apart from process and metrics so both can import them
+HISTORY_KEYS = ["organization_id", "professional_id", "professional_cohort"]
+BUCKET_KEYS = ["organization_id", "professional_cohort"]
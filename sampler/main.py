@@ -1,37 +1,271 @@
 import argparse
-import os
-from datetime import date
+import sys
+from typing import TYPE_CHECKING, Optional
 
-from sampler.config import Mappings, read_config
-from sampler.metrics import (
-    compare_average_history_length,
-    compare_percentiles_history_length,
-)
-from sampler.parser import parse_events
-from sampler.process import sample
+from sampler.writers import OUTPUT_FORMATS
 
-if __name__ == "__main__":  # pragma: no cover
-    parser = argparse.ArgumentParser()
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from sampler.batch import Wave
+    from sampler.config import Config
+    from sampler.event_store import EventStore
+    from sampler.mapping_store import MappingStore
+    from sampler.process import Result
+    from sampler.profiling import Profiler
+
+# Only the standard library and light modules are imported up front. pandas and numpy are imported by the commands
+# that need them, so --help, check_config and mappings start without paying for them.
+
+COMMANDS = ("sample", "check_config", "mappings")
+
+
+def report_metrics(result: "Result", profiler: "Profiler") -> None:
+    from sampler.keys import BUCKET_KEYS
+    from sampler.metrics import (
+        compare_average_history_length,
+        compare_history_length_per_key,
+        compare_percentiles_history_length,
+        length_histogram,
+    )
+
+    with profiler.stage("metrics", rows_in=len(result.population_history)):
+        compare_average_history_length(result.population_history, result.sample_history)
+        compare_percentiles_history_length(result.population_history, result.sample_history)
+        compare_history_length_per_key(
+            length_histogram(result.population_history, BUCKET_KEYS),
+            length_histogram(result.sample_history, BUCKET_KEYS),
+        )
+        if result.population_event_types is not None and result.sample_event_types is not None:
+            compare_history_length_per_key(result.population_event_types, result.sample_event_types)
+
+
+def report_pipeline(profiler: "Profiler") -> None:
+    # a step whose input queue is mostly full holds the pipeline back
+    for stage in profiler.stages:
+        for step in stage.pipeline or []:
+            print(
+                f"{stage.name}/{step['name']}: {step['chunks']} chunks, busy {step['busy_seconds']:.1f}s, "
+                f"waited {step['input_wait_seconds']:.1f}s for input and {step['output_wait_seconds']:.1f}s on "
+                f"output, {step['mean_queue_occupancy']:.1f} chunks queued on average"
+            )
+
+
+def save_result(
+    result: "Result",
+    output_dir: str,
+    mapping_store: "Optional[MappingStore]",
+    output_format: str,
+    profiler: "Profiler",
+    append: bool = False,
+) -> None:
+    rows = len(result.samples) if result.samples is not None else None
+    with profiler.stage("save", rows_in=rows):
+        result.save_to(output_dir, mapping_store, output_format, append=append)
+
+
+def add_sample_arguments(parser: argparse.ArgumentParser) -> None:
     parser.add_argument("input", help="Path to the dataset CSV file")
-    parser.add_argument("--config", help="The extractor configuration file", required=True)
+    parser.add_argument(
+        "--config",
+        help=(
+            "The extractor configuration file. Repeat it or pass a directory of configuration files "
+            "to run several waves in order on a single parse of the input"
+        ),
+        action="append",
+    )
     parser.add_argument("--id_mappings", help="Path to the id_mappings JSON file")
+    parser.add_argument(
+        "--id_mapping_store",
+        help="Path to a SQLite id mapping store, used instead of --id_mappings and updated with the new mappings",
+    )
     parser.add_argument(
         "--include_all_in_output",
         action=argparse.BooleanOptionalAction,
         default=False,
         help="Include all professionals in the output (sampled and excluded)",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        help="Read the input in chunks of this many rows instead of loading it in memory at once",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help=(
+            "With --chunksize, read, validate, aggregate and write the chunks in overlapping threads with bounded "
+            "queues between them, and report how busy each step was"
+        ),
+    )
+    parser.add_argument(
+        "--cache",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Keep a validated Arrow copy of the input next to it and load from it on later runs",
+    )
+    parser.add_argument(
+        "--rebuild_cache",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Rebuild the cached copy of the input even if it is up to date",
+    )
+    parser.add_argument(
+        "--index_events",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help=(
+            "Index the events by professional to take the output events without scanning all of them again, "
+            "with --cache the index is kept next to the cached copy"
+        ),
+    )
+    parser.add_argument(
+        "--id_key_file",
+        help="Path to a file with a secret key, anonymized ids are then derived from it instead of drawn at random",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Split the events by organization over this many worker processes",
+    )
+    parser.add_argument(
+        "--parse_workers",
+        type=int,
+        default=1,
+        help="Parse and validate the input in this many worker processes",
+    )
+    parser.add_argument(
+        "--output_format",
+        choices=OUTPUT_FORMATS,
+        default="csv",
+        help="File format of sampled_anonymized_dataset",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="Seed for the random draws, recorded in arguments_to_sampler_function.json to reproduce a run",
+    )
+    parser.add_argument(
+        "--cprofile",
+        help="Write cProfile statistics of the run to this file, e.g. for snakeviz or python -m pstats",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["pandas", "arrow", "duckdb"],
+        default="pandas",
+        help="Engine for filtering and aggregating the events, arrow and duckdb need the engines extra",
+    )
+    parser.add_argument(
+        "--allocation",
+        choices=["ceil", "largest_remainder", "neyman"],
+        default="ceil",
+        help=(
+            "How the sample is spread over the buckets: ceil rounds every share up, largest_remainder rounds to the "
+            "nearest shares, neyman also weighs the buckets by the spread of their history lengths"
+        ),
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help=(
+            "Only print the bucket allocation with the estimated output events, size, memory and time, "
+            "without sampling or writing anything"
+        ),
+    )
+    parser.add_argument(
+        "--delta",
+        help=(
+            "Output directory of an earlier run to update with the input, a file of events that run did not have, "
+            "instead of sampling again"
+        ),
+    )
 
-    config = read_config(args.config)
 
-    sampler_args = {
-        "after": config.start_period,
-        "until": config.end_period,
+def profiled_parse(args: argparse.Namespace, profiler: "Profiler") -> "pd.DataFrame":
+    from sampler.parser import parse_events
+
+    with profiler.stage("parse") as stage:
+        df = parse_events(
+            args.input,
+            cache=args.cache or args.rebuild_cache,
+            rebuild_cache=args.rebuild_cache,
+            workers=args.parse_workers,
+        )
+        stage.rows_out = len(df)
+    return df
+
+
+def profiled_event_store(args: argparse.Namespace, events: "pd.DataFrame", profiler: "Profiler") -> "EventStore":
+    from sampler.event_store import load_event_store
+
+    with profiler.stage("index_events", rows_in=len(events)) as stage:
+        store = load_event_store(args.input, events, cache=args.cache or args.rebuild_cache, rebuild=args.rebuild_cache)
+        stage.rows_out = len(store.professional_ids)
+    return store
+
+
+def check_sample_flags(args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+    from sampler.writers import CSV_COMPRESSION
+
+    if args.chunksize and args.output_format not in CSV_COMPRESSION:
+        parser.error("--chunksize can only write CSV output")
+    if args.delta and args.output_format not in CSV_COMPRESSION:
+        parser.error("--delta can only append to CSV output")
+    if args.delta and args.allocation != "ceil":
+        parser.error("--allocation cannot be used with --delta, the sampled professionals of the run are kept")
+    if args.engine != "pandas" and (args.chunksize or args.workers > 1 or args.delta):
+        parser.error("--engine can only be used without --chunksize, --workers or --delta")
+    if args.pipeline and not args.chunksize:
+        parser.error("--pipeline can only be used with --chunksize")
+    if args.index_events and (args.chunksize or args.workers > 1 or args.delta):
+        parser.error("--index_events can only be used without --chunksize, --workers or --delta")
+    if args.id_mapping_store and args.id_mappings:
+        parser.error("--id_mappings cannot be used with --id_mapping_store, import the JSON file into the store first")
+
+
+def read_sample_waves(args: argparse.Namespace, parser: argparse.ArgumentParser) -> "list[Wave]":
+    from sampler.batch import read_waves
+    from sampler.config import config_files
+
+    if not args.config and not args.delta:
+        parser.error("--config is required")
+
+    check_sample_flags(args, parser)
+    try:
+        waves = read_waves(config_files(args.config or []))
+    except ValueError as e:
+        parser.error(str(e))
+    if args.delta and (len(waves) > 1 or args.chunksize or args.workers > 1):
+        parser.error("--delta can only be used with a single configuration file and without --chunksize or --workers")
+    if len(waves) > 1 and args.chunksize:
+        parser.error("--chunksize can only be used with a single configuration file")
+    if args.plan and (len(waves) > 1 or args.delta):
+        parser.error("--plan can only be used with a single configuration file and without --delta")
+    if args.workers > 1 and (len(waves) > 1 or args.chunksize):
+        parser.error("--workers can only be used with a single configuration file and without --chunksize")
+
+    return waves
+
+
+def sampler_arguments(args: argparse.Namespace, mapping_store: "Optional[MappingStore]") -> dict:
+    from sampler.config import Mappings
+
+    sampler_args: dict = {
         "include_all_in_output": args.include_all_in_output,
+        "seed": args.seed,
+        "allocation": args.allocation,
     }
 
-    if args.id_mappings:
+    if args.id_key_file:
+        with open(args.id_key_file, "rb") as key_file:
+            sampler_args = {**sampler_args, "id_key": key_file.read()}
+
+    if mapping_store is not None:
+        # the mappings themselves are looked up for the ids of the input once it is read, see with_stored_mappings
+        sampler_args = {**sampler_args, "excluded_ids": mapping_store.original_ids("professionals")}
+    elif args.id_mappings:
         id_mappings = Mappings.load_from_file(args.id_mappings)
         sampler_args = {
             **sampler_args,
@@ -39,14 +273,262 @@ if __name__ == "__main__":  # pragma: no cover
             "excluded_ids": id_mappings.professionals.keys(),
         }
 
-    df = parse_events(args.input)
-    result = sample(df, config.number_of_samples, **sampler_args)
+    return sampler_args
+
+
+def with_stored_mappings(sampler_args: dict, mapping_store: "Optional[MappingStore]", events: "pd.DataFrame") -> dict:
+    # only the ids in the input can make it to the output, the ids of earlier inputs are never loaded
+    if mapping_store is None:
+        return sampler_args
+
+    mappings = mapping_store.mappings_for(events["organization_id"].unique(), events["professional_id"].unique())
+    return {**sampler_args, "mappings": mappings}
+
+
+def run_plan(
+    args: argparse.Namespace, config: "Config", sampler_args: dict, mapping_store: "Optional[MappingStore]"
+) -> int:
+    import time
 
-    compare_average_history_length(df, result.samples)
-    compare_percentiles_history_length(df, result.samples)
+    from sampler.parser import parse_events
+    from sampler.planning import plan, plan_streaming, print_plan
+
+    plan_args = {
+        "after": config.start_period,
+        "until": config.end_period,
+        "excluded_ids": sampler_args.get("excluded_ids"),
+        "include_all_in_output": args.include_all_in_output,
+        "allocation": args.allocation,
+    }
+
+    start = time.perf_counter()
+    if args.chunksize:
+        result = plan_streaming(
+            args.input,
+            config.number_of_samples,
+            chunksize=args.chunksize,
+            mappings=sampler_args.get("mappings"),
+            mapping_store=mapping_store,
+            **plan_args,
+        )
+    else:
+        events = parse_events(
+            args.input,
+            cache=args.cache or args.rebuild_cache,
+            rebuild_cache=args.rebuild_cache,
+            workers=args.parse_workers,
+        )
+        mappings = with_stored_mappings(sampler_args, mapping_store, events).get("mappings")
+        result = plan(events, config.number_of_samples, mappings=mappings, **plan_args)
+
+    print_plan(result)
+    # a full run repeats everything the plan did before sampling and writing the output
+    print(f"Reading and aggregating the input took {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+def run_sample(args: argparse.Namespace, parser: argparse.ArgumentParser) -> int:
+    import cProfile
+    import os
+    from datetime import date
+    from functools import partial
+
+    from sampler.batch import sample_waves
+    from sampler.incremental import sample_delta
+    from sampler.mapping_store import MappingStore
+    from sampler.parallel import sample_parallel
+    from sampler.pipeline import QUEUE_SIZE
+    from sampler.process import sample
+    from sampler.profiling import Profiler
+    from sampler.streaming import sample_streaming
+    from sampler.writers import CSV_COMPRESSION, write_json
+
+    waves = read_sample_waves(args, parser)
+
+    mapping_store = MappingStore(args.id_mapping_store) if args.id_mapping_store else None
+    sampler_args = sampler_arguments(args, mapping_store)
+
+    if args.plan:
+        return run_plan(args, waves[0].config, sampler_args, mapping_store)
 
     output_dir = f"out/{date.today()}"
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    result.save_to(output_dir)
+    profiler = Profiler()
+
+    load_events = partial(profiled_parse, args, profiler)
+
+    profile = cProfile.Profile() if args.cprofile else None
+    if profile is not None:
+        profile.enable()
+
+    if args.delta:
+        output_dir = args.delta
+        events = load_events()
+        with profiler.stage("sample", rows_in=len(events)):
+            result = sample_delta(
+                events,
+                args.delta,
+                until=waves[0].config.end_period if waves else None,
+                mappings=with_stored_mappings({}, mapping_store, events).get("mappings"),
+                id_key=sampler_args.get("id_key"),
+            )
+
+        report_metrics(result, profiler)
+        save_result(result, args.delta, mapping_store, args.output_format, profiler, append=True)
+    elif len(waves) > 1:
+        events = load_events()
+        for wave, result in sample_waves(
+            events,
+            waves,
+            profiler=profiler,
+            engine=args.engine,
+            index_events=args.index_events,
+            **with_stored_mappings(sampler_args, mapping_store, events),
+        ):
+            print(f"Wave: {wave.name}")
+            report_metrics(result, profiler.scope(wave.name))
+            save_result(
+                result, f"{output_dir}/{wave.name}", mapping_store, args.output_format, profiler.scope(wave.name)
+            )
+            # the saved wave is dropped before the next one is drawn
+            del result
+    else:
+        config = waves[0].config
+        sampler_args = {**sampler_args, "after": config.start_period, "until": config.end_period}
+
+        if args.chunksize:
+            result = sample_streaming(
+                args.input,
+                config.number_of_samples,
+                f"{output_dir}/sampled_anonymized_dataset.{args.output_format}",
+                chunksize=args.chunksize,
+                compression=CSV_COMPRESSION[args.output_format],
+                profiler=profiler,
+                pipeline_queue_size=QUEUE_SIZE if args.pipeline else None,
+                mapping_store=mapping_store,
+                **sampler_args,
+            )
+            report_pipeline(profiler)
+        elif args.workers > 1:
+            events = load_events()
+            with profiler.stage("sample", rows_in=len(events)):
+                result = sample_parallel(
+                    events,
+                    config.number_of_samples,
+                    args.workers,
+                    **with_stored_mappings(sampler_args, mapping_store, events),
+                )
+        else:
+            events = load_events()
+            sampler_args = with_stored_mappings(sampler_args, mapping_store, events)
+            result = sample(
+                events,
+                config.number_of_samples,
+                profiler=profiler,
+                engine=args.engine,
+                event_store=profiled_event_store(args, events, profiler) if args.index_events else None,
+                **sampler_args,
+            )
+
+        report_metrics(result, profiler)
+        save_result(result, output_dir, mapping_store, args.output_format, profiler)
+
+    if profile is not None:
+        profile.disable()
+        profile.dump_stats(args.cprofile)
+
+    write_json(profiler.to_dict(), f"{output_dir}/run_profile.json")
+    return 0
+
+
+def run_check_config(args: argparse.Namespace) -> int:
+    from sampler.config import config_files, read_config
+
+    invalid = 0
+    for filename in config_files(args.config):
+        try:
+            config = read_config(filename)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"{filename}: invalid: {e!r}")
+            invalid += 1
+            continue
+
+        problems = []
+        if config.number_of_samples <= 0:
+            problems.append("number_of_samples must be positive")
+        if config.end_period < config.start_period:
+            problems.append("end_period is before start_period")
+
+        if problems:
+            print(f"{filename}: invalid: {', '.join(problems)}")
+            invalid += 1
+        else:
+            print(f"{filename}: {config.number_of_samples} samples from {config.start_period} to {config.end_period}")
+
+    return 1 if invalid else 0
+
+
+def run_mappings(args: argparse.Namespace) -> int:
+    import sqlite3
+
+    from sampler.config import Mappings
+    from sampler.mapping_store import KINDS, MappingStore
+
+    if args.mappings.endswith(".json"):
+        mappings = Mappings.load_from_file(args.mappings)
+        print(f"organizations: {len(mappings.organizations)}")
+        print(f"professionals: {len(mappings.professionals)}")
+        return 0
+
+    try:
+        store = MappingStore(args.mappings, read_only=True)
+    except sqlite3.OperationalError as e:
+        print(f"{args.mappings}: {e}", file=sys.stderr)
+        return 1
+
+    with store:
+        for kind in KINDS:
+            counts = store.wave_counts(kind)
+            print(f"{kind}: {sum(counts.values())}")
+            for wave, count in counts.items():
+                print(f"  {wave}: {count}")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Sample and anonymize event exports. Without a command the arguments are those of sample."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add_sample_arguments(commands.add_parser("sample", help="Sample and anonymize an export (the default)"))
+
+    check_config = commands.add_parser("check_config", help="Validate configuration files without reading any data")
+    check_config.add_argument("config", nargs="+", help="Configuration files or directories of them")
+
+    mappings = commands.add_parser("mappings", help="Count the ids in an id_mappings JSON file or id mapping store")
+    mappings.add_argument("mappings", help="Path to an id_mappings JSON file or a SQLite id mapping store")
+
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    # the sampler used to be a single command, its arguments still work without naming it
+    if argv and argv[0] not in COMMANDS and argv[0] not in ("-h", "--help"):
+        argv = ["sample", *argv]
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.command == "check_config":
+        return run_check_config(args)
+    if args.command == "mappings":
+        return run_mappings(args)
+    return run_sample(args, parser)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
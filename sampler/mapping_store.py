@@ -0,0 +1,129 @@
+import pathlib
+import sqlite3
+from collections.abc import Iterable
+from typing import Optional
+
+from sampler.config import Mappings
+
+KINDS = ("organizations", "professionals")
+
+
+class MappingStore:
+    # Append only store of id mappings in a SQLite file. Each wave only inserts the ids it added, lookups go through
+    # the primary key index and the set of original ids can be read without loading the anonymized ids.
+
+    def __init__(self, filename: str, read_only: bool = False):
+        if read_only:
+            # a missing file is an error instead of a new empty store
+            self.connection = sqlite3.connect(f"{pathlib.Path(filename).absolute().as_uri()}?mode=ro", uri=True)
+            return
+
+        self.connection = sqlite3.connect(filename)
+        with self.connection:
+            for kind in KINDS:
+                self.connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {kind} ("
+                    "original_id TEXT PRIMARY KEY, anonymized_id TEXT NOT NULL UNIQUE, wave TEXT NOT NULL"
+                    ") WITHOUT ROWID"
+                )
+
+    def __enter__(self) -> "MappingStore":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def lookup(self, kind: str, original_id: str) -> Optional[str]:
+        row = self.connection.execute(
+            f"SELECT anonymized_id FROM {_table(kind)} WHERE original_id = ?",  # noqa: S608
+            (original_id,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def lookup_many(self, kind: str, original_ids: Iterable[str]) -> dict[str, str]:
+        # the stored mappings of the given ids only, joined on the primary key index
+        with self.connection:
+            self.connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS wanted (original_id TEXT PRIMARY KEY) WITHOUT ROWID"
+            )
+            self.connection.execute("DELETE FROM wanted")
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO wanted VALUES (?)", ((original_id,) for original_id in original_ids)
+            )
+            rows = self.connection.execute(
+                f"SELECT original_id, anonymized_id FROM wanted JOIN {_table(kind)} USING (original_id)"  # noqa: S608
+            )
+            return dict(rows.fetchall())
+
+    def mappings_for(self, organization_ids: Iterable[str], professional_ids: Iterable[str]) -> Mappings:
+        return Mappings(
+            organizations=self.lookup_many("organizations", organization_ids),
+            professionals=self.lookup_many("professionals", professional_ids),
+        )
+
+    def original_ids(self, kind: str) -> list[str]:
+        rows = self.connection.execute(f"SELECT original_id FROM {_table(kind)}")  # noqa: S608
+        return [row[0] for row in rows]
+
+    def mapping(self, kind: str) -> dict[str, str]:
+        rows = self.connection.execute(f"SELECT original_id, anonymized_id FROM {_table(kind)}")  # noqa: S608
+        return dict(rows.fetchall())
+
+    def wave_counts(self, kind: str) -> dict[str, int]:
+        rows = self.connection.execute(
+            f"SELECT wave, COUNT(*) FROM {_table(kind)} GROUP BY wave ORDER BY wave"  # noqa: S608
+        )
+        return dict(rows.fetchall())
+
+    def to_mappings(self) -> Mappings:
+        return Mappings(
+            organizations=self.mapping("organizations"),
+            professionals=self.mapping("professionals"),
+        )
+
+    def append(self, mappings: Mappings, wave: str) -> None:
+        # ids that are already stored keep their anonymized id, changing one is an error
+        with self.connection:
+            self._append(self.connection, "organizations", mappings.organizations.items(), wave)
+            self._append(self.connection, "professionals", mappings.professionals.items(), wave)
+
+    @staticmethod
+    def _append(connection: sqlite3.Connection, kind: str, items: Iterable[tuple[str, str]], wave: str) -> None:
+        table = _table(kind)
+        connection.execute("CREATE TEMP TABLE IF NOT EXISTS incoming (original_id TEXT, anonymized_id TEXT)")
+        connection.execute("DELETE FROM incoming")
+        connection.executemany("INSERT INTO incoming VALUES (?, ?)", items)
+
+        conflicts = connection.execute(
+            f"SELECT count(*) FROM incoming JOIN {table} USING (original_id) "  # noqa: S608
+            f"WHERE incoming.anonymized_id != {table}.anonymized_id"
+        ).fetchone()[0]
+        if conflicts:
+            err_msg = f"{conflicts} {kind} ids are already mapped to a different anonymized id"
+            raise ValueError(err_msg)
+
+        try:
+            connection.execute(
+                f"INSERT INTO {table} SELECT original_id, anonymized_id, ? FROM incoming "  # noqa: S608
+                f"WHERE original_id NOT IN (SELECT original_id FROM {table})",
+                (wave,),
+            )
+        except sqlite3.IntegrityError as e:
+            err_msg = f"Collision in anonymized {kind} ids"
+            raise ValueError(err_msg) from e
+
+    def import_json(self, filename: str, wave: str = "imported") -> None:
+        self.append(Mappings.load_from_file(filename), wave)
+
+    def export_json(self, filename: str) -> None:
+        self.to_mappings().save_to_file(filename)
+
+
+def _table(kind: str) -> str:
+    if kind not in KINDS:
+        err_msg = f"Unknown mapping kind: {kind}, expected one of {', '.join(KINDS)}"
+        raise ValueError(err_msg)
+    return kind
@@ -1,39 +1,134 @@
+from collections.abc import Iterable, Sequence
+from typing import Optional
+
 import numpy as np
 import pandas as pd
 
+from sampler.keys import HISTORY_KEYS
+
+# The comparisons take the per professional history tables and the event type histograms carried by
+# process.Result, so the reports never group the events again.
+#
+# The summaries behind them are histograms: the number of professionals per history length, optionally per key such
+# as the bucket or the event type. History lengths are whole numbers of events, so a histogram is the exact
+# distribution in as many rows as there are distinct lengths, which stays small however many professionals there
+# are. Counts, means and percentiles come out exactly as from the full table, there is no rank error to bound the way
+# a t-digest or KLL sketch needs to. Histograms of disjoint sets of professionals, e.g. slices of a history table or
+# the organization shards of parallel.sample_parallel, merge by adding their counts.
+
+PERCENTILES = [10, 20, 30, 40, 50, 60, 70, 80, 90]
+SUMMARY_COLUMNS = ["history_length", "professionals"]
+# the columns of compare_summaries printed per key
+KEY_COMPARISON_COLUMNS = ["professionals", "average", "p50"]
+
+
+def length_histogram(history: pd.DataFrame, keys: Sequence[str] = ()) -> pd.DataFrame:
+    histogram = history.groupby([*keys, "history_length"], observed=True).size()
+    return histogram.rename("professionals").reset_index()
+
+
+def merge_histograms(histograms: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    frames = list(histograms)
+    keys = [column for column in frames[0].columns if column not in SUMMARY_COLUMNS]
+    histogram = pd.concat(frames).groupby([*keys, "history_length"], observed=True)["professionals"].sum()
+    return histogram.reset_index()
+
+
+def merge_event_type_histories(histories: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    # the history lengths of the same professional and event type in several tables, e.g. of chunks, add up
+    frames = list(histories)
+    # tables without events would otherwise decide the dtypes of the merged columns
+    merged = pd.concat([frame for frame in frames if len(frame)] or frames[:1])
+    return merged.groupby([*HISTORY_KEYS, "event_type"], observed=True)["history_length"].sum().reset_index()
+
+
+def event_type_history(events: pd.DataFrame, history: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    # history lengths per professional and event type, added to the ones of earlier chunks when given
+    chunk_history = events.groupby([*HISTORY_KEYS, "event_type"], observed=True).size().rename("history_length")
+    if history is None:
+        return chunk_history.reset_index()
+
+    return merge_event_type_histories([history, chunk_history.reset_index()])
+
+
+def _interpolate(below: np.ndarray, above: np.ndarray, gamma: np.ndarray) -> np.ndarray:
+    # the linear interpolation of np.percentile, the same operations give the same floats
+    difference = above - below
+    interpolated: np.ndarray = np.where(gamma >= 0.5, above - difference * (1 - gamma), below + difference * gamma)
+    return interpolated
+
+
+def summarize_histogram(histogram: pd.DataFrame, percentiles: Sequence[int] = PERCENTILES) -> pd.DataFrame:
+    # one row per key with the professionals, their events, average history length and percentiles
+    keys = [column for column in histogram.columns if column not in SUMMARY_COLUMNS]
+    histogram = histogram[histogram["professionals"] > 0].sort_values([*keys, "history_length"], ignore_index=True)
+    percentile_columns = [f"p{percentile}" for percentile in percentiles]
+
+    columns = [*keys, "professionals", "events", "average", *percentile_columns]
+    if histogram.empty:
+        # a wave can end up empty once every professional has been sampled before
+        return pd.DataFrame([] if keys else [[0, 0, *[np.nan] * (len(percentiles) + 1)]], columns=columns)
+
+    lengths = histogram["history_length"].to_numpy(dtype=np.int64)
+    counts = histogram["professionals"].to_numpy(dtype=np.int64)
+    starts = np.zeros(1, dtype=np.int64)
+    if keys:
+        group = histogram.groupby(keys, observed=True, sort=False).ngroup().to_numpy()
+        starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+
+    professionals = np.add.reduceat(counts, starts)
+    events = np.add.reduceat(lengths * counts, starts)
+    cumulative = np.cumsum(counts)
+    before = cumulative[starts] - counts[starts]
+
+    # ranks of the percentiles within each group, the professionals sorted by history length
+    positions = (professionals[:, None] - 1) * (np.asarray(percentiles) / 100)
+    below = np.floor(positions)
+    above = np.minimum(below + 1, professionals[:, None] - 1)
+
+    def length_at(rank: np.ndarray) -> np.ndarray:
+        at: np.ndarray = lengths[np.searchsorted(cumulative, before[:, None] + rank, side="right")]
+        return at
+
+    values = _interpolate(length_at(below), length_at(above), positions - below)
+
+    summary = histogram.iloc[starts][keys].reset_index(drop=True)
+    summary["professionals"] = professionals
+    summary["events"] = events
+    summary["average"] = events / professionals
+    summary[percentile_columns] = values
+    return summary
+
+
+def compare_summaries(original: pd.DataFrame, sampled: pd.DataFrame) -> pd.DataFrame:
+    # the summaries of the population and the sample side by side, per key when the histograms have keys
+    keys = [column for column in original.columns if column not in SUMMARY_COLUMNS]
+    original_summary = summarize_histogram(original)
+    sampled_summary = summarize_histogram(sampled)
+    if not keys:
+        return pd.concat([original_summary.add_suffix("_full"), sampled_summary.add_suffix("_sample")], axis=1)
+    return original_summary.merge(sampled_summary, on=keys, how="left", suffixes=("_full", "_sample"))
+
 
 def compare_average_history_length(original: pd.DataFrame, sampled: pd.DataFrame) -> None:
-    original_agg = original.groupby(["organization_id", "professional_id", "professional_cohort"]).size().mean()
-    sampled_agg = sampled.groupby(["organization_id", "professional_id", "professional_cohort"]).size().mean()
+    original_agg = summarize_histogram(length_histogram(original))["average"].iloc[0]
+    sampled_agg = summarize_histogram(length_histogram(sampled))["average"].iloc[0]
 
     print(f"Original: {original_agg}")
     print(f"Sampled: {sampled_agg}")
     print(f"Diff: {sampled_agg - original_agg}")
 
 
-def compare_percentiles_history_length(original: pd.DataFrame, sampled: pd.DataFrame) -> None:
-    original_agg = original.groupby(["organization_id", "professional_id", "professional_cohort"]).size().reset_index()
-    original_agg.columns = pd.Index(
-        [
-            "organization_id",
-            "professional_id",
-            "professional_cohort",
-            "history_length",
-        ]
-    )
-    sampled_agg = sampled.groupby(["organization_id", "professional_id", "professional_cohort"]).size().reset_index()
-    sampled_agg.columns = pd.Index(
-        [
-            "organization_id",
-            "professional_id",
-            "professional_cohort",
-            "history_length",
-        ]
-    )
+def _percentiles(history: pd.DataFrame, percentiles: list[int]) -> np.ndarray:
+    summary = summarize_histogram(length_histogram(history), percentiles)
+    values: np.ndarray = summary[[f"p{percentile}" for percentile in percentiles]].to_numpy(dtype=float)[0]
+    return values
+
 
-    percentiles = [10, 20, 30, 40, 50, 60, 70, 80, 90]
-    original_percentiles = np.percentile(original_agg["history_length"], percentiles)
-    sampled_percentiles = np.percentile(sampled_agg["history_length"], percentiles)
+def compare_percentiles_history_length(original: pd.DataFrame, sampled: pd.DataFrame) -> None:
+    percentiles = PERCENTILES
+    original_percentiles = _percentiles(original, percentiles)
+    sampled_percentiles = _percentiles(sampled, percentiles)
     comparison_df = pd.DataFrame(
         {
             "Percentile": percentiles,
@@ -44,3 +139,14 @@ def compare_percentiles_history_length(original: pd.DataFrame, sampled: pd.DataF
     )
 
     print(comparison_df)
+
+
+def compare_history_length_per_key(original: pd.DataFrame, sampled: pd.DataFrame) -> None:
+    # takes histograms with keys, e.g. per bucket or per event type
+    comparison = compare_summaries(original, sampled)
+    keys = [column for column in original.columns if column not in SUMMARY_COLUMNS]
+    columns = [f"{column}_{side}" for column in KEY_COMPARISON_COLUMNS for side in ("full", "sample")]
+
+    # every column, the rows are cut down to pandas' display.max_rows when there are many keys
+    with pd.option_context("display.max_columns", None, "display.width", None):
+        print(comparison[[*keys, *columns]])
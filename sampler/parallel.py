@@ -0,0 +1,198 @@
+import multiprocessing
+import sys
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from functools import partial
+from typing import Optional
+
+import pandas as pd
+
+from sampler.config import Mappings
+from sampler.metrics import event_type_history, length_histogram, merge_histograms
+from sampler.parser import CATEGORICAL_COLUMNS
+from sampler.privacy import anonymize_dataset
+from sampler.process import (
+    Result,
+    assign_sample_count,
+    calculate_bucket_size,
+    exclude_professionals,
+    extend_mapping,
+    filter_events,
+    history_length_per_professional,
+    new_seed,
+    professionals_for_output,
+    sample_professionals,
+    sampler_configuration,
+)
+
+# the shards of the pool's sample_parallel call, set in every worker by keep_shards, so the tasks only pass the
+# position of their shard instead of pickling it
+_shards: list[pd.DataFrame] = []
+
+
+def keep_shards(shards: list[pd.DataFrame]) -> None:
+    _shards[:] = shards
+
+
+def pool_context() -> Optional[multiprocessing.context.BaseContext]:
+    # forked workers inherit the shards from the parent, spawned ones unpickle them once each. Fork is only chosen
+    # on Linux, it is unsafe with the system frameworks on macOS.
+    return multiprocessing.get_context("fork") if sys.platform.startswith("linux") else None
+
+
+def shard_by_organization(events: pd.DataFrame, shards: int) -> list[pd.DataFrame]:
+    # all events of an organization land in the same shard, and every shard only carries its own categories
+    events = events.reset_index(drop=True)
+    organization_hash = pd.util.hash_pandas_object(events["organization_id"], index=False).to_numpy()
+    assignment = organization_hash % shards
+
+    result = []
+    for shard in range(shards):
+        df = events[assignment == shard]
+        for column in CATEGORICAL_COLUMNS:
+            if isinstance(df[column].dtype, pd.CategoricalDtype):
+                df = df.assign(**{column: df[column].cat.remove_unused_categories()})
+        result.append(df)
+    return result
+
+
+def shard_history(
+    shard: int, after: date, until: date, excluded_ids: list[str]
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    # the history lengths of the shard, and its histogram per event type for the reports
+    filtered = filter_events(_shards[shard], after, until, excluded_ids)
+    event_types = length_histogram(event_type_history(filtered), ["event_type"])
+    return history_length_per_professional(filtered), event_types
+
+
+def shard_sample(
+    shard: int,
+    history: pd.DataFrame,
+    sampled_buckets: pd.DataFrame,
+    after: date,
+    until: date,
+    excluded_ids: list[str],
+    other_professionals_in_output: list[str],
+    seed: int,
+) -> tuple[list[str], pd.DataFrame, pd.DataFrame]:
+    # the draw keys depend on the seed and the candidate only, so the shards draw exactly what a single process would
+    sampled_professionals = sample_professionals(history, sampled_buckets, seed)
+
+    # the events of the output professionals are taken first, so only those are filtered again, not the whole shard
+    events = _shards[shard]
+    professionals_in_output = [*sampled_professionals, *other_professionals_in_output]
+    selected_entries = filter_events(
+        events[events["professional_id"].isin(professionals_in_output)], after, until, excluded_ids
+    )
+    event_types = length_histogram(event_type_history(selected_entries), ["event_type"])
+
+    return sampled_professionals, selected_entries, event_types
+
+
+def sample_parallel(
+    df: pd.DataFrame,
+    output_sample_count: int,
+    workers: int,
+    seed: Optional[int] = None,
+    after: Optional[date] = None,
+    until: Optional[date] = None,
+    excluded_ids: Optional[Iterable[str]] = None,
+    mappings: Optional[Mappings] = None,
+    include_all_in_output: bool = False,
+    id_key: Optional[bytes] = None,
+    allocation: str = "ceil",
+) -> Result:
+    # Same selection as process.sample, with the events split by organization over a process pool. The workers
+    # filter and aggregate their shard, the bucket quotas are fixed on the merged histories, then the workers draw
+    # their organizations' buckets and extract the selected events. With the same seed it samples the same
+    # professionals as process.sample. The ids are anonymized once the shards are
+    # merged, so every professional gets a single anonymized id and collisions are checked globally.
+    if not after:
+        after = date(2022, 1, 1)
+
+    if not until:
+        until = date.today()
+
+    if not mappings:
+        mappings = Mappings({}, {})
+
+    if not excluded_ids:
+        excluded_ids = []
+
+    if seed is None:
+        seed = new_seed()
+
+    excluded_ids = list(excluded_ids)
+    ids_excluded_for_sampling = set(excluded_ids).union(set(mappings.professionals.keys()))
+    shards = shard_by_organization(df, workers)
+
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=pool_context(), initializer=keep_shards, initargs=(shards,)
+    ) as executor:
+        shard_histories_and_event_types = list(
+            executor.map(
+                partial(shard_history, after=after, until=until, excluded_ids=excluded_ids), range(len(shards))
+            )
+        )
+        histories = [history for history, _ in shard_histories_and_event_types]
+
+        population_history = pd.concat(histories, ignore_index=True)
+        history = exclude_professionals(population_history, mappings.professionals.keys())
+        buckets = calculate_bucket_size(history)
+        sampled_buckets = assign_sample_count(buckets, output_sample_count, allocation)
+
+        # the professionals included on top of the sample, from professionals_for_output
+        other_professionals_in_output = professionals_for_output([], excluded_ids, mappings, include_all_in_output)
+
+        shard_histories = [exclude_professionals(h, mappings.professionals.keys()) for h in histories]
+        shard_buckets = [
+            sampled_buckets[sampled_buckets["organization_id"].isin(set(h["organization_id"].to_list()))]
+            for h in histories
+        ]
+        draw = partial(
+            shard_sample,
+            after=after,
+            until=until,
+            excluded_ids=excluded_ids,
+            other_professionals_in_output=other_professionals_in_output,
+            seed=seed,
+        )
+        samples = list(executor.map(draw, range(len(shards)), shard_histories, shard_buckets))
+
+    sampled_professionals = sorted(professional for shard_sampled, _, _ in samples for professional in shard_sampled)
+    if len(set(sampled_professionals) & ids_excluded_for_sampling) != 0:
+        err_msg = "Some sampled professionals were found in the excluded ids"
+        raise ValueError(err_msg)
+
+    # back in the original row order, whatever the number of shards
+    selected_entries = pd.concat([entries for _, entries, _ in samples]).sort_index()
+    selected_entries = selected_entries.astype(dict.fromkeys(CATEGORICAL_COLUMNS, object))
+
+    organizations_mappings = extend_mapping(
+        selected_entries["organization_id"].to_list(), mappings.organizations, id_key
+    )
+    professionals_mappings = extend_mapping(sampled_professionals, mappings.professionals, id_key)
+
+    anonymized_selected_entries = anonymize_dataset(selected_entries, professionals_mappings, organizations_mappings)
+
+    professionals_in_output = [*sampled_professionals, *other_professionals_in_output]
+    configuration = sampler_configuration(
+        after, until, excluded_ids, output_sample_count, include_all_in_output, mappings, seed, id_key, allocation
+    )
+
+    return Result(
+        sampled_professionals=sampled_professionals,
+        samples=anonymized_selected_entries,
+        id_mappings=Mappings(
+            organizations=organizations_mappings,
+            professionals=professionals_mappings,
+        ),
+        configuration={**configuration, "workers": workers},
+        population_history=population_history,
+        sample_history=population_history[population_history["professional_id"].isin(professionals_in_output)],
+        buckets=buckets,
+        # the shards hold disjoint professionals, so their histograms add up to the ones of all the events
+        population_event_types=merge_histograms(event_types for _, event_types in shard_histories_and_event_types),
+        sample_event_types=merge_histograms(event_types for _, _, event_types in samples),
+    )
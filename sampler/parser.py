@@ -1,13 +1,35 @@
+import csv
+import io
+import os
 import re
-from collections.abc import Iterable
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from functools import partial
-from typing import Any
+from typing import Any, Optional
 
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 
+from sampler.cache import load_cached
 from sampler.utils import bucketize_cohort
 
+# bump whenever the parsed output changes, so cached parses are rebuilt
+PARSER_VERSION = 1
+
+COLUMNS = [
+    "organization_id",
+    "professional_id",
+    "professional_cohort",
+    "ts",
+    "event_type",
+]
+
+YYYYMMDD_PATTERN = r"\d{4}-\d{2}-\d{2}"
+ISO_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+ISO_TIMESTAMP_LENGTH = len("YYYY-MM-DDThh:mm:ss")
+
 
 class WrongColumnNameError(Exception):
     missing_columns: set[str]
@@ -25,11 +47,14 @@ class WrongColumnNameError(Exception):
 class WrongColumnTypeError(Exception):
     column: str
     error: Exception
+    row: Optional[int]
 
-    def __init__(self, column: str, error: Exception):
-        super().__init__(f"Wrong type in column: {column}: {error}")
+    def __init__(self, column: str, error: Exception, row: Optional[int] = None):
+        location = f" (row {row})" if row is not None else ""
+        super().__init__(f"Wrong type in column: {column}{location}: {error}")
         self.column = column
         self.error = error
+        self.row = row
 
 
 def as_str(col_name: str, col: Any) -> str:
@@ -41,7 +66,7 @@ def as_str(col_name: str, col: Any) -> str:
 def as_yyyymmdd(col_name: str, col: Any) -> str:
     if not isinstance(col, str):
         raise WrongColumnTypeError(col_name, ValueError(f"Expected string, got {col}"))
-    if not re.match(r"\d{4}-\d{2}-\d{2}", col):
+    if not re.match(YYYYMMDD_PATTERN, col):
         raise WrongColumnTypeError(col_name, ValueError(f"Expected YYYY-MM-DD, got {col}"))
     return bucketize_cohort(col)
 
@@ -56,33 +81,153 @@ def as_iso_timestamp(col_name: str, col: Any) -> pd.Timestamp:
         )
 
     try:
-        col = datetime.strptime(col, "%Y-%m-%dT%H:%M:%S")
+        col = datetime.strptime(col, ISO_TIMESTAMP_FORMAT)
         return pd.Timestamp(col)
     except ValueError as e:
         raise WrongColumnTypeError(col_name, ValueError(f"Invalid ISO timestamp format: {col}")) from e
 
 
-def parse_events(filename: str) -> pd.DataFrame:
-    columns = [
-        "organization_id",
-        "professional_id",
-        "professional_cohort",
-        "ts",
-        "event_type",
-    ]
-
-    df = pd.read_csv(
-        filename,
-        converters={
-            "organization_id": partial(as_str, "organization_id"),
-            "professional_id": partial(as_str, "professional_id"),
-            "professional_cohort": partial(as_yyyymmdd, "professional_cohort"),
-            "ts": partial(as_iso_timestamp, "ts"),
-            "event_type": partial(as_str, "event_type"),
-        },
-    )
-
-    if not all(col in df.columns for col in columns):
-        raise WrongColumnNameError(columns, df.columns)
+def _raise_on_first_invalid(column: pd.Series, invalid: np.ndarray, message: str) -> None:
+    if not invalid.any():
+        return
+
+    position = int(invalid.argmax())
+    # the index keeps counting across chunks, so this is the row in the whole file
+    row = int(column.index[position])
+    raise WrongColumnTypeError(str(column.name), ValueError(f"{message}, got {column.iloc[position]}"), row=row)
+
+
+def validate_str(column: pd.Series) -> pd.Series:
+    # the CSV is read without NA detection, so every cell is already a string
+    return column
+
+
+def validate_yyyymmdd(column: pd.Series) -> pd.Series:
+    # there are only a handful of distinct cohorts, so validate and bucketize those instead of every row
+    codes, cohorts = pd.factorize(column)
+    invalid_cohorts = ~pd.Series(cohorts).str.match(YYYYMMDD_PATTERN).to_numpy()
+    _raise_on_first_invalid(column, invalid_cohorts[codes], "Expected YYYY-MM-DD")
+
+    bucketized = np.array([bucketize_cohort(cohort) for cohort in cohorts], dtype=object)
+    bucketized_column: pd.Series = pd.Series(bucketized[codes], index=column.index, name=column.name)
+    return bucketized_column
+
+
+def validate_iso_timestamp(column: pd.Series) -> pd.Series:
+    parsed: pd.Series = pd.to_datetime(column, format=ISO_TIMESTAMP_FORMAT, errors="coerce")
+    # the format alone accepts single digit fields, the length check rejects them like the regex did
+    lengths = np.fromiter(map(len, column.to_numpy()), dtype=np.int64, count=len(column))
+    invalid = parsed.isna().to_numpy() | (lengths != ISO_TIMESTAMP_LENGTH)
+    _raise_on_first_invalid(column, invalid, "Expected ISO timestamp YYYY-MM-DDThh:mm:ss")
+    return parsed
+
+
+# low cardinality id columns are kept dictionary encoded, so grouping, filtering and anonymizing
+# work on the small table of distinct ids instead of on every row
+CATEGORICAL_COLUMNS = ["organization_id", "professional_id", "event_type"]
+
+VALIDATORS = {
+    "organization_id": validate_str,
+    "professional_id": validate_str,
+    "professional_cohort": validate_yyyymmdd,
+    "ts": validate_iso_timestamp,
+    "event_type": validate_str,
+}
+
+
+def validate_events(df: pd.DataFrame) -> pd.DataFrame:
+    if not all(col in df.columns for col in COLUMNS):
+        raise WrongColumnNameError(COLUMNS, df.columns)
+
+    for column, validator in VALIDATORS.items():
+        df[column] = validator(df[column])
+
+    return df.astype(dict.fromkeys(CATEGORICAL_COLUMNS, "category"))
+
+
+def read_events(filename: str) -> pd.DataFrame:
+    df = pd.read_csv(filename, dtype=str, na_filter=False)
+    return validate_events(df)
+
+
+def byte_ranges(filename: str, parts: int) -> tuple[list[str], list[tuple[int, int]]]:
+    # Splits the data rows of the file into about equal byte ranges that start and end on a line boundary.
+    # Fields never contain newlines, so a line boundary is always a row boundary.
+    size = os.path.getsize(filename)
+    with open(filename, "rb") as file:
+        header = file.readline()
+        data_start = file.tell()
+
+        boundaries = [data_start]
+        for part in range(1, parts):
+            file.seek(data_start + part * (size - data_start) // parts)
+            file.readline()
+            boundaries.append(min(file.tell(), size))
+        boundaries.append(size)
+
+    columns = next(csv.reader([header.decode()]))
+    ranges = [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+    return columns, ranges
+
+
+def read_events_range(
+    filename: str, columns: list[str], start: int, end: int
+) -> tuple[Optional[pd.DataFrame], int, Optional[tuple[str, Exception, Optional[int]]]]:
+    # Returns the parsed range, its row count and the validation error if any. The error is returned instead of
+    # raised, so the caller can turn its row into a row of the whole file.
+    with open(filename, "rb") as file:
+        file.seek(start)
+        data = file.read(end - start)
+
+    df = pd.read_csv(io.BytesIO(data), names=columns, header=None, dtype=str, na_filter=False)
+    try:
+        return validate_events(df), len(df), None
+    except WrongColumnTypeError as e:
+        return None, len(df), (e.column, e.error, e.row)
+
+
+def read_events_parallel(filename: str, workers: int) -> pd.DataFrame:
+    columns, ranges = byte_ranges(filename, workers)
+    if not all(col in columns for col in COLUMNS):
+        raise WrongColumnNameError(COLUMNS, columns)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        starts, ends = zip(*ranges) if ranges else ((), ())
+        results = list(executor.map(partial(read_events_range, filename, columns), starts, ends))
+
+    offset = 0
+    for _, rows, error in results:
+        if error is not None:
+            column, cause, row = error
+            raise WrongColumnTypeError(column, cause, row=None if row is None else offset + row)
+        offset += rows
+
+    frames = [df for df, _, _ in results if df is not None]
+    if not frames:
+        return validate_events(pd.DataFrame({column: pd.Series(dtype=str) for column in columns}))
+
+    df = pd.concat(frames, ignore_index=True)
+    # every range has its own categories, union them instead of falling back to strings
+    for column in CATEGORICAL_COLUMNS:
+        df[column] = union_categoricals([frame[column] for frame in frames], sort_categories=True)
 
     return df
+
+
+def parse_events(filename: str, cache: bool = False, rebuild_cache: bool = False, workers: int = 1) -> pd.DataFrame:
+    read = partial(read_events_parallel, filename, workers) if workers > 1 else partial(read_events, filename)
+    if not cache:
+        return read()
+
+    return load_cached(filename, PARSER_VERSION, read, rebuild=rebuild_cache)
+
+
+def iter_raw_events(filename: str, chunksize: int) -> Iterator[pd.DataFrame]:
+    # the chunks as read, for validate_events to check
+    with pd.read_csv(filename, dtype=str, na_filter=False, chunksize=chunksize) as reader:
+        yield from reader
+
+
+def iter_events(filename: str, chunksize: int) -> Iterator[pd.DataFrame]:
+    for chunk in iter_raw_events(filename, chunksize):
+        yield validate_events(chunk)
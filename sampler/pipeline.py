@@ -0,0 +1,173 @@
+import queue
+import threading
+import time
+from collections.abc import Callable, Iterable, Sequence
+from dataclasses import dataclass
+from typing import Any, Optional
+
+# Chunks flow from a source through a chain of steps, e.g. reading, validating, aggregating and writing. Pipelined,
+# every step runs in its own thread and hands its chunks to the next one through a queue of at most queue_size
+# chunks. A step that finds the next queue full waits, so a slow step holds back the ones before it: besides the
+# chunk each step is working on, at most queue_size chunks per queue are in memory. File reads, the CSV tokenizer and
+# compression release the GIL, which is what lets the steps overlap. Chunks keep their order, every step handles one
+# at a time.
+
+QUEUE_SIZE = 2
+# how often a waiting step checks whether another step failed
+POLL_SECONDS = 0.1
+
+
+@dataclass
+class StepReport:
+    name: str
+    chunks: int = 0
+    busy_seconds: float = 0.0
+    # waiting for the previous step, and held back by the next one
+    input_wait_seconds: float = 0.0
+    output_wait_seconds: float = 0.0
+    # chunks already waiting in the step's input queue whenever it was ready for the next one, a queue that is
+    # mostly full points at the step itself as the bottleneck, an empty one at the steps before it
+    mean_queue_occupancy: float = 0.0
+    max_queue_occupancy: int = 0
+
+
+_DONE = object()
+
+
+def _put(out: "queue.Queue[Any]", item: Any, failed: threading.Event) -> bool:
+    while not failed.is_set():
+        try:
+            out.put(item, timeout=POLL_SECONDS)
+        except queue.Full:
+            continue
+        return True
+    return False
+
+
+def _get(source: "queue.Queue[Any]", failed: threading.Event) -> Any:
+    while not failed.is_set():
+        try:
+            item = source.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            continue
+        return item
+    return _DONE
+
+
+def _read(source: Iterable[Any], out: "queue.Queue[Any]", report: StepReport, failed: threading.Event) -> None:
+    iterator = iter(source)
+    while True:
+        start = time.perf_counter()
+        item = next(iterator, _DONE)
+        report.busy_seconds += time.perf_counter() - start
+        if item is _DONE:
+            break
+
+        report.chunks += 1
+        start = time.perf_counter()
+        if not _put(out, item, failed):
+            return
+        report.output_wait_seconds += time.perf_counter() - start
+
+    _put(out, _DONE, failed)
+
+
+def _step(
+    function: Callable[[Any], Any],
+    source: "queue.Queue[Any]",
+    out: "Optional[queue.Queue[Any]]",
+    report: StepReport,
+    failed: threading.Event,
+) -> None:
+    occupancy = 0
+    while True:
+        waiting = source.qsize()
+        start = time.perf_counter()
+        item = _get(source, failed)
+        report.input_wait_seconds += time.perf_counter() - start
+        if item is _DONE:
+            break
+
+        report.chunks += 1
+        occupancy += waiting
+        report.max_queue_occupancy = max(report.max_queue_occupancy, waiting)
+        report.mean_queue_occupancy = occupancy / report.chunks
+
+        start = time.perf_counter()
+        result = function(item)
+        report.busy_seconds += time.perf_counter() - start
+
+        if out is not None:
+            start = time.perf_counter()
+            if not _put(out, result, failed):
+                return
+            report.output_wait_seconds += time.perf_counter() - start
+
+    if out is not None:
+        _put(out, _DONE, failed)
+
+
+def _sequential(
+    source: Iterable[Any], steps: Sequence[tuple[str, Callable[[Any], Any]]], reports: list[StepReport]
+) -> None:
+    iterator = iter(source)
+    while True:
+        start = time.perf_counter()
+        item = next(iterator, _DONE)
+        reports[0].busy_seconds += time.perf_counter() - start
+        if item is _DONE:
+            return
+
+        reports[0].chunks += 1
+        for (_, function), report in zip(steps, reports[1:]):
+            start = time.perf_counter()
+            item = function(item)
+            report.busy_seconds += time.perf_counter() - start
+            report.chunks += 1
+
+
+def run_steps(
+    source_name: str,
+    source: Iterable[Any],
+    steps: Sequence[tuple[str, Callable[[Any], Any]]],
+    queue_size: Optional[int] = None,
+) -> list[StepReport]:
+    # Feeds every chunk of source through the steps in order, whatever the last step returns is dropped. Without a
+    # queue_size the steps run one after the other in the calling thread.
+    reports = [StepReport(source_name), *(StepReport(name) for name, _ in steps)]
+    if queue_size is None:
+        _sequential(source, steps, reports)
+        return reports
+
+    failed = threading.Event()
+    errors: list[BaseException] = []
+
+    def guarded(target: Callable[..., None], *args: Any) -> Callable[[], None]:
+        def run() -> None:
+            try:
+                target(*args)
+            except BaseException as e:
+                errors.append(e)
+                failed.set()
+
+        return run
+
+    queues: list[queue.Queue[Any]] = [queue.Queue(maxsize=queue_size) for _ in steps]
+    threads = [threading.Thread(target=guarded(_read, source, queues[0], reports[0], failed), name=source_name)]
+    for position, (name, function) in enumerate(steps):
+        out = queues[position + 1] if position + 1 < len(steps) else None
+        threads.append(
+            threading.Thread(
+                target=guarded(_step, function, queues[position], out, reports[position + 1], failed), name=name
+            )
+        )
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+    return reports
@@ -0,0 +1,217 @@
+import io
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+import pandas as pd
+
+from sampler.config import Mappings
+from sampler.keys import BUCKET_KEYS
+from sampler.mapping_store import MappingStore
+from sampler.parser import iter_events
+from sampler.process import (
+    assign_sample_count,
+    calculate_bucket_size,
+    exclude_professionals,
+    filter_events,
+    history_length_per_professional,
+    professionals_for_output,
+)
+from sampler.streaming import accumulate_history
+
+# the output rows are measured on this many events, with ids as long as the anonymized uuid4s
+PROBE_ROWS = 10_000
+ANONYMIZED_ID_LENGTH = 36
+
+
+@dataclass
+class OutputProbe:
+    csv_bytes_per_row: float
+    memory_bytes_per_row: float
+    write_seconds_per_row: float
+
+
+@dataclass
+class Plan:
+    # the buckets assign_sample_count gives samples to, with the events their samples are expected to bring along
+    allocation: pd.DataFrame
+    professionals: int
+    output_events: float
+    output_bytes: float
+    memory_bytes: float
+    # writing the output, the part of a run the plan does not do
+    write_seconds: float
+
+
+def allocation_table(history: pd.DataFrame, output_sample_count: int, strategy: str = "ceil") -> pd.DataFrame:
+    buckets = calculate_bucket_size(history)
+    allocation = assign_sample_count(buckets, output_sample_count, strategy)[[*BUCKET_KEYS, "expected_samples"]].merge(
+        buckets, on=BUCKET_KEYS
+    )
+    # every professional of a bucket is equally likely to be drawn, so a sample brings the bucket's average history
+    return allocation.assign(estimated_events=allocation["expected_samples"] * allocation["avg_history_length"])
+
+
+def probe_output(events: pd.DataFrame) -> OutputProbe:
+    probe = events.iloc[:PROBE_ROWS]
+    if probe.empty:
+        return OutputProbe(0.0, 0.0, 0.0)
+
+    anonymized_id = "0" * ANONYMIZED_ID_LENGTH
+    probe = probe.assign(organization_id=anonymized_id, professional_id=anonymized_id)
+
+    start = time.perf_counter()
+    buffer = io.StringIO()
+    probe.to_csv(buffer, index=False, header=False)
+    elapsed = time.perf_counter() - start
+
+    rows = len(probe)
+    return OutputProbe(
+        csv_bytes_per_row=len(buffer.getvalue().encode()) / rows,
+        memory_bytes_per_row=probe.memory_usage(deep=True).sum() / rows,
+        write_seconds_per_row=elapsed / rows,
+    )
+
+
+def build_plan(
+    population_history: pd.DataFrame,
+    output_sample_count: int,
+    excluded_ids: Iterable[str],
+    mappings: Mappings,
+    include_all_in_output: bool,
+    probe: OutputProbe,
+    resident_bytes: float,
+    output_in_memory: bool,
+    allocation_strategy: str = "ceil",
+) -> Plan:
+    history = exclude_professionals(population_history, mappings.professionals.keys())
+    allocation = allocation_table(history, output_sample_count, allocation_strategy)
+
+    included = professionals_for_output([], excluded_ids, mappings, include_all_in_output)
+    included_events = population_history.loc[population_history["professional_id"].isin(included), "history_length"]
+    output_events = allocation["estimated_events"].sum() + included_events.sum()
+
+    memory_bytes = resident_bytes + population_history.memory_usage(deep=True).sum()
+    if output_in_memory:
+        memory_bytes += output_events * probe.memory_bytes_per_row
+
+    return Plan(
+        allocation=allocation,
+        professionals=len(history),
+        output_events=float(output_events),
+        output_bytes=float(output_events * probe.csv_bytes_per_row),
+        memory_bytes=float(memory_bytes),
+        write_seconds=float(output_events * probe.write_seconds_per_row),
+    )
+
+
+def plan(
+    df: pd.DataFrame,
+    output_sample_count: int,
+    after: Optional[date] = None,
+    until: Optional[date] = None,
+    excluded_ids: Optional[Iterable[str]] = None,
+    mappings: Optional[Mappings] = None,
+    include_all_in_output: bool = False,
+    allocation: str = "ceil",
+) -> Plan:
+    # Runs the aggregation stages of process.sample only: nothing is drawn, no ids are generated and nothing is written.
+    if not after:
+        after = date(2022, 1, 1)
+
+    if not until:
+        until = date.today()
+
+    if not mappings:
+        mappings = Mappings({}, {})
+
+    if not excluded_ids:
+        excluded_ids = []
+
+    filtered = filter_events(df, after, until, excluded_ids)
+    return build_plan(
+        history_length_per_professional(filtered),
+        output_sample_count,
+        excluded_ids,
+        mappings,
+        include_all_in_output,
+        probe_output(filtered),
+        resident_bytes=df.memory_usage(deep=True).sum(),
+        output_in_memory=True,
+        allocation_strategy=allocation,
+    )
+
+
+def plan_streaming(
+    filename: str,
+    output_sample_count: int,
+    chunksize: int = 1_000_000,
+    after: Optional[date] = None,
+    until: Optional[date] = None,
+    excluded_ids: Optional[Iterable[str]] = None,
+    mappings: Optional[Mappings] = None,
+    include_all_in_output: bool = False,
+    allocation: str = "ceil",
+    mapping_store: Optional[MappingStore] = None,
+) -> Plan:
+    # Same plan from the first pass of streaming.sample_streaming, which only holds one chunk and the history at once.
+    # With a mapping_store the mappings are the stored ones of the ids in the window, like sample_streaming uses.
+    if not after:
+        after = date(2022, 1, 1)
+
+    if not until:
+        until = date.today()
+
+    if not mappings:
+        mappings = Mappings({}, {})
+
+    if not excluded_ids:
+        excluded_ids = []
+
+    population_history: Optional[pd.DataFrame] = None
+    probe: Optional[OutputProbe] = None
+    chunk_bytes = 0
+    for chunk in iter_events(filename, chunksize):
+        filtered = filter_events(chunk, after, until, excluded_ids)
+        if probe is None and not filtered.empty:
+            probe = probe_output(filtered)
+        chunk_bytes = max(chunk_bytes, chunk.memory_usage(deep=True).sum())
+        population_history = accumulate_history(population_history, filtered)
+
+    if population_history is None:
+        err_msg = f"No events found in {filename}"
+        raise ValueError(err_msg)
+
+    if mapping_store is not None:
+        mappings = mapping_store.mappings_for(
+            population_history["organization_id"].unique(), population_history["professional_id"].unique()
+        )
+
+    return build_plan(
+        population_history,
+        output_sample_count,
+        excluded_ids,
+        mappings,
+        include_all_in_output,
+        probe or OutputProbe(0.0, 0.0, 0.0),
+        resident_bytes=chunk_bytes,
+        output_in_memory=False,
+        allocation_strategy=allocation,
+    )
+
+
+def _mebibytes(size: float) -> str:
+    return f"{size / 2**20:,.1f} MiB"
+
+
+def print_plan(plan: Plan) -> None:
+    print(plan.allocation.to_string(index=False))
+    print()
+    print(f"Professionals to sample from: {plan.professionals}")
+    print(f"Sampled professionals: {plan.allocation['expected_samples'].sum()} in {len(plan.allocation)} buckets")
+    print(f"Estimated output events: {plan.output_events:,.0f}")
+    print(f"Estimated output size: {_mebibytes(plan.output_bytes)}")
+    print(f"Estimated peak memory: {_mebibytes(plan.memory_bytes)}")
+    print(f"Estimated time to write the output: {plan.write_seconds:.1f}s")
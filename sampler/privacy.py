@@ -1,48 +1,102 @@
+import hashlib
+import os
 from collections.abc import Iterable
-from uuid import uuid4
+from typing import Optional
 
+import numpy as np
 import pandas as pd
 
+# the two ASCII hex digits of every byte value, read as one uint16 so a lookup formats a whole byte
+HEX_PAIRS = np.frombuffer(b"".join(f"{i:02x}".encode() for i in range(256)), dtype=np.uint16)
+# the groups of hex digits of a uuid, as (first digit, last digit, position in the 36 characters)
+UUID_GROUPS = ((0, 8, 0), (8, 12, 9), (12, 16, 14), (16, 20, 19), (20, 32, 24))
+# the longest key blake2b takes, longer keys are hashed down to it first
+BLAKE2B_MAX_KEY_SIZE = 64
 
-def generate_anonymized_id_mapping(ids: Iterable[str]) -> dict[str, str]:
-    mapping = {v: str(uuid4()) for v in ids}
 
-    # ensure no collisions
-    if len(set(mapping.values())) != len(mapping.values()):
+def format_uuid4(raw: np.ndarray) -> list[str]:
+    # stamp the version and variant bits, so the random bytes read as version 4 uuids
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+
+    # the hex digits of all the uuids at once, copied between the dashes of one row of 36 characters per uuid
+    digits = HEX_PAIRS[raw].view(np.uint8)
+    chars = np.full((len(raw), 36), ord("-"), dtype=np.uint8)
+    for start, end, position in UUID_GROUPS:
+        chars[:, position : position + end - start] = digits[:, start:end]
+    formatted: list[str] = chars.view("S36").ravel().astype(str).tolist()
+    return formatted
+
+
+def random_uuid4s(count: int) -> list[str]:
+    raw = np.frombuffer(os.urandom(16 * count), dtype=np.uint8).reshape(count, 16).copy()
+    return format_uuid4(raw)
+
+
+def keyed_uuid4s(ids: list[str], key: bytes) -> list[str]:
+    # the same id and key always give the same uuid, without the key the uuid reveals nothing about the id. Keyed
+    # blake2b is a MAC itself, the keyed state is set up once and copied for every id.
+    if len(key) > BLAKE2B_MAX_KEY_SIZE:
+        key = hashlib.blake2b(key).digest()
+    keyed = hashlib.blake2b(key=key, digest_size=16)
+
+    def digest(value: str) -> bytes:
+        h = keyed.copy()
+        h.update(value.encode())
+        return h.digest()
+
+    raw = np.frombuffer(b"".join(map(digest, ids)), dtype=np.uint8).reshape(len(ids), 16).copy()
+    return format_uuid4(raw)
+
+
+def generate_anonymized_id_mapping(
+    ids: Iterable[str],
+    existing_ids: Iterable[str] = (),
+    key: Optional[bytes] = None,
+) -> dict[str, str]:
+    unique_ids = list(dict.fromkeys(ids))
+    anonymized = random_uuid4s(len(unique_ids)) if key is None else keyed_uuid4s(unique_ids, key)
+    mapping = dict(zip(unique_ids, anonymized))
+
+    # ensure no collisions, also with the ids handed out in earlier runs
+    if len(set(anonymized)) != len(anonymized) or not set(existing_ids).isdisjoint(anonymized):
         err_msg = "Collision in generated ids"
         raise ValueError(err_msg)
 
     return mapping
 
 
+def anonymize_column(column: pd.Series, mapping: dict[str, str], name: str) -> pd.Series:
+    # Only the distinct ids present in the column are looked up, so the cost and memory stay
+    # proportional to the output even when the mapping carries every id from earlier waves.
+    categorical = isinstance(column.dtype, pd.CategoricalDtype)
+    if categorical:
+        column = column.cat.remove_unused_categories()
+        codes, originals = column.cat.codes.to_numpy(), column.cat.categories
+    else:
+        codes, originals = pd.factorize(column)
+
+    anonymized = [mapping.get(original) for original in originals]
+
+    # an unmapped id would be left as is, and a mapped id must not collide with an original one
+    if None in anonymized or not set(originals).isdisjoint(anonymized):
+        err_msg = f"Some original {name} ids were found in the mapping"
+        raise ValueError(err_msg)
+
+    if categorical:
+        renamed: pd.Series = column.cat.rename_categories(anonymized)
+        return renamed
+
+    mapped: pd.Series = pd.Series(np.array(anonymized, dtype=object)[codes], index=column.index, name=column.name)
+    return mapped
+
+
 def anonymize_dataset(
     df: pd.DataFrame,
     professional_id_mapping: dict[str, str],
     organization_id_mapping: dict[str, str],
 ) -> pd.DataFrame:
-    professionals = set(df["professional_id"].to_list())
-    organizations = set(df["organization_id"].to_list())
-
-    df = df.replace(
-        {
-            "professional_id": professional_id_mapping,
-            "organization_id": organization_id_mapping,
-        }
-    )
-
-    res = df.replace(
-        {
-            "professional_id": professional_id_mapping,
-            "organization_id": organization_id_mapping,
-        }
+    return df.assign(
+        professional_id=anonymize_column(df["professional_id"], professional_id_mapping, "professional"),
+        organization_id=anonymize_column(df["organization_id"], organization_id_mapping, "organization"),
     )
-
-    if res["professional_id"].isin(professionals).any():
-        err_msg = "Some original professional ids were found in the mapping"
-        raise ValueError(err_msg)
-
-    if res["organization_id"].isin(organizations).any():
-        err_msg = "Some original organization ids were found in the mapping"
-        raise ValueError(err_msg)
-
-    return res
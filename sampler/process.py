@@ -1,15 +1,51 @@
-import json
-import math
+import hashlib
 import os
 from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import date
 from typing import Any, Optional
 
+import numpy as np
 import pandas as pd
 
 from sampler.config import Mappings
+from sampler.event_store import EventStore
+from sampler.keys import BUCKET_KEYS, HISTORY_KEYS
+from sampler.mapping_store import MappingStore
+from sampler.metrics import length_histogram
 from sampler.privacy import anonymize_dataset, generate_anonymized_id_mapping
+from sampler.profiling import Profiler
+from sampler.writers import append_frame, write_column, write_frame, write_json
+
+# subdirectory of a run's output with the tables an incremental run starts from
+STATE_DIR = "state"
+# how assign_sample_count spreads the sample over the buckets
+ALLOCATION_STRATEGIES = ("ceil", "largest_remainder", "neyman")
+
+
+def index_by_time(events: pd.DataFrame) -> pd.DataFrame:
+    # Events sorted on a ts index let time_window slice with a binary search instead of scanning every row.
+    # Worth it when the same events are filtered many times, e.g. for several waves.
+    df = events.sort_values("ts", kind="stable")
+    return df.set_axis(pd.DatetimeIndex(df["ts"].to_numpy()), axis="index")
+
+
+def time_window(events: pd.DataFrame, after: date, until: date) -> pd.DataFrame:
+    if isinstance(events.index, pd.DatetimeIndex) and events.index.is_monotonic_increasing:
+        start = events.index.searchsorted(pd.Timestamp(after), side="left")
+        end = events.index.searchsorted(pd.Timestamp(until), side="right")
+        return events.iloc[start:end]
+
+    return events[(events["ts"] >= pd.Timestamp(after)) & (events["ts"] <= pd.Timestamp(until))]
+
+
+def exclude_professionals(events: pd.DataFrame, excluded_ids: Iterable[str]) -> pd.DataFrame:
+    excluded_ids = list(excluded_ids)
+    if not excluded_ids:
+        return events
+
+    return events[~events["professional_id"].isin(excluded_ids)]
 
 
 def filter_events(
@@ -18,19 +54,11 @@ def filter_events(
     until: date,
     excluded_ids: Iterable[str] = [],
 ) -> pd.DataFrame:
-    df = events[
-        (events["ts"] >= pd.Timestamp(after))
-        & (events["ts"] <= pd.Timestamp(until))
-        & (~events["professional_id"].isin(excluded_ids))
-    ]
-    return df
+    return exclude_professionals(time_window(events, after, until), excluded_ids)
 
 
 def history_length_per_professional(events: pd.DataFrame) -> pd.DataFrame:
-    df_agg = events.groupby(
-        ["organization_id", "professional_id", "professional_cohort"],
-        as_index=False,
-    ).size()
+    df_agg = events.groupby(HISTORY_KEYS, as_index=False, observed=True).size()
     df_agg.columns = pd.Index(
         [
             "organization_id",
@@ -42,74 +70,145 @@ def history_length_per_professional(events: pd.DataFrame) -> pd.DataFrame:
     return df_agg.reset_index()
 
 
+def history_from_event_types(event_types: pd.DataFrame) -> pd.DataFrame:
+    # the table of history_length_per_professional, summed from the lengths per event type instead of the events
+    df_agg = event_types.groupby(HISTORY_KEYS, as_index=False, observed=True)["history_length"].sum()
+    return df_agg.reset_index()
+
+
 def calculate_bucket_size(events: pd.DataFrame) -> pd.DataFrame:
-    df_agg = events.groupby(["organization_id", "professional_cohort"]).agg(
-        {"history_length": ["size", "mean"]},
+    df_agg = events.groupby(["organization_id", "professional_cohort"], observed=True).agg(
+        {"history_length": ["size", "mean", "std"]},
         as_index=False,
     )
     df_agg.columns = pd.Index(
         [
             "bucket_size",
             "avg_history_length",
+            "std_history_length",
         ]
     )
     return df_agg.reset_index()
 
 
-def assign_sample_count(buckets: pd.DataFrame, sample_size: int) -> pd.DataFrame:
+def _ceil_allocation(
+    sizes: np.ndarray, avg_history_lengths: np.ndarray, sample_size: int
+) -> tuple[np.ndarray, np.ndarray]:
+    # Every bucket's proportional share rounded up, at least one, handed out from the largest down until the sample
+    # is full. The bucket that fills it gets what is left and the ones after it get nothing.
+    proportional = sizes / sizes.sum() * sample_size
+    expected = np.maximum(np.ceil(proportional), 1).astype(np.int64)
+
+    # a single sort, ties by average history length and then by share, all descending
+    order = np.lexsort((-proportional, -avg_history_lengths, -expected))
+    cumulative = np.cumsum(expected[order])
+    last = int(np.searchsorted(cumulative, sample_size, side="left"))
+
+    rows = order[: last + 1]
+    counts = expected[rows]
+    counts[-1] = sample_size - (cumulative[last] - counts[-1])
+    return rows, counts
+
+
+def _largest_remainder(
+    quotas: np.ndarray, sizes: np.ndarray, avg_history_lengths: np.ndarray, sample_size: int
+) -> np.ndarray:
+    # Every bucket gets the integer part of its quota, the samples left go one each to the largest fractional parts
+    counts: np.ndarray = np.floor(quotas).astype(np.int64)
+    left = sample_size - int(counts.sum())
+    remainders = np.where(counts < sizes, quotas - counts, -1.0)
+    ranked = np.lexsort((-sizes, -avg_history_lengths, -remainders))
+    counts[ranked[:left]] += 1
+    return counts
+
+
+def _neyman_quotas(sizes: np.ndarray, std_history_lengths: np.ndarray, sample_size: int) -> np.ndarray:
+    # Shares proportional to bucket size times the spread of the history lengths. A bucket whose share is more than
+    # its size is taken whole and the others share what is left, until every share fits.
+    weights = sizes * np.nan_to_num(std_history_lengths)
+    quotas = np.zeros(len(sizes))
+    whole = np.zeros(len(sizes), dtype=bool)
+    while True:
+        rest = ~whole
+        rest_weights = weights[rest]
+        if rest_weights.sum() == 0:
+            # no spread left to weigh by, e.g. only single professional buckets, fall back to proportional
+            rest_weights = sizes[rest].astype(float)
+
+        quotas[rest] = (sample_size - sizes[whole].sum()) * rest_weights / rest_weights.sum()
+        over = rest & (quotas > sizes)
+        if not over.any():
+            return quotas
+
+        whole |= over
+        quotas[over] = sizes[over]
+
+
+def assign_sample_count(buckets: pd.DataFrame, sample_size: int, strategy: str = "ceil") -> pd.DataFrame:
+    if strategy not in ALLOCATION_STRATEGIES:
+        err_msg = f"Unknown allocation strategy: {strategy}, expected one of {', '.join(ALLOCATION_STRATEGIES)}"
+        raise ValueError(err_msg)
+
     total = buckets["bucket_size"].sum()
     if sample_size >= total:
-        return buckets
-
-    buckets["proportion"] = buckets["bucket_size"] / total
-    buckets["proportional_expected_samples"] = buckets["proportion"] * sample_size
-
-    buckets = buckets.sort_values(by="proportional_expected_samples", ascending=False)
-    buckets["expected_samples"] = buckets["proportional_expected_samples"].apply(lambda x: math.ceil(x)).astype(int)
-
-    buckets["expected_samples"] = buckets["expected_samples"].apply(lambda x: x if x > 0 else 1)
-
-    # for the ones with the same value, sort by average history length descending
-    buckets = buckets.sort_values(by=["expected_samples", "avg_history_length"], ascending=False)
-
-    buckets["cumulative_samples"] = buckets["expected_samples"].cumsum()
-
-    mask_under_threshold = buckets["cumulative_samples"] < sample_size
-
-    first_over_threshold = mask_under_threshold.sum()
+        # not enough professionals to choose from, take all of them
+        return buckets.assign(expected_samples=buckets["bucket_size"])
+
+    sizes = buckets["bucket_size"].to_numpy(dtype=np.int64)
+    avg_history_lengths = buckets["avg_history_length"].to_numpy(dtype=float)
+
+    if strategy == "ceil":
+        rows, counts = _ceil_allocation(sizes, avg_history_lengths, sample_size)
+    else:
+        if strategy == "neyman":
+            if "std_history_length" not in buckets.columns:
+                err_msg = "Neyman allocation needs the std_history_length of calculate_bucket_size"
+                raise ValueError(err_msg)
+            quotas = _neyman_quotas(sizes, buckets["std_history_length"].to_numpy(dtype=float), sample_size)
+        else:
+            quotas = sizes / total * sample_size
+
+        allocated = _largest_remainder(quotas, sizes, avg_history_lengths, sample_size)
+        order = np.lexsort((-sizes, -avg_history_lengths, -allocated))
+        rows = order[allocated[order] > 0]
+        counts = allocated[rows]
+
+    if counts.sum() != sample_size:
+        err_msg = "The sum of the expected samples is not equal to the sample size"
+        raise ValueError(err_msg)
 
-    filtered_df = buckets.loc[
-        mask_under_threshold,
-        ["organization_id", "professional_cohort", "expected_samples"],
-    ]
+    return buckets[BUCKET_KEYS].iloc[rows].assign(expected_samples=counts)
 
-    last_entry = buckets.iloc[first_over_threshold : first_over_threshold + 1, :].copy()
-    last_entry["expected_samples"] = sample_size - (last_entry["cumulative_samples"] - last_entry["expected_samples"])
 
-    # concatenate to the filtered_df the row on index first_over_threshold
-    filtered_df = pd.concat(
-        [
-            filtered_df,
-            last_entry.loc[:, ["organization_id", "professional_cohort", "expected_samples"]],
-        ]
-    )
+def candidate_keys(candidates: pd.DataFrame, seed: int) -> np.ndarray:
+    # Every candidate gets a key in [0, 1) from a hash of its bucket and professional_id keyed with the run's seed.
+    # A key depends on the seed and the candidate only, so a single bucket can be re-drawn on its own and the draws
+    # do not depend on which other buckets or candidates exist or in which order they come. The hashes of all the
+    # candidates are computed at once, without a loop over the buckets.
+    hash_key = hashlib.blake2b(str(seed).encode(), digest_size=8).hexdigest()
+    hashes = pd.util.hash_pandas_object(candidates[[*BUCKET_KEYS, "professional_id"]], index=False, hash_key=hash_key)
+    # the top 53 bits, as many as a float holds exactly
+    keys: np.ndarray = (hashes.to_numpy() >> np.uint64(11)) * 2.0**-53
+    return keys
 
-    if filtered_df["expected_samples"].sum() != sample_size:
-        err_msg = "The sum of the expected samples is not equal to the sample size"
-        raise ValueError(err_msg)
 
-    return filtered_df
+def sample_from_bucket(
+    history: pd.DataFrame,
+    bucket: dict[str, Any],
+    sample_count: int,
+    seed: Optional[int] = None,
+) -> list[str]:
+    # Will return the professional_ids sampled from the bucket, the same ones sample_professionals draws for it
 
-
-def sample_from_bucket(history: pd.DataFrame, bucket: dict[str, Any], sample_count: int) -> list[str]:
-    # Will return the professional_ids sampled from the bucket
+    if seed is None:
+        seed = new_seed()
 
     condition = pd.Series([True] * len(history))
     for column, value in bucket.items():
         condition = condition & (history[column] == value)
 
     bucket_data = history[condition]
-    df = bucket_data.sample(n=sample_count)  # TODO: do something smarter here?
+    df = bucket_data.iloc[np.argsort(candidate_keys(bucket_data, seed), kind="stable")[:sample_count]]
 
     if len(df) != sample_count:
         err_msg = "The number of sampled professionals is not equal to the expected samples"
@@ -118,18 +217,31 @@ def sample_from_bucket(history: pd.DataFrame, bucket: dict[str, Any], sample_cou
     return df["professional_id"].to_list()
 
 
-def sample_professionals(history: pd.DataFrame, sampled_buckets: pd.DataFrame) -> list[str]:
-    sampled_professionals: list[str] = []
-    for row in sampled_buckets.itertuples():
-        bucket_definition = {
-            "organization_id": row.organization_id,
-            "professional_cohort": row.professional_cohort,
-        }
-        professionals = sample_from_bucket(history, bucket_definition, row.expected_samples)
+def sample_professionals(
+    history: pd.DataFrame,
+    sampled_buckets: pd.DataFrame,
+    seed: Optional[int] = None,
+) -> list[str]:
+    # Draws every bucket at once: each candidate gets its key from candidate_keys, and the expected_samples
+    # candidates with the lowest keys in each bucket are kept.
+    if seed is None:
+        seed = new_seed()
 
-        sampled_professionals.extend(professionals)
+    candidates = history[[*BUCKET_KEYS, "professional_id"]].merge(
+        sampled_buckets[[*BUCKET_KEYS, "expected_samples"]], on=BUCKET_KEYS
+    )
 
-    return sampled_professionals
+    bucket = candidates.groupby(BUCKET_KEYS, observed=True).ngroup().to_numpy()
+    ranked = candidates.iloc[np.lexsort((candidate_keys(candidates, seed), bucket))]
+    position_in_bucket = ranked.groupby(BUCKET_KEYS, observed=True).cumcount()
+    selected = ranked[position_in_bucket < ranked["expected_samples"]]
+
+    # a bucket with fewer professionals than expected comes up short
+    if len(selected) != sampled_buckets["expected_samples"].sum():
+        err_msg = "The number of sampled professionals is not equal to the expected samples"
+        raise ValueError(err_msg)
+
+    return selected["professional_id"].to_list()
 
 
 @dataclass
@@ -137,23 +249,163 @@ class Result:
     sampled_professionals: list[str]
     configuration: dict
     id_mappings: Mappings
-    samples: pd.DataFrame
+    # None when the anonymized dataset was streamed straight to disk
+    samples: Optional[pd.DataFrame]
+    # history lengths per professional in the sampling window, for everyone and for the output professionals
+    population_history: pd.DataFrame
+    sample_history: pd.DataFrame
+    # bucket sizes and average history lengths of the professionals that could be sampled
+    buckets: pd.DataFrame
+    # histograms of the history lengths per event type, see metrics.length_histogram, for everyone and for the
+    # output professionals, None when the run did not see every event of the window, e.g. incremental.sample_delta
+    population_event_types: Optional[pd.DataFrame] = None
+    sample_event_types: Optional[pd.DataFrame] = None
+
+    def save_to(
+        self,
+        output_dir: str,
+        mapping_store: Optional[MappingStore] = None,
+        output_format: str = "csv",
+        append: bool = False,
+    ) -> None:
+        # with append the samples are added to the dataset already in output_dir, see incremental.sample_delta
+        if not os.path.exists(f"{output_dir}/{STATE_DIR}"):
+            os.makedirs(f"{output_dir}/{STATE_DIR}")
+
+        # With append the dataset is added to first, the state, configuration and mappings of the run are only
+        # written once the append succeeded, so a failed append can be retried against the state it started from.
+        if append and self.samples is not None:
+            append_frame(self.samples, f"{output_dir}/sampled_anonymized_dataset", output_format)
+
+        with ThreadPoolExecutor() as executor:
+            futures = []
+            if mapping_store is None:
+                futures.append(
+                    executor.submit(write_json, self.id_mappings.to_dict(), f"{output_dir}/id_mappings.json")
+                )
+
+            futures.append(
+                executor.submit(
+                    write_column,
+                    self.sampled_professionals,
+                    "professional_id",
+                    f"{output_dir}/sampled_professionals.csv",
+                )
+            )
+
+            if self.samples is not None and not append:
+                futures.append(
+                    executor.submit(
+                        write_frame, self.samples, f"{output_dir}/sampled_anonymized_dataset", output_format
+                    )
+                )
+
+            # kept to update the run with later delta files instead of sampling again from scratch
+            futures.append(
+                executor.submit(
+                    write_frame,
+                    self.population_history[[*HISTORY_KEYS, "history_length"]],
+                    f"{output_dir}/{STATE_DIR}/population_history",
+                )
+            )
+            futures.append(executor.submit(write_frame, self.buckets, f"{output_dir}/{STATE_DIR}/buckets"))
+
+            if self.configuration:
+                futures.append(
+                    executor.submit(
+                        write_json, self.configuration, f"{output_dir}/arguments_to_sampler_function.json"
+                    )
+                )
+
+            for future in futures:
+                future.result()
+
+        # the store's connection belongs to this thread, the files are written concurrently. The mappings are only
+        # committed once every file is written, and only the ids this run added to its input mappings are inserted,
+        # the store already holds the others.
+        if mapping_store is not None:
+            input_mappings = Mappings(**self.configuration["input_mappings"])
+            mapping_store.append(self.id_mappings.added_to(input_mappings), wave=output_dir)
+
+
+def select_professionals(
+    history: pd.DataFrame,
+    buckets: pd.DataFrame,
+    output_sample_count: int,
+    ids_excluded_for_sampling: set[str],
+    seed: int,
+    profiler: Optional[Profiler] = None,
+    allocation: str = "ceil",
+) -> list[str]:
+    if profiler is None:
+        profiler = Profiler()
+
+    with profiler.stage("assign_sample_count", rows_in=len(buckets)) as stage:
+        sampled_buckets = assign_sample_count(buckets, output_sample_count, allocation)
+        stage.rows_out = len(sampled_buckets)
+
+    with profiler.stage("sampling", rows_in=len(history)) as stage:
+        sampled_professionals = sample_professionals(history, sampled_buckets, seed)
+        stage.rows_out = len(sampled_professionals)
+
+    if len(set(sampled_professionals) & ids_excluded_for_sampling) != 0:
+        err_msg = "Some sampled professionals were found in the excluded ids"
+        raise ValueError(err_msg)
 
-    def save_to(self, output_dir: str) -> None:
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+    return sampled_professionals
 
-        self.id_mappings.save_to_file(f"{output_dir}/id_mappings.json")
 
-        pd.DataFrame(self.sampled_professionals, columns=["professional_id"]).to_csv(
-            f"{output_dir}/sampled_professionals.csv", index=False
-        )
+def professionals_for_output(
+    sampled_professionals: list[str],
+    excluded_ids: Iterable[str],
+    mappings: Mappings,
+    include_all_in_output: bool,
+) -> list[str]:
+    professionals_in_output = sampled_professionals.copy()
+    if include_all_in_output:
+        professionals_in_output.extend(set(mappings.professionals.keys()))
+
+        # if something is in the excluded_ids, we remove it
+        professionals_in_output = list(set(professionals_in_output) - set(excluded_ids))
+
+    return professionals_in_output
 
-        self.samples.to_csv(f"{output_dir}/sampled_anonymized_dataset.csv", index=False)
 
-        if self.configuration:
-            with open(f"{output_dir}/arguments_to_sampler_function.json", "w") as file:
-                json.dump(self.configuration, file, indent=4)
+def extend_mapping(ids: Iterable[str], mapping: dict[str, str], key: Optional[bytes] = None) -> dict[str, str]:
+    missing = set(ids) - set(mapping.keys())
+    return {
+        **generate_anonymized_id_mapping(missing, existing_ids=mapping.values(), key=key),
+        **mapping,
+    }
+
+
+def new_seed() -> int:
+    return int(np.random.SeedSequence().entropy)
+
+
+def sampler_configuration(
+    after: date,
+    until: date,
+    excluded_ids: Iterable[str],
+    output_sample_count: int,
+    include_all_in_output: bool,
+    mappings: Mappings,
+    seed: int,
+    id_key: Optional[bytes] = None,
+    allocation: str = "ceil",
+) -> dict:
+    return {
+        "after": after.isoformat(),
+        "until": until.isoformat(),
+        "excluded_ids": excluded_ids,
+        "output_sample_count": output_sample_count,
+        "include_all_in_output": include_all_in_output,
+        "input_mappings": mappings.to_dict(),
+        "seed": seed,
+        # the key itself is a secret and is never written out
+        "deterministic_ids": id_key is not None,
+        "allocation": allocation,
+    }
 
 
 def sample(
@@ -164,7 +416,16 @@ def sample(
     excluded_ids: Optional[Iterable[str]] = None,
     mappings: Optional[Mappings] = None,
     include_all_in_output: bool = False,
+    id_key: Optional[bytes] = None,
+    seed: Optional[int] = None,
+    profiler: Optional[Profiler] = None,
+    engine: str = "pandas",
+    allocation: str = "ceil",
+    event_store: Optional[EventStore] = None,
 ) -> Result:
+    # the engines build on the functions of this module
+    from sampler.engines import get_engine
+
     if not after:
         after = date(2022, 1, 1)
 
@@ -177,43 +438,59 @@ def sample(
     if not excluded_ids:
         excluded_ids = []
 
-    ids_excluded_for_sampling = set(excluded_ids).union(set(mappings.professionals.keys()))
-    filtered_for_sampling = filter_events(df, after, until, ids_excluded_for_sampling)
-    history = history_length_per_professional(filtered_for_sampling)
-    buckets = calculate_bucket_size(history)
-    sampled_buckets = assign_sample_count(buckets, output_sample_count)
-
-    sampled_professionals = sample_professionals(history, sampled_buckets)
-
-    if len(set(sampled_professionals) & set(ids_excluded_for_sampling)) != 0:
-        err_msg = "Some sampled professionals were found in the excluded ids"
-        raise ValueError(err_msg)
+    if seed is None:
+        seed = new_seed()
 
-    professionals_in_output = sampled_professionals.copy()
-    if include_all_in_output:
-        professionals_in_output.extend(set(mappings.professionals.keys()))
+    if profiler is None:
+        profiler = Profiler()
 
-        # if something is in the excluded_ids, we remove it
-        professionals_in_output = list(set(professionals_in_output) - set(excluded_ids))
+    compute = get_engine(engine)
 
-    # filter again without the mapped ids
-    filtered = filter_events(df, after, until, excluded_ids)
-    selected_entries = filtered[filtered["professional_id"].isin(professionals_in_output)]
-    organization_ids = set(selected_entries["organization_id"].to_list())
-
-    missing_organizations = organization_ids - set(mappings.organizations.keys())
-    organizations_mappings = {
-        **generate_anonymized_id_mapping(missing_organizations),
-        **mappings.organizations,
-    }
+    ids_excluded_for_sampling = set(excluded_ids).union(set(mappings.professionals.keys()))
+    with profiler.stage("filter", rows_in=len(df)) as stage:
+        filtered = compute.filter_events(df, after, until, excluded_ids)
+        filtered_rows = compute.count_events(filtered)
+        stage.rows_out = filtered_rows
+
+    with profiler.stage("history", rows_in=filtered_rows) as stage:
+        population_history, event_types = compute.histories(filtered)
+        # exclusions are per professional, so the sampling history is the population history without the mapped ids
+        history = exclude_professionals(population_history, mappings.professionals.keys())
+        stage.rows_out = len(history)
+
+    with profiler.stage("buckets", rows_in=len(history)) as stage:
+        buckets = compute.calculate_bucket_size(history)
+        stage.rows_out = len(buckets)
+
+    sampled_professionals = select_professionals(
+        history, buckets, output_sample_count, ids_excluded_for_sampling, seed, profiler, allocation
+    )
+    professionals_in_output = professionals_for_output(
+        sampled_professionals, excluded_ids, mappings, include_all_in_output
+    )
 
-    missing_professionals = set(sampled_professionals) - set(mappings.professionals.keys())
-    professionals_mappings = {
-        **generate_anonymized_id_mapping(missing_professionals),
-        **mappings.professionals,
-    }
+    with profiler.stage("event_types", rows_in=len(event_types)) as stage:
+        in_output = event_types["professional_id"].isin(professionals_in_output)
+        population_event_types = length_histogram(event_types, ["event_type"])
+        sample_event_types = length_histogram(event_types[in_output], ["event_type"])
+        stage.rows_out = len(event_types)
+
+    with profiler.stage("anonymization", rows_in=filtered_rows) as stage:
+        if event_store is not None:
+            # only the events of the output professionals are visited, instead of every filtered event
+            selected_entries = time_window(event_store.take(df, professionals_in_output), after, until)
+        else:
+            selected_entries = compute.select_events(filtered, professionals_in_output)
+
+        organizations_mappings = extend_mapping(
+            selected_entries["organization_id"].to_list(), mappings.organizations, id_key
+        )
+        professionals_mappings = extend_mapping(sampled_professionals, mappings.professionals, id_key)
 
-    anonymized_selected_entries = anonymize_dataset(selected_entries, professionals_mappings, organizations_mappings)
+        anonymized_selected_entries = anonymize_dataset(
+            selected_entries, professionals_mappings, organizations_mappings
+        )
+        stage.rows_out = len(anonymized_selected_entries)
 
     return Result(
         sampled_professionals=sampled_professionals,
@@ -222,14 +499,23 @@ def sample(
             organizations=organizations_mappings,
             professionals=professionals_mappings,
         ),
-        configuration=(
-            {
-                "after": after.isoformat(),
-                "until": until.isoformat(),
-                "excluded_ids": excluded_ids,
-                "output_sample_count": output_sample_count,
-                "include_all_in_output": include_all_in_output,
-                "input_mappings": mappings.to_dict(),
-            }
-        ),
+        configuration={
+            **sampler_configuration(
+                after,
+                until,
+                excluded_ids,
+                output_sample_count,
+                include_all_in_output,
+                mappings,
+                seed,
+                id_key,
+                allocation,
+            ),
+            "engine": engine,
+        },
+        population_history=population_history,
+        sample_history=population_history[population_history["professional_id"].isin(professionals_in_output)],
+        buckets=buckets,
+        population_event_types=population_event_types,
+        sample_event_types=sample_event_types,
     )
@@ -0,0 +1,71 @@
+import sys
+import time
+import tracemalloc
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+
+@dataclass
+class Stage:
+    name: str
+    rows_in: Optional[int] = None
+    rows_out: Optional[int] = None
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    # high water mark of the whole process at the end of the stage, it never goes down
+    peak_rss_bytes: Optional[int] = None
+    # peak of the memory allocated during the stage, only when tracemalloc is tracing (python -X tracemalloc)
+    traced_peak_bytes: Optional[int] = None
+    # the steps of a pipelined stage, see pipeline.StepReport
+    pipeline: Optional[list[dict]] = None
+
+
+def peak_rss_bytes() -> Optional[int]:
+    if sys.platform == "win32":
+        return None
+
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Profiler:
+    # Records the time, memory and row counts of the stages of a run. Scopes share the stages of their parent and
+    # prefix the names, e.g. the stages of every wave.
+    def __init__(self, prefix: str = "", stages: Optional[list[Stage]] = None):
+        self.prefix = prefix
+        self.stages: list[Stage] = [] if stages is None else stages
+
+    def scope(self, name: str) -> "Profiler":
+        return Profiler(f"{self.prefix}{name}/", self.stages)
+
+    @contextmanager
+    def stage(self, name: str, rows_in: Optional[int] = None) -> Iterator[Stage]:
+        record = Stage(f"{self.prefix}{name}", rows_in=rows_in)
+
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            traced_start = tracemalloc.get_traced_memory()[0]
+
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record.wall_seconds = time.perf_counter() - wall_start
+            record.cpu_seconds = time.process_time() - cpu_start
+            record.peak_rss_bytes = peak_rss_bytes()
+            if tracing:
+                record.traced_peak_bytes = tracemalloc.get_traced_memory()[1] - traced_start
+            self.stages.append(record)
+
+    def to_dict(self) -> dict:
+        return {
+            "stages": [asdict(stage) for stage in self.stages],
+            "wall_seconds": sum(stage.wall_seconds for stage in self.stages),
+            "cpu_seconds": sum(stage.cpu_seconds for stage in self.stages),
+        }
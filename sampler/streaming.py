@@ -0,0 +1,244 @@
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass
+from datetime import date
+from typing import Optional
+
+import pandas as pd
+
+from sampler.config import Mappings
+from sampler.keys import HISTORY_KEYS
+from sampler.mapping_store import MappingStore
+from sampler.metrics import event_type_history, length_histogram, merge_event_type_histories
+from sampler.parser import iter_raw_events, validate_events
+from sampler.pipeline import StepReport, run_steps
+from sampler.privacy import anonymize_dataset
+from sampler.process import (
+    Result,
+    calculate_bucket_size,
+    exclude_professionals,
+    extend_mapping,
+    filter_events,
+    history_length_per_professional,
+    new_seed,
+    professionals_for_output,
+    sampler_configuration,
+    select_professionals,
+)
+from sampler.profiling import Profiler
+from sampler.writers import Compression, atomic_path
+
+
+def merge_histories(histories: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    frames = [history[[*HISTORY_KEYS, "history_length"]] for history in histories]
+    # chunks without matching events would otherwise decide the dtypes of the merged columns
+    df = pd.concat([frame for frame in frames if len(frame)] or frames[:1])
+    return df.groupby(HISTORY_KEYS, as_index=False, observed=True).agg(history_length=("history_length", "sum"))
+
+
+def accumulate_history(history: Optional[pd.DataFrame], events: pd.DataFrame) -> pd.DataFrame:
+    chunk_history = history_length_per_professional(events)
+    if history is None:
+        return merge_histories([chunk_history])
+    return merge_histories([history, chunk_history])
+
+
+def history_pass(
+    filename: str,
+    chunksize: int,
+    after: date,
+    until: date,
+    excluded_ids: Iterable[str],
+    queue_size: Optional[int] = None,
+) -> tuple[Optional[pd.DataFrame], Optional[pd.DataFrame], int, list[StepReport]]:
+    # the history lengths per professional, and per professional and event type for the reports
+    population_history: Optional[pd.DataFrame] = None
+    event_types: Optional[pd.DataFrame] = None
+    rows = 0
+
+    def validate(chunk: pd.DataFrame) -> pd.DataFrame:
+        nonlocal rows
+        rows += len(chunk)
+        return validate_events(chunk)
+
+    def chunk_history(events: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+        filtered = filter_events(events, after, until, excluded_ids)
+        return history_length_per_professional(filtered), event_type_history(filtered)
+
+    def accumulate(histories: tuple[pd.DataFrame, pd.DataFrame]) -> None:
+        nonlocal population_history, event_types
+        history, chunk_event_types = histories
+        population_history = merge_histories([history] if population_history is None else [population_history, history])
+        event_types = (
+            chunk_event_types if event_types is None else merge_event_type_histories([event_types, chunk_event_types])
+        )
+
+    reports = run_steps(
+        "read",
+        iter_raw_events(filename, chunksize),
+        [("validate", validate), ("history", chunk_history), ("accumulate", accumulate)],
+        queue_size,
+    )
+    return population_history, event_types, rows, reports
+
+
+def pipeline_report(reports: list[StepReport], queue_size: Optional[int]) -> Optional[list[dict]]:
+    # steps run one after the other have no queues to report on
+    return [asdict(report) for report in reports] if queue_size is not None else None
+
+
+@dataclass
+class OutputWindow:
+    after: date
+    until: date
+    excluded_ids: Iterable[str]
+    professionals_in_output: list[str]
+
+
+def output_pass(
+    filename: str,
+    chunksize: int,
+    window: OutputWindow,
+    mappings: Mappings,
+    id_key: Optional[bytes],
+    output_filename: str,
+    compression: Compression = None,
+    queue_size: Optional[int] = None,
+) -> tuple[dict[str, str], int, list[StepReport]]:
+    # writes the anonymized events of the output professionals, the organizations get ids as they come up
+    organizations_mappings = mappings.organizations
+    rows_out = 0
+    header = True
+
+    def anonymize(events: pd.DataFrame) -> pd.DataFrame:
+        nonlocal organizations_mappings
+        filtered = filter_events(events, window.after, window.until, window.excluded_ids)
+        selected_entries = filtered[filtered["professional_id"].isin(window.professionals_in_output)]
+
+        organizations_mappings = extend_mapping(
+            selected_entries["organization_id"].to_list(), organizations_mappings, id_key
+        )
+        return anonymize_dataset(selected_entries, mappings.professionals, organizations_mappings)
+
+    def write(anonymized: pd.DataFrame) -> None:
+        nonlocal rows_out, header
+        # compressed chunks are appended as separate gzip members or zstd frames, which readers concatenate
+        anonymized.to_csv(
+            output_filename, mode="w" if header else "a", header=header, index=False, compression=compression
+        )
+        header = False
+        rows_out += len(anonymized)
+
+    reports = run_steps(
+        "read",
+        iter_raw_events(filename, chunksize),
+        [("validate", validate_events), ("anonymize", anonymize), ("write", write)],
+        queue_size,
+    )
+    return organizations_mappings, rows_out, reports
+
+
+def sample_streaming(
+    filename: str,
+    output_sample_count: int,
+    output_filename: str,
+    chunksize: int = 1_000_000,
+    after: Optional[date] = None,
+    until: Optional[date] = None,
+    excluded_ids: Optional[Iterable[str]] = None,
+    mappings: Optional[Mappings] = None,
+    include_all_in_output: bool = False,
+    id_key: Optional[bytes] = None,
+    compression: Compression = None,
+    seed: Optional[int] = None,
+    profiler: Optional[Profiler] = None,
+    allocation: str = "ceil",
+    pipeline_queue_size: Optional[int] = None,
+    mapping_store: Optional[MappingStore] = None,
+) -> Result:
+    # Same selection as process.sample, but the events are read twice in chunks and never held in memory at once:
+    # the first pass only keeps the per professional history lengths, the second pass writes the anonymized events
+    # of the selected professionals straight to output_filename. With pipeline_queue_size the steps of each pass
+    # overlap, see pipeline.run_steps. With a mapping_store the mappings are the stored ones of the ids in the
+    # window, looked up once the first pass found them.
+    if not after:
+        after = date(2022, 1, 1)
+
+    if not until:
+        until = date.today()
+
+    if not mappings:
+        mappings = Mappings({}, {})
+
+    if not excluded_ids:
+        excluded_ids = []
+
+    if seed is None:
+        seed = new_seed()
+
+    if profiler is None:
+        profiler = Profiler()
+
+    # the chunks are parsed, filtered and counted together, so the first pass is a single stage
+    with profiler.stage("history") as stage:
+        population_history, event_types, rows, reports = history_pass(
+            filename, chunksize, after, until, excluded_ids, pipeline_queue_size
+        )
+        stage.rows_in = rows
+        stage.pipeline = pipeline_report(reports, pipeline_queue_size)
+
+        if population_history is None or event_types is None:
+            err_msg = f"No events found in {filename}"
+            raise ValueError(err_msg)
+
+        if mapping_store is not None:
+            mappings = mapping_store.mappings_for(
+                population_history["organization_id"].unique(), population_history["professional_id"].unique()
+            )
+        ids_excluded_for_sampling = set(excluded_ids).union(set(mappings.professionals.keys()))
+        history = exclude_professionals(population_history, mappings.professionals.keys())
+        stage.rows_out = len(history)
+
+    with profiler.stage("buckets", rows_in=len(history)) as stage:
+        buckets = calculate_bucket_size(history)
+        stage.rows_out = len(buckets)
+
+    sampled_professionals = select_professionals(
+        history, buckets, output_sample_count, ids_excluded_for_sampling, seed, profiler, allocation
+    )
+    professionals_in_output = professionals_for_output(
+        sampled_professionals, excluded_ids, mappings, include_all_in_output
+    )
+
+    professionals_mappings = extend_mapping(sampled_professionals, mappings.professionals, id_key)
+
+    with profiler.stage("anonymization", rows_in=rows) as stage, atomic_path(output_filename) as tmp_filename:
+        organizations_mappings, stage.rows_out, reports = output_pass(
+            filename,
+            chunksize,
+            OutputWindow(after, until, excluded_ids, professionals_in_output),
+            Mappings(mappings.organizations, professionals_mappings),
+            id_key,
+            tmp_filename,
+            compression,
+            pipeline_queue_size,
+        )
+        stage.pipeline = pipeline_report(reports, pipeline_queue_size)
+
+    return Result(
+        sampled_professionals=sampled_professionals,
+        samples=None,
+        id_mappings=Mappings(
+            organizations=organizations_mappings,
+            professionals=professionals_mappings,
+        ),
+        configuration=sampler_configuration(
+            after, until, excluded_ids, output_sample_count, include_all_in_output, mappings, seed, id_key, allocation
+        ),
+        population_history=population_history,
+        sample_history=population_history[population_history["professional_id"].isin(professionals_in_output)],
+        buckets=buckets,
+        population_event_types=length_histogram(event_types, ["event_type"]),
+        sample_event_types=length_histogram(
+            event_types[event_types["professional_id"].isin(professionals_in_output)], ["event_type"]
+        ),
+    )
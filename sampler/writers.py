@@ -0,0 +1,101 @@
+import csv
+import json
+import os
+import tempfile
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Literal, Optional
+
+if TYPE_CHECKING:
+    # only used in annotations, so the CLI can read OUTPUT_FORMATS without importing pandas
+    import pandas as pd
+
+Compression = Optional[Literal["gzip", "zstd"]]
+
+CSV_COMPRESSION: dict[str, Compression] = {
+    "csv": None,
+    "csv.gz": "gzip",
+    "csv.zst": "zstd",
+}
+OUTPUT_FORMATS = [*CSV_COMPRESSION, "parquet", "arrow"]
+
+# os.umask can only be read by setting it, which is done once here instead of from the writer threads
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+@contextmanager
+def atomic_path(filename: str) -> Iterator[str]:
+    # Yields a temporary path in the same directory that replaces filename once the block succeeds,
+    # so a crash never leaves a half written file under the final name.
+    directory, basename = os.path.split(filename)
+    fd, tmp_filename = tempfile.mkstemp(dir=directory or ".", prefix=f".{basename}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        yield tmp_filename
+        # mkstemp creates the file readable by the owner only, outputs get the usual permissions
+        os.chmod(tmp_filename, 0o666 & ~_UMASK)
+        os.replace(tmp_filename, filename)
+    finally:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+
+
+def write_frame(df: "pd.DataFrame", basename: str, output_format: str = "csv", chunksize: int = 100_000) -> str:
+    if output_format not in OUTPUT_FORMATS:
+        err_msg = f"Unknown output format: {output_format}, expected one of {', '.join(OUTPUT_FORMATS)}"
+        raise ValueError(err_msg)
+
+    filename = f"{basename}.{output_format}"
+    with atomic_path(filename) as tmp_filename:
+        if output_format in CSV_COMPRESSION:
+            df.to_csv(
+                tmp_filename,
+                index=False,
+                chunksize=chunksize,
+                compression=CSV_COMPRESSION[output_format],
+            )
+        elif output_format == "parquet":
+            df.to_parquet(tmp_filename, index=False)
+        else:
+            from pyarrow import feather
+
+            feather.write_feather(df.reset_index(drop=True), tmp_filename)
+
+    return filename
+
+
+def append_frame(df: "pd.DataFrame", basename: str, output_format: str = "csv") -> str:
+    # Appends the rows to an earlier write_frame output. Compressed rows are added as a new gzip member or
+    # zstd frame, the columnar formats cannot be appended to. A failed append truncates the file back to its size
+    # before the write, so it leaves the earlier output as it was.
+    if output_format not in CSV_COMPRESSION:
+        err_msg = f"Only CSV output can be appended to, expected one of {', '.join(CSV_COMPRESSION)}"
+        raise ValueError(err_msg)
+
+    filename = f"{basename}.{output_format}"
+    if not os.path.exists(filename):
+        err_msg = f"No output to append to: {filename}"
+        raise FileNotFoundError(err_msg)
+
+    size = os.path.getsize(filename)
+    try:
+        df.to_csv(filename, mode="a", header=False, index=False, compression=CSV_COMPRESSION[output_format])
+    except BaseException:
+        os.truncate(filename, size)
+        raise
+
+    return filename
+
+
+def write_column(values: Iterable[str], column: str, filename: str) -> None:
+    with atomic_path(filename) as tmp_filename, open(tmp_filename, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow([column])
+        writer.writerows([value] for value in values)
+
+
+def write_json(data: Any, filename: str) -> None:
+    with atomic_path(filename) as tmp_filename, open(tmp_filename, "w") as file:
+        # id sets may come in as sets or dict keys
+        json.dump(data, file, indent=4, default=list)
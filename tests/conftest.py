@@ -0,0 +1,9 @@
+import pandas as pd
+import pytest
+
+from sampler.parser import parse_events
+
+
+@pytest.fixture
+def dataset() -> pd.DataFrame:
+    return parse_events("./tests/data/example_data_20240306.csv")
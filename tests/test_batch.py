@@ -0,0 +1,69 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from sampler.batch import read_waves, sample_waves
+from sampler.config import config_files
+from sampler.profiling import Profiler
+
+
+def test_config_files_expands_directories_in_wave_order(tmp_path: str) -> None:
+    for name in ["wave_10.json", "wave_2.json", "wave_1.json", "notes.txt"]:
+        with open(f"{tmp_path}/{name}", "w") as file:
+            file.write("{}")
+
+    assert config_files([str(tmp_path), "./tests/data/config.json"]) == [
+        f"{tmp_path}/wave_1.json",
+        f"{tmp_path}/wave_2.json",
+        f"{tmp_path}/wave_10.json",
+        "./tests/data/config.json",
+    ]
+
+
+def wave_files(directory: str, names: list[str]) -> list[str]:
+    filenames = []
+    for name in names:
+        os.makedirs(os.path.dirname(f"{directory}/{name}"), exist_ok=True)
+        shutil.copy("./tests/data/config.json", f"{directory}/{name}")
+        filenames.append(f"{directory}/{name}")
+    return filenames
+
+
+def test_read_waves_rejects_duplicate_names(tmp_path: str) -> None:
+    with pytest.raises(ValueError, match="wave_1"):
+        read_waves(wave_files(str(tmp_path), ["a/wave_1.json", "b/wave_1.json"]))
+
+
+def test_sample_waves_yields_each_wave_before_drawing_the_next(dataset: pd.DataFrame, tmp_path: str) -> None:
+    waves = read_waves(wave_files(str(tmp_path), ["wave_1.json", "wave_2.json"]))
+    for wave in waves:
+        wave.config.number_of_samples = 20
+    profiler = Profiler()
+
+    results = sample_waves(dataset, waves, profiler=profiler)
+    first_wave, _ = next(results)
+
+    assert first_wave.name == "wave_1"
+    assert {stage.name.split("/")[0] for stage in profiler.stages} == {"wave_1"}
+
+
+def test_sample_waves_chains_mappings(dataset: pd.DataFrame, tmp_path: str) -> None:
+    waves = read_waves(wave_files(str(tmp_path), ["wave_1.json", "wave_2.json"]))
+    for wave in waves:
+        wave.config.number_of_samples = 20
+
+    (first_wave, first), (_, second) = sample_waves(dataset, waves)
+
+    assert first_wave.name == "wave_1"
+    assert len(first.sampled_professionals) == 20
+    assert len(second.sampled_professionals) == 20
+    assert not set(first.sampled_professionals) & set(second.sampled_professionals)
+
+    # the second wave keeps the anonymized ids handed out by the first
+    for professional in first.sampled_professionals:
+        assert second.id_mappings.professionals[professional] == first.id_mappings.professionals[professional]
+    assert set(second.id_mappings.professionals) == set(first.sampled_professionals) | set(
+        second.sampled_professionals
+    )
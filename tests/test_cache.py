@@ -0,0 +1,53 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from sampler.cache import cache_filename, file_digest
+from sampler.parser import PARSER_VERSION, parse_events
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def events_file(tmp_path: str) -> str:
+    filename = f"{tmp_path}/events.csv"
+    shutil.copy("./tests/data/example_data_20240306.csv", filename)
+    return filename
+
+
+def test_writes_and_reads_cache(events_file: str) -> None:
+    parsed = parse_events(events_file, cache=True)
+    path = cache_filename(events_file, file_digest(events_file), PARSER_VERSION)
+
+    assert os.path.exists(path)
+    pd.testing.assert_frame_equal(parse_events(events_file, cache=True), parsed)
+
+
+def test_loads_from_cache_without_parsing(events_file: str) -> None:
+    parsed = parse_events(events_file, cache=True)
+    path = cache_filename(events_file, file_digest(events_file), PARSER_VERSION)
+
+    # a cache hit never touches the CSV parser, so a marker row only shows up after a rebuild
+    parsed.head(1).to_feather(path)
+
+    assert len(parse_events(events_file, cache=True)) == 1
+    assert len(parse_events(events_file, cache=True, rebuild_cache=True)) == len(parsed)
+
+
+def test_invalidates_stale_cache(events_file: str) -> None:
+    parse_events(events_file, cache=True)
+    stale = cache_filename(events_file, file_digest(events_file), PARSER_VERSION)
+
+    with open(events_file, "a") as file:
+        file.write(
+            "ae124611-d5d9-4fb6-a63e-f4580ea52d16,30c91a7c-ce2f-452a-9d8b-9a7f89332727,"
+            "2019-01-01,2024-01-05T09:45:43,message_sent\n"
+        )
+
+    parsed = parse_events(events_file, cache=True)
+
+    assert not os.path.exists(stale)
+    assert os.path.exists(cache_filename(events_file, file_digest(events_file), PARSER_VERSION))
+    assert len(parsed) == len(parse_events(events_file))
@@ -0,0 +1,67 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from sampler.engines import ENGINES, get_engine
+from sampler.keys import HISTORY_KEYS
+from sampler.process import assign_sample_count, sample
+
+AFTER, UNTIL = date(2022, 1, 1), date(2024, 4, 1)
+EXCLUDED_IDS = ["8e129b1d-43bc-4d70-ad2f-dd924c0b3b03", "a7ca0a93-e198-4300-ba0b-d77cf6716827"]
+OPTIONAL_DEPENDENCY = {"arrow": "pyarrow", "duckdb": "duckdb"}
+
+
+@pytest.fixture(params=[name for name in ENGINES if name != "pandas"])
+def engine(request: pytest.FixtureRequest) -> str:
+    pytest.importorskip(OPTIONAL_DEPENDENCY[request.param])
+    return str(request.param)
+
+
+def as_strings(df: pd.DataFrame) -> pd.DataFrame:
+    return df.reset_index(drop=True).astype({column: object for column in df.columns if column in HISTORY_KEYS})
+
+
+def test_engine_matches_pandas_stages(dataset: pd.DataFrame, engine: str) -> None:
+    reference, compute = get_engine("pandas"), get_engine(engine)
+
+    expected = reference.filter_events(dataset, AFTER, UNTIL, EXCLUDED_IDS)
+    filtered = compute.filter_events(dataset, AFTER, UNTIL, EXCLUDED_IDS)
+    assert compute.count_events(filtered) == reference.count_events(expected)
+
+    expected_history = reference.history_length_per_professional(expected)[[*HISTORY_KEYS, "history_length"]]
+    history = compute.history_length_per_professional(filtered)
+    pd.testing.assert_frame_equal(as_strings(history), as_strings(expected_history))
+
+    keys = [*HISTORY_KEYS, "event_type"]
+    expected_event_types = reference.event_type_history(expected)
+    event_types = compute.event_type_history(filtered)
+    pd.testing.assert_frame_equal(
+        as_strings(event_types).astype({"event_type": object}),
+        as_strings(expected_event_types[[*keys, "history_length"]]).astype({"event_type": object}),
+    )
+
+    expected_buckets = reference.calculate_bucket_size(expected_history)
+    buckets = compute.calculate_bucket_size(history)
+    pd.testing.assert_frame_equal(as_strings(buckets), as_strings(expected_buckets))
+    pd.testing.assert_frame_equal(
+        as_strings(assign_sample_count(buckets, 30)), as_strings(assign_sample_count(expected_buckets, 30))
+    )
+
+
+def test_engine_samples_like_pandas(dataset: pd.DataFrame, engine: str) -> None:
+    options = {"after": AFTER, "until": UNTIL, "excluded_ids": EXCLUDED_IDS, "seed": 11, "id_key": b"parity"}
+    expected = sample(dataset, 30, **options)
+    result = sample(dataset, 30, engine=engine, **options)
+
+    assert result.sampled_professionals == expected.sampled_professionals
+    assert result.id_mappings == expected.id_mappings
+    assert result.samples is not None
+    assert expected.samples is not None
+    pd.testing.assert_frame_equal(as_strings(result.samples), as_strings(expected.samples))
+    assert result.configuration == {**expected.configuration, "engine": engine}
+
+
+def test_unknown_engine() -> None:
+    with pytest.raises(ValueError, match="Unknown engine"):
+        get_engine("spark")
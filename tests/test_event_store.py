@@ -0,0 +1,102 @@
+import os
+import shutil
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sampler.cache import file_digest
+from sampler.event_store import (
+    build_event_store,
+    event_store_filename,
+    load_event_store,
+    read_event_store,
+    write_event_store,
+)
+from sampler.parser import PARSER_VERSION, parse_events
+from sampler.process import filter_events, index_by_time, sample, time_window
+
+AFTER, UNTIL = date(2022, 1, 1), date(2024, 4, 1)
+
+
+def some_professionals(events: pd.DataFrame, count: int) -> list[str]:
+    professionals = events["professional_id"].astype(str).unique()
+    return list(np.random.default_rng(0).choice(professionals, count, replace=False))
+
+
+def test_offsets_give_the_history_lengths(dataset: pd.DataFrame) -> None:
+    store = build_event_store(dataset)
+
+    expected = dataset.groupby("professional_id", observed=True).size()
+    assert store.history_lengths().to_dict() == expected.to_dict()
+    assert store.offsets[-1] == len(dataset)
+
+
+def test_take_matches_isin(dataset: pd.DataFrame) -> None:
+    store = build_event_store(dataset)
+    professionals = [*some_professionals(dataset, 20), "not-a-professional"]
+
+    expected = dataset[dataset["professional_id"].isin(professionals)]
+    pd.testing.assert_frame_equal(store.take(dataset, professionals), expected)
+    assert store.take(dataset, []).empty
+
+
+def test_take_on_time_ordered_events(dataset: pd.DataFrame) -> None:
+    events = index_by_time(dataset)
+    store = build_event_store(events)
+    professionals = some_professionals(dataset, 20)
+
+    expected = filter_events(events, AFTER, UNTIL)
+    expected = expected[expected["professional_id"].isin(professionals)]
+    pd.testing.assert_frame_equal(time_window(store.take(events, professionals), AFTER, UNTIL), expected)
+
+
+def test_take_rejects_other_events(dataset: pd.DataFrame) -> None:
+    store = build_event_store(dataset)
+
+    with pytest.raises(ValueError, match="event store"):
+        store.take(dataset.iloc[1:], some_professionals(dataset, 1))
+
+
+def test_sample_with_event_store(dataset: pd.DataFrame) -> None:
+    options = {"after": AFTER, "until": UNTIL, "seed": 5, "id_key": b"store", "include_all_in_output": True}
+    expected = sample(dataset, 30, **options)
+    result = sample(dataset, 30, event_store=build_event_store(dataset), **options)
+
+    assert result.samples is not None
+    assert expected.samples is not None
+    pd.testing.assert_frame_equal(result.samples, expected.samples)
+
+
+def test_store_round_trips(dataset: pd.DataFrame, tmp_path: str) -> None:
+    pytest.importorskip("pyarrow")
+    store = build_event_store(dataset)
+    path = f"{tmp_path}/events.arrow"
+
+    write_event_store(store, path)
+    loaded = read_event_store(path)
+
+    pd.testing.assert_index_equal(loaded.professional_ids, store.professional_ids, exact=False)
+    np.testing.assert_array_equal(loaded.offsets, store.offsets)
+    np.testing.assert_array_equal(loaded.rows, store.rows)
+
+
+def test_store_is_kept_next_to_the_cached_parse(tmp_path: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    pytest.importorskip("pyarrow")
+    filename = f"{tmp_path}/events.csv"
+    shutil.copy("./tests/data/example_data_20240306.csv", filename)
+    events = parse_events(filename, cache=True)
+
+    store = load_event_store(filename, events, cache=True)
+    path = event_store_filename(filename, file_digest(filename), PARSER_VERSION)
+    assert os.path.exists(path)
+    np.testing.assert_array_equal(load_event_store(filename, events, cache=True).rows, store.rows)
+
+    # the digest comes with the cached parse, the input is not hashed again
+    monkeypatch.setattr("sampler.event_store.file_digest", lambda filename: pytest.fail("hashed the input again"))
+    np.testing.assert_array_equal(load_event_store(filename, parse_events(filename, cache=True), cache=True).rows, store.rows)
+
+    # rebuilding the cached parse removes the store built on it
+    parse_events(filename, cache=True, rebuild_cache=True)
+    assert not os.path.exists(path)
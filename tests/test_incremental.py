@@ -0,0 +1,104 @@
+import json
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from sampler.incremental import read_state, sample_delta
+from sampler.process import calculate_bucket_size, filter_events, history_length_per_professional, sample
+
+AFTER, UNTIL = date(2022, 1, 1), date(2024, 4, 1)
+
+
+def split_export(dataset: pd.DataFrame, cut: str) -> tuple[pd.DataFrame, pd.DataFrame]:
+    before = dataset["ts"] < pd.Timestamp(cut)
+    return dataset[before], dataset[~before]
+
+
+def test_delta_matches_full_history(dataset: pd.DataFrame, tmp_path: str) -> None:
+    previous, delta = split_export(dataset, "2023-06-01")
+    output_dir = f"{tmp_path}/run"
+
+    first = sample(previous, 30, AFTER, UNTIL, seed=7)
+    first.save_to(output_dir)
+    result = sample_delta(delta, output_dir)
+    result.save_to(output_dir, append=True)
+
+    full_history = history_length_per_professional(filter_events(dataset, AFTER, UNTIL)).drop(columns="index")
+    population_history, buckets = read_state(output_dir)
+    pd.testing.assert_frame_equal(population_history, full_history.astype(population_history.dtypes.to_dict()))
+    expected_buckets = calculate_bucket_size(full_history)
+    pd.testing.assert_frame_equal(buckets, expected_buckets.astype(buckets.dtypes.to_dict()))
+
+    # the sample is kept and topped up with professionals the first run never saw, the new events of all of them
+    # are appended to the dataset written by the first run
+    drawn = result.sampled_professionals[len(first.sampled_professionals) :]
+    assert result.sampled_professionals[: len(first.sampled_professionals)] == first.sampled_professionals
+    assert drawn
+    assert not set(drawn) & set(first.population_history["professional_id"])
+    samples = pd.read_csv(f"{output_dir}/sampled_anonymized_dataset.csv")
+    sampled_events = filter_events(dataset, AFTER, UNTIL)["professional_id"].isin(result.sampled_professionals)
+    assert len(samples) == sampled_events.sum()
+    assert set(samples["professional_id"]) == {
+        result.id_mappings.professionals[p] for p in result.sampled_professionals
+    }
+
+    with open(f"{output_dir}/arguments_to_sampler_function.json") as file:
+        configuration = json.load(file)
+    assert configuration["seed"] == 7
+    assert configuration["deltas"] == [
+        {"until": UNTIL.isoformat(), "events": len(filter_events(delta, AFTER, UNTIL)), "sampled": len(drawn)}
+    ]
+
+
+def test_delta_only_recomputes_changed_buckets(dataset: pd.DataFrame, tmp_path: str) -> None:
+    organization = dataset["organization_id"].iloc[0]
+    in_organization = dataset["organization_id"] == organization
+    previous = dataset[~in_organization | (dataset["ts"] < pd.Timestamp("2023-06-01"))]
+    delta = dataset[in_organization & (dataset["ts"] >= pd.Timestamp("2023-06-01"))]
+
+    first = sample(previous, 30, AFTER, UNTIL)
+    first.save_to(str(tmp_path))
+    result = sample_delta(delta, str(tmp_path))
+
+    changed = result.buckets["organization_id"] == organization
+    unchanged_before = first.buckets[first.buckets["organization_id"] != organization]
+    assert result.buckets[~changed]["bucket_size"].to_list() == unchanged_before["bucket_size"].to_list()
+    assert result.samples is not None
+    assert (result.samples["organization_id"] == first.id_mappings.organizations.get(organization)).all()
+
+
+def test_delta_keeps_the_sampling_rate(dataset: pd.DataFrame, tmp_path: str) -> None:
+    previous, delta = split_export(dataset, "2023-06-01")
+    first = sample(previous, 30, AFTER, UNTIL, seed=7)
+    first.save_to(str(tmp_path))
+    result = sample_delta(delta, str(tmp_path))
+
+    # the affected buckets are drawn at the rate of the first run, only the new professionals can fill them up
+    rate = len(first.sampled_professionals) / len(first.population_history)
+    assert len(result.sampled_professionals) / len(result.population_history) == pytest.approx(rate, abs=0.05)
+    assert sample_delta(delta, str(tmp_path)).sampled_professionals == result.sampled_professionals
+
+
+def test_delta_rejects_a_shorter_window(dataset: pd.DataFrame, tmp_path: str) -> None:
+    sample(dataset, 30, AFTER, UNTIL).save_to(str(tmp_path))
+
+    with pytest.raises(ValueError, match="cannot end before"):
+        sample_delta(dataset.iloc[:0], str(tmp_path), until=date(2023, 1, 1))
+
+
+def test_delta_cannot_append_to_columnar_output(dataset: pd.DataFrame, tmp_path: str) -> None:
+    previous, delta = split_export(dataset, "2023-06-01")
+    sample(previous, 30, AFTER, UNTIL).save_to(str(tmp_path))
+
+    with open(f"{tmp_path}/arguments_to_sampler_function.json") as file:
+        configuration = file.read()
+    population_history, _ = read_state(str(tmp_path))
+
+    with pytest.raises(ValueError, match="Only CSV output"):
+        sample_delta(delta, str(tmp_path)).save_to(str(tmp_path), output_format="parquet", append=True)
+
+    # the failed append leaves the run as it was, so it can be retried
+    with open(f"{tmp_path}/arguments_to_sampler_function.json") as file:
+        assert file.read() == configuration
+    pd.testing.assert_frame_equal(read_state(str(tmp_path))[0], population_history)
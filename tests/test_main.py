@@ -0,0 +1,158 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from sampler import planning
+from sampler.config import Mappings
+from sampler.main import main
+from sampler.mapping_store import MappingStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FILENAME = f"{ROOT}/tests/data/example_data_20240306.csv"
+CONFIG = f"{ROOT}/tests/data/config.json"
+HEAVY_MODULES = ["numpy", "pandas", "pyarrow"]
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        ["--help"],
+        ["sample", "--help"],
+        ["check_config", CONFIG],
+        ["mappings", f"{ROOT}/tests/data/id_mappings.json"],
+    ],
+)
+def test_light_commands_do_not_import_pandas(argv: list[str]) -> None:
+    script = (
+        "import sys\n"
+        "from sampler.main import main\n"
+        "try:\n"
+        f"    main({argv!r})\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        f"print([module for module in {HEAVY_MODULES!r} if module in sys.modules])\n"
+    )
+    completed = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", script],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=ROOT,
+        env={**os.environ, "PYTHONPATH": ROOT},
+    )
+
+    assert completed.stdout.strip().splitlines()[-1] == "[]"
+
+
+def test_sample_is_the_default_command(tmp_path: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+
+    assert main([FILENAME, "--config", CONFIG, "--seed", "5"]) == 0
+
+    (output_dir,) = os.listdir(f"{tmp_path}/out")
+    with open(f"{tmp_path}/out/{output_dir}/arguments_to_sampler_function.json") as file:
+        assert json.load(file)["seed"] == 5
+
+
+def test_delta_rejects_columnar_output(tmp_path: str, capsys: pytest.CaptureFixture) -> None:
+    with pytest.raises(SystemExit):
+        main([FILENAME, "--delta", str(tmp_path), "--output_format", "parquet"])
+
+    assert "--delta can only append to CSV output" in capsys.readouterr().err
+
+
+def test_store_rejects_json_mappings(tmp_path: str, capsys: pytest.CaptureFixture) -> None:
+    with pytest.raises(SystemExit):
+        main(
+            [
+                FILENAME,
+                "--config",
+                CONFIG,
+                "--id_mapping_store",
+                f"{tmp_path}/mappings.sqlite",
+                "--id_mappings",
+                f"{ROOT}/tests/data/id_mappings.json",
+            ]
+        )
+
+    assert "--id_mappings cannot be used with --id_mapping_store" in capsys.readouterr().err
+    assert not os.path.exists(f"{tmp_path}/mappings.sqlite")
+
+
+def test_store_runs_exclude_earlier_waves(tmp_path: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    store = f"{tmp_path}/mappings.sqlite"
+    config = f"{tmp_path}/config.json"
+    with open(config, "w") as file:
+        json.dump({"number_of_samples": 30, "start_period": "2022-01-01", "end_period": "2024-04-01"}, file)
+
+    assert main([FILENAME, "--config", config, "--id_mapping_store", store]) == 0
+    with MappingStore(store) as first:
+        first_professionals = set(first.original_ids("professionals"))
+
+    assert main([FILENAME, "--config", config, "--id_mapping_store", store]) == 0
+    with MappingStore(store) as second:
+        professionals = set(second.original_ids("professionals"))
+
+    assert len(first_professionals) == 30
+    assert len(professionals) == 60
+
+
+@pytest.mark.parametrize("chunks", [[], ["--chunksize", "1000"]])
+def test_plan_uses_the_stored_mappings(tmp_path: str, monkeypatch: pytest.MonkeyPatch, chunks: list[str]) -> None:
+    monkeypatch.chdir(tmp_path)
+    store = f"{tmp_path}/mappings.sqlite"
+    config = f"{tmp_path}/config.json"
+    with open(config, "w") as file:
+        json.dump({"number_of_samples": 30, "start_period": "2022-01-01", "end_period": "2024-04-01"}, file)
+    assert main([FILENAME, "--config", config, "--id_mapping_store", store]) == 0
+
+    planned: list[Mappings] = []
+    monkeypatch.setattr(
+        planning, "build_plan", lambda history, count, excluded, mappings, *args, **kwargs: planned.append(mappings)
+    )
+    monkeypatch.setattr(planning, "print_plan", lambda plan: None)
+    assert main([FILENAME, "--config", config, "--plan", "--id_mapping_store", store, *chunks]) == 0
+
+    # the organizations in the window get their stored ids, like in a sampling run
+    with MappingStore(store) as stored:
+        (mappings,) = planned
+        assert mappings.organizations
+        assert mappings.organizations.items() <= stored.to_mappings().organizations.items()
+
+
+def test_check_config_reports_invalid_files(tmp_path: str, capsys: pytest.CaptureFixture) -> None:
+    with open(f"{tmp_path}/backwards.json", "w") as file:
+        json.dump({"number_of_samples": 10, "start_period": "2024-01-01", "end_period": "2023-01-01"}, file)
+    with open(f"{tmp_path}/missing.json", "w") as file:
+        json.dump({"number_of_samples": 10}, file)
+
+    assert main(["check_config", CONFIG]) == 0
+    assert main(["check_config", str(tmp_path)]) == 1
+
+    output = capsys.readouterr().out
+    assert "end_period is before start_period" in output
+    assert "missing.json: invalid" in output
+
+
+def test_mappings_counts_a_store_per_wave(tmp_path: str, capsys: pytest.CaptureFixture) -> None:
+    with MappingStore(f"{tmp_path}/mappings.sqlite") as store:
+        store.import_json(f"{ROOT}/tests/data/id_mappings.json", wave="wave_1")
+
+    assert main(["mappings", f"{tmp_path}/mappings.sqlite"]) == 0
+    assert capsys.readouterr().out.splitlines() == [
+        "organizations: 2",
+        "  wave_1: 2",
+        "professionals: 2",
+        "  wave_1: 2",
+    ]
+
+
+def test_mappings_does_not_create_a_missing_store(tmp_path: str, capsys: pytest.CaptureFixture) -> None:
+    assert main(["mappings", f"{tmp_path}/typo.sqlite"]) == 1
+
+    assert "typo.sqlite" in capsys.readouterr().err
+    assert not os.path.exists(f"{tmp_path}/typo.sqlite")
@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+from sampler.config import Mappings
+from sampler.mapping_store import MappingStore
+from sampler.parser import parse_events
+from sampler.process import sample
+
+
+@pytest.fixture
+def store(tmp_path: str) -> MappingStore:
+    return MappingStore(f"{tmp_path}/id_mappings.sqlite")
+
+
+def test_imports_and_exports_json(store: MappingStore, tmp_path: str) -> None:
+    store.import_json("./tests/data/id_mappings.json")
+    store.export_json(f"{tmp_path}/exported.json")
+
+    assert Mappings.load_from_file(f"{tmp_path}/exported.json") == Mappings.load_from_file(
+        "./tests/data/id_mappings.json"
+    )
+
+
+def test_appends_waves(store: MappingStore) -> None:
+    store.append(Mappings({"org1": "a"}, {"prof1": "b"}), wave="wave_1")
+    store.append(Mappings({"org1": "a"}, {"prof1": "b", "prof2": "c"}), wave="wave_2")
+
+    assert store.lookup("professionals", "prof2") == "c"
+    assert store.lookup("professionals", "prof3") is None
+    assert sorted(store.original_ids("professionals")) == ["prof1", "prof2"]
+    assert store.to_mappings() == Mappings({"org1": "a"}, {"prof1": "b", "prof2": "c"})
+
+
+def test_persists_between_connections(store: MappingStore, tmp_path: str) -> None:
+    store.append(Mappings({"org1": "a"}, {"prof1": "b"}), wave="wave_1")
+    store.close()
+
+    with MappingStore(f"{tmp_path}/id_mappings.sqlite") as reopened:
+        assert reopened.lookup("organizations", "org1") == "a"
+
+
+def test_rejects_remapping_an_id(store: MappingStore) -> None:
+    store.append(Mappings({}, {"prof1": "b"}), wave="wave_1")
+
+    with pytest.raises(ValueError):
+        store.append(Mappings({}, {"prof1": "c", "prof2": "d"}), wave="wave_2")
+
+    # the failed wave is rolled back as a whole
+    assert store.lookup("professionals", "prof2") is None
+
+
+def test_rejects_anonymized_id_collision(store: MappingStore) -> None:
+    store.append(Mappings({}, {"prof1": "b"}), wave="wave_1")
+
+    with pytest.raises(ValueError):
+        store.append(Mappings({}, {"prof2": "b"}), wave="wave_2")
+
+
+def test_rejects_unknown_kind(store: MappingStore) -> None:
+    with pytest.raises(ValueError):
+        store.lookup("patients", "prof1")
+
+
+def test_result_saves_to_store(store: MappingStore, tmp_path: str) -> None:
+    result = sample(parse_events("./tests/data/example_data_20240306.csv"), 10)
+    result.save_to(f"{tmp_path}/out", store)
+
+    assert not os.path.exists(f"{tmp_path}/out/id_mappings.json")
+    assert store.to_mappings() == result.id_mappings
+
+
+def test_result_failing_to_save_leaves_the_store(store: MappingStore, tmp_path: str) -> None:
+    result = sample(parse_events("./tests/data/example_data_20240306.csv"), 10)
+
+    with pytest.raises(ValueError, match="Unknown output format"):
+        result.save_to(f"{tmp_path}/out", store, output_format="xlsx")
+
+    assert store.to_mappings() == Mappings({}, {})
+
+
+def test_looks_up_only_the_given_ids(store: MappingStore) -> None:
+    store.append(Mappings({"org1": "a", "org2": "b"}, {"prof1": "c", "prof2": "d"}), wave="wave_1")
+
+    assert store.lookup_many("professionals", ["prof2", "prof3", "prof2"]) == {"prof2": "d"}
+    assert store.mappings_for(["org1"], []) == Mappings({"org1": "a"}, {})
+
+
+def test_result_appends_only_the_ids_it_added(
+    store: MappingStore, tmp_path: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    events = parse_events("./tests/data/example_data_20240306.csv")
+    sample(events, 10).save_to(f"{tmp_path}/wave_1", store)
+
+    mappings = store.mappings_for(events["organization_id"].unique(), events["professional_id"].unique())
+    result = sample(events, 10, mappings=mappings, excluded_ids=store.original_ids("professionals"))
+    appended: list[Mappings] = []
+    append = store.append
+    monkeypatch.setattr(store, "append", lambda mappings, wave: appended.append(mappings) or append(mappings, wave))
+    result.save_to(f"{tmp_path}/wave_2", store)
+
+    (added,) = appended
+    assert len(added.professionals) == 10
+    assert not set(added.organizations) & set(mappings.organizations)
+    assert store.wave_counts("professionals") == {f"{tmp_path}/wave_1": 10, f"{tmp_path}/wave_2": 10}
+    assert store.mappings_for(result.id_mappings.organizations, result.id_mappings.professionals) == result.id_mappings
@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sampler.keys import BUCKET_KEYS
+from sampler.metrics import (
+    PERCENTILES,
+    compare_average_history_length,
+    compare_history_length_per_key,
+    compare_percentiles_history_length,
+    compare_summaries,
+    event_type_history,
+    length_histogram,
+    merge_histograms,
+    summarize_histogram,
+)
+from sampler.parser import parse_events
+
+
+@pytest.fixture
+def histories() -> tuple[pd.DataFrame, pd.DataFrame]:
+    original = pd.DataFrame({"professional_id": ["a", "b", "c", "d"], "history_length": [1, 2, 3, 10]})
+    return original, original.iloc[2:]
+
+
+def test_compare_average_history_length(
+    histories: tuple[pd.DataFrame, pd.DataFrame], capsys: pytest.CaptureFixture
+) -> None:
+    compare_average_history_length(*histories)
+
+    assert capsys.readouterr().out.splitlines() == ["Original: 4.0", "Sampled: 6.5", "Diff: 2.5"]
+
+
+def test_compare_percentiles_history_length(
+    histories: tuple[pd.DataFrame, pd.DataFrame], capsys: pytest.CaptureFixture
+) -> None:
+    compare_percentiles_history_length(*histories)
+
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 10
+    assert lines[5].split() == ["4", "50", "2.5", "6.5", "4.0"]
+
+
+def random_history(rng: np.random.Generator) -> pd.DataFrame:
+    count = int(rng.integers(1, 2000))
+    return pd.DataFrame(
+        {
+            "organization_id": rng.choice(["a", "b", "c"], count),
+            "professional_cohort": rng.choice(["2019-01-01", "2023-01-01"], count),
+            "history_length": np.minimum(rng.geometric(0.02, count), 5000),
+        }
+    )
+
+
+def test_summary_is_exact() -> None:
+    for seed in range(50):
+        history = random_history(np.random.default_rng(seed))
+
+        summary = summarize_histogram(length_histogram(history)).iloc[0]
+
+        assert summary["professionals"] == len(history)
+        assert summary["average"] == history["history_length"].mean()
+        expected = np.percentile(history["history_length"], PERCENTILES)
+        assert summary[[f"p{percentile}" for percentile in PERCENTILES]].to_list() == expected.tolist()
+
+
+def test_merged_histograms_summarize_like_the_whole() -> None:
+    history = random_history(np.random.default_rng(1))
+    # e.g. the histories of the organization shards of sample_parallel, or the slices of a large history
+    parts = [length_histogram(part) for _, part in history.groupby("organization_id")]
+
+    pd.testing.assert_frame_equal(
+        summarize_histogram(merge_histograms(parts)), summarize_histogram(length_histogram(history))
+    )
+
+
+def test_summary_per_bucket() -> None:
+    history = random_history(np.random.default_rng(2))
+
+    summary = summarize_histogram(length_histogram(history, BUCKET_KEYS))
+
+    for row in summary.itertuples():
+        bucket = history[
+            (history["organization_id"] == row.organization_id)
+            & (history["professional_cohort"] == row.professional_cohort)
+        ]["history_length"]
+        assert row.professionals == len(bucket)
+        assert row.average == bucket.mean()
+        assert row.p50 == np.percentile(bucket, 50)
+
+
+def test_summary_per_event_type_from_chunks() -> None:
+    events = parse_events("./tests/data/example_data_20240306.csv")
+
+    history = None
+    for start in range(0, len(events), 1000):
+        history = event_type_history(events.iloc[start : start + 1000], history)
+    assert history is not None
+
+    expected = summarize_histogram(length_histogram(event_type_history(events), ["event_type"]))
+    summary = summarize_histogram(length_histogram(history, ["event_type"]))
+    pd.testing.assert_frame_equal(summary.astype({"event_type": object}), expected.astype({"event_type": object}))
+    assert summary["events"].sum() == len(events)
+
+
+def test_compare_summaries_per_bucket() -> None:
+    history = random_history(np.random.default_rng(3))
+    sampled = history[history["organization_id"] == "a"]
+
+    comparison = compare_summaries(length_histogram(history, BUCKET_KEYS), length_histogram(sampled, BUCKET_KEYS))
+
+    assert len(comparison) == len(history.groupby(BUCKET_KEYS))
+    assert comparison.loc[comparison["organization_id"] == "b", "professionals_sample"].isna().all()
+    in_sample = comparison["organization_id"] == "a"
+    assert (comparison.loc[in_sample, "p50_full"] == comparison.loc[in_sample, "p50_sample"]).all()
+
+
+def test_compare_history_length_per_key(capsys: pytest.CaptureFixture) -> None:
+    history = random_history(np.random.default_rng(4))
+    sampled = history[history["organization_id"] != "c"]
+
+    compare_history_length_per_key(length_histogram(history, BUCKET_KEYS), length_histogram(sampled, BUCKET_KEYS))
+
+    lines = capsys.readouterr().out.splitlines()
+    columns = ["professionals_full", "professionals_sample", "average_full", "average_sample", "p50_full", "p50_sample"]
+    assert lines[0].split() == [*BUCKET_KEYS, *columns]
+    assert len(lines) == len(history.groupby(BUCKET_KEYS)) + 1
+
+
+def test_empty_history_has_no_percentiles(capsys: pytest.CaptureFixture) -> None:
+    history = pd.DataFrame({"professional_id": ["a"], "history_length": [3]})
+
+    compare_percentiles_history_length(history, history.iloc[:0])
+
+    assert capsys.readouterr().out.splitlines()[1].split() == ["0", "10", "3.0", "NaN", "NaN"]
@@ -0,0 +1,61 @@
+from datetime import date
+
+import pandas as pd
+
+from sampler.metrics import summarize_histogram
+from sampler.parallel import sample_parallel, shard_by_organization
+from sampler.process import sample
+
+
+def test_shard_by_organization(dataset: pd.DataFrame) -> None:
+    shards = shard_by_organization(dataset, 3)
+
+    assert sum(len(shard) for shard in shards) == len(dataset)
+    organizations = [set(shard["organization_id"].to_list()) for shard in shards]
+    assert not organizations[0] & organizations[1]
+    assert not organizations[1] & organizations[2]
+
+
+def test_sample_parallel_does_not_depend_on_worker_count(dataset: pd.DataFrame) -> None:
+    args = {"after": date(2022, 1, 1), "until": date(2024, 4, 1), "seed": 3}
+    single = sample_parallel(dataset, 30, workers=1, **args)
+    multiple = sample_parallel(dataset, 30, workers=3, **args)
+
+    assert len(single.sampled_professionals) == 30
+    assert single.sampled_professionals == multiple.sampled_professionals
+    assert len(single.samples) == len(multiple.samples)
+    assert len(set(multiple.samples["professional_id"].to_list())) == 30
+
+
+def test_sample_parallel_matches_sample(dataset: pd.DataFrame) -> None:
+    args = {"after": date(2022, 1, 1), "until": date(2024, 4, 1), "seed": 3}
+
+    assert sample_parallel(dataset, 30, workers=2, **args).sampled_professionals == sorted(
+        sample(dataset, 30, **args).sampled_professionals
+    )
+
+
+def test_sample_parallel_with_mappings(dataset: pd.DataFrame) -> None:
+    args = {"after": date(2022, 1, 1), "until": date(2024, 4, 1)}
+    first = sample_parallel(dataset, 30, workers=2, **args)
+    second = sample_parallel(dataset, 30, workers=2, mappings=first.id_mappings, include_all_in_output=True, **args)
+
+    assert not set(first.sampled_professionals) & set(second.sampled_professionals)
+    assert len(set(second.samples["professional_id"].to_list())) == 60
+
+
+def test_shard_event_types_merge_like_sample(dataset: pd.DataFrame) -> None:
+    args = {"after": date(2022, 1, 1), "until": date(2024, 4, 1), "seed": 3}
+    expected = sample(dataset, 30, **args)
+    result = sample_parallel(dataset, 30, workers=3, **args)
+
+    for histogram, expected_histogram in [
+        (result.population_event_types, expected.population_event_types),
+        (result.sample_event_types, expected.sample_event_types),
+    ]:
+        assert histogram is not None
+        assert expected_histogram is not None
+        pd.testing.assert_frame_equal(
+            summarize_histogram(histogram).astype({"event_type": object}),
+            summarize_histogram(expected_histogram).astype({"event_type": object}),
+        )
@@ -1,8 +1,17 @@
+from functools import partial
+
+import pandas as pd
 import pytest
 
 from sampler.parser import (
+    CATEGORICAL_COLUMNS,
+    COLUMNS,
     WrongColumnNameError,
     WrongColumnTypeError,
+    as_iso_timestamp,
+    as_str,
+    as_yyyymmdd,
+    byte_ranges,
     parse_events,
 )
 
@@ -34,3 +43,59 @@ class TestLogDataParser:
             parse_events("./tests/data/wrong_column_type_ts.csv")
 
         assert e.value.column == "ts"
+
+    def test_reports_offending_row_and_value(self) -> None:
+        with pytest.raises(WrongColumnTypeError) as e:
+            parse_events("./tests/data/wrong_column_type_ts.csv")
+
+        assert e.value.row == 1
+        assert "2021-01-05" in str(e.value.error)
+
+    def test_matches_converter_parsing(self) -> None:
+        filename = "./tests/data/example_data_20240306.csv"
+        expected = pd.read_csv(
+            filename,
+            converters={
+                "organization_id": partial(as_str, "organization_id"),
+                "professional_id": partial(as_str, "professional_id"),
+                "professional_cohort": partial(as_yyyymmdd, "professional_cohort"),
+                "ts": partial(as_iso_timestamp, "ts"),
+                "event_type": partial(as_str, "event_type"),
+            },
+        )
+
+        parsed = parse_events(filename)
+
+        assert (parsed.dtypes[CATEGORICAL_COLUMNS] == "category").all()
+        pd.testing.assert_frame_equal(parsed.astype(dict.fromkeys(CATEGORICAL_COLUMNS, object)), expected)
+
+
+class TestParallelParser:
+    def test_matches_sequential_parsing(self) -> None:
+        filename = "./tests/data/example_data_20240306.csv"
+
+        pd.testing.assert_frame_equal(parse_events(filename, workers=3), parse_events(filename))
+
+    def test_byte_ranges_cover_every_row_once(self) -> None:
+        filename = "./tests/data/example_data_20240306.csv"
+        columns, ranges = byte_ranges(filename, 4)
+
+        assert columns == COLUMNS
+        assert len(ranges) == 4
+        assert all(end == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+
+    def test_reports_row_in_whole_file(self, tmp_path: str) -> None:
+        filename = f"{tmp_path}/events.csv"
+        df = pd.read_csv("./tests/data/example_data_20240306.csv", dtype=str)
+        df.loc[6000, "ts"] = "2021-01-05"
+        df.to_csv(filename, index=False)
+
+        with pytest.raises(WrongColumnTypeError) as e:
+            parse_events(filename, workers=4)
+
+        assert e.value.column == "ts"
+        assert e.value.row == 6000
+
+    def test_raises_on_invalid_column_name(self) -> None:
+        with pytest.raises(WrongColumnNameError):
+            parse_events("./tests/data/wrong_column_name.csv", workers=2)
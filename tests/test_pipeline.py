@@ -0,0 +1,57 @@
+import threading
+import time
+from collections.abc import Iterator
+
+import pytest
+
+from sampler.pipeline import run_steps
+
+
+@pytest.mark.parametrize("queue_size", [None, 1, 3])
+def test_steps_keep_the_order(queue_size: int) -> None:
+    output: list[int] = []
+
+    reports = run_steps("read", range(100), [("double", lambda x: 2 * x), ("collect", output.append)], queue_size)
+
+    assert output == [2 * x for x in range(100)]
+    assert [report.name for report in reports] == ["read", "double", "collect"]
+    assert all(report.chunks == 100 for report in reports)
+
+
+def test_slow_step_holds_back_the_reader() -> None:
+    read = 0
+    in_flight: list[int] = []
+
+    def source() -> Iterator[int]:
+        nonlocal read
+        for chunk in range(20):
+            read += 1
+            yield chunk
+
+    def slow(chunk: int) -> None:
+        # the chunks read but not written yet, which the queues must bound
+        in_flight.append(read - chunk)
+        time.sleep(0.01)
+
+    reports = run_steps("read", source(), [("pass", lambda x: x), ("slow", slow)], queue_size=2)
+
+    # one chunk in each step plus two in each queue
+    assert max(in_flight) <= 2 * 2 + 3
+    slow_report = reports[-1]
+    assert slow_report.max_queue_occupancy == 2
+    assert slow_report.mean_queue_occupancy > 1
+    assert reports[0].output_wait_seconds > 0
+
+
+def test_failing_step_stops_the_pipeline() -> None:
+    def fail(chunk: int) -> int:
+        if chunk == 5:
+            err_msg = "bad chunk"
+            raise ValueError(err_msg)
+        return chunk
+
+    with pytest.raises(ValueError, match="bad chunk"):
+        run_steps("read", range(1000), [("fail", fail), ("sink", lambda x: None)], queue_size=2)
+
+    # every step has stopped, none is left waiting on a queue
+    assert not any(thread.name in {"read", "fail", "sink"} for thread in threading.enumerate())
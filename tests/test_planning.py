@@ -0,0 +1,68 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from sampler.config import Mappings
+from sampler.planning import plan, plan_streaming
+from sampler.process import (
+    assign_sample_count,
+    calculate_bucket_size,
+    filter_events,
+    history_length_per_professional,
+    sample,
+)
+
+FILENAME = "./tests/data/example_data_20240306.csv"
+AFTER, UNTIL = date(2022, 1, 1), date(2024, 4, 1)
+
+
+def test_plan_allocates_like_sample(dataset: pd.DataFrame) -> None:
+    result = plan(dataset, 30, AFTER, UNTIL)
+
+    history = history_length_per_professional(filter_events(dataset, AFTER, UNTIL))
+    expected = assign_sample_count(calculate_bucket_size(history), 30)
+    assert result.allocation["expected_samples"].to_list() == expected["expected_samples"].to_list()
+    assert result.allocation["expected_samples"].sum() == 30
+    assert result.professionals == len(history)
+
+    assert result.output_events == pytest.approx(
+        (result.allocation["expected_samples"] * result.allocation["avg_history_length"]).sum()
+    )
+    assert result.output_bytes > 0
+    assert result.memory_bytes > 0
+
+
+def test_plan_is_exact_when_everyone_is_sampled(dataset: pd.DataFrame) -> None:
+    result = plan(dataset, 1000, AFTER, UNTIL)
+    samples = sample(dataset, 1000, AFTER, UNTIL).samples
+
+    assert samples is not None
+    assert result.output_events == pytest.approx(len(samples))
+    assert result.output_bytes == pytest.approx(len(samples.to_csv(index=False, header=False).encode()), rel=0.01)
+
+
+def test_plan_counts_the_included_professionals(dataset: pd.DataFrame) -> None:
+    history = history_length_per_professional(filter_events(dataset, AFTER, UNTIL))
+    mapped = history["professional_id"].iloc[:2].to_list()
+    mappings = Mappings({}, {professional: f"anonymized-{professional}" for professional in mapped})
+
+    without = plan(dataset, 30, AFTER, UNTIL, mappings=mappings)
+    with_included = plan(dataset, 30, AFTER, UNTIL, mappings=mappings, include_all_in_output=True)
+
+    # the mapped professionals are never sampled, but their events are added to the output
+    assert with_included.professionals == len(history) - 2
+    included_events = history.loc[history["professional_id"].isin(mapped), "history_length"].sum()
+    assert with_included.output_events == pytest.approx(without.output_events + included_events)
+
+
+def test_plan_streaming_matches_plan(dataset: pd.DataFrame) -> None:
+    streamed = plan_streaming(FILENAME, 30, chunksize=1000, after=AFTER, until=UNTIL)
+    result = plan(dataset, 30, AFTER, UNTIL)
+
+    pd.testing.assert_frame_equal(
+        streamed.allocation.astype({"organization_id": object}),
+        result.allocation.astype({"organization_id": object}),
+    )
+    assert streamed.output_events == pytest.approx(result.output_events)
+    assert streamed.memory_bytes < result.memory_bytes
@@ -0,0 +1,108 @@
+import os
+from uuid import UUID
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sampler.privacy import anonymize_dataset, format_uuid4, generate_anonymized_id_mapping
+
+
+@pytest.fixture
+def events() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "organization_id": ["org1", "org1", "org2"],
+            "professional_id": ["prof1", "prof2", "prof3"],
+            "event_type": ["message_sent", "message_sent", "feedback_sent"],
+        }
+    )
+
+
+def test_anonymize_dataset(events: pd.DataFrame) -> None:
+    res = anonymize_dataset(
+        events,
+        {"prof1": "a", "prof2": "b", "prof3": "c"},
+        {"org1": "x", "org2": "y"},
+    )
+
+    assert res["professional_id"].to_list() == ["a", "b", "c"]
+    assert res["organization_id"].to_list() == ["x", "x", "y"]
+
+
+def test_anonymize_categorical_dataset(events: pd.DataFrame) -> None:
+    events = events.astype("category")
+    # the unused "prof4" category has no mapping and must not leak into the output categories
+    events["professional_id"] = events["professional_id"].cat.add_categories(["prof4"])
+
+    res = anonymize_dataset(
+        events,
+        {"prof1": "a", "prof2": "b", "prof3": "c"},
+        {"org1": "x", "org2": "y"},
+    )
+
+    assert res["professional_id"].to_list() == ["a", "b", "c"]
+    assert set(res["professional_id"].cat.categories) == {"a", "b", "c"}
+    assert res["organization_id"].to_list() == ["x", "x", "y"]
+
+
+def test_anonymize_dataset_raises_on_missing_mapping(events: pd.DataFrame) -> None:
+    with pytest.raises(ValueError):
+        anonymize_dataset(events, {"prof1": "a", "prof2": "b"}, {"org1": "x", "org2": "y"})
+
+
+def test_anonymize_dataset_raises_when_mapped_id_is_an_original_id(events: pd.DataFrame) -> None:
+    with pytest.raises(ValueError):
+        anonymize_dataset(events, {"prof1": "prof2", "prof2": "b", "prof3": "c"}, {"org1": "x", "org2": "y"})
+
+
+def test_anonymize_dataset_with_larger_mapping(events: pd.DataFrame) -> None:
+    professional_id_mapping = {f"old{i}": f"anon{i}" for i in range(10_000)}
+    professional_id_mapping.update({"prof1": "a", "prof2": "b", "prof3": "c"})
+
+    res = anonymize_dataset(events, professional_id_mapping, {"org1": "x", "org2": "y"})
+
+    assert res["professional_id"].to_list() == ["a", "b", "c"]
+
+
+def test_generate_anonymized_id_mapping() -> None:
+    mapping = generate_anonymized_id_mapping(["prof1", "prof2", "prof2", "prof3"])
+
+    assert set(mapping.keys()) == {"prof1", "prof2", "prof3"}
+    assert len(set(mapping.values())) == 3
+    assert all(UUID(value).version == 4 for value in mapping.values())
+
+
+def test_generate_keyed_anonymized_id_mapping_is_deterministic() -> None:
+    first = generate_anonymized_id_mapping(["prof1", "prof2"], key=b"secret")
+    second = generate_anonymized_id_mapping(["prof2", "prof1"], key=b"secret")
+    other_key = generate_anonymized_id_mapping(["prof1", "prof2"], key=b"other secret")
+
+    assert first == second
+    assert first["prof1"] != other_key["prof1"]
+    assert all(UUID(value).version == 4 for value in first.values())
+
+
+def test_format_uuid4_matches_uuid() -> None:
+    raw = np.frombuffer(os.urandom(16 * 100), dtype=np.uint8).reshape(100, 16).copy()
+
+    formatted = format_uuid4(raw)
+
+    # raw now carries the version and variant bits
+    assert formatted == [str(UUID(bytes=row.tobytes())) for row in raw]
+    assert all(UUID(value).version == 4 for value in formatted)
+
+
+def test_generate_keyed_anonymized_id_mapping_takes_long_keys() -> None:
+    long_key = os.urandom(100)
+
+    assert generate_anonymized_id_mapping(["prof1"], key=long_key) == generate_anonymized_id_mapping(
+        ["prof1"], key=long_key
+    )
+
+
+def test_generate_anonymized_id_mapping_raises_on_collision_with_existing_ids() -> None:
+    existing = generate_anonymized_id_mapping(["prof1"], key=b"secret")
+
+    with pytest.raises(ValueError):
+        generate_anonymized_id_mapping(["prof1"], existing_ids=existing.values(), key=b"secret")
@@ -1,27 +1,27 @@
+import math
 from datetime import date
 
 import numpy as np
 import pandas as pd
 import pytest
 
-from sampler.parser import parse_events
+from sampler.metrics import event_type_history
 from sampler.process import (
+    ALLOCATION_STRATEGIES,
     assign_sample_count,
     calculate_bucket_size,
     filter_events,
+    history_from_event_types,
     history_length_per_professional,
+    index_by_time,
     sample,
     sample_from_bucket,
     sample_professionals,
+    time_window,
 )
 from sampler.utils import bucketize_cohort
 
 
-@pytest.fixture
-def dataset() -> pd.DataFrame:
-    return parse_events("./tests/data/example_data_20240306.csv")
-
-
 class TestFilter:
     def test_filters_by_date(self, dataset: pd.DataFrame) -> None:
         filtered = filter_events(dataset, date(2023, 4, 3), date(2023, 4, 6))
@@ -54,6 +54,25 @@ class TestFilter:
             )
         ).all()
 
+    def test_filters_by_date_on_time_index(self, dataset: pd.DataFrame) -> None:
+        indexed = index_by_time(dataset.sample(frac=1, random_state=1))
+        after, until = date(2023, 4, 3), date(2023, 4, 6)
+        excluded_ids = ["8e129b1d-43bc-4d70-ad2f-dd924c0b3b03"]
+
+        assert indexed.index.is_monotonic_increasing
+        assert len(time_window(indexed, after, until)) == 28
+        assert len(filter_events(indexed, after, until, excluded_ids)) == len(
+            filter_events(dataset, after, until, excluded_ids)
+        )
+
+    def test_time_window_includes_bounds(self) -> None:
+        events = pd.DataFrame(
+            {"ts": pd.to_datetime(["2023-01-01T00:00:00", "2023-01-02T00:00:00", "2023-01-02T00:00:01"])}
+        )
+
+        assert len(time_window(events, date(2023, 1, 1), date(2023, 1, 2))) == 2
+        assert len(time_window(index_by_time(events), date(2023, 1, 1), date(2023, 1, 2))) == 2
+
 
 class TestProcessing:
     def test_history_length_per_professional(self, dataset: pd.DataFrame) -> None:
@@ -63,6 +82,11 @@ class TestProcessing:
         assert len(df_agg) == 1
         assert (df_agg["history_length"] == 608).all()
 
+    def test_history_from_event_types(self, dataset: pd.DataFrame) -> None:
+        pd.testing.assert_frame_equal(
+            history_from_event_types(event_type_history(dataset)), history_length_per_professional(dataset)
+        )
+
     def test_calculate_bucket_size(self, dataset: pd.DataFrame) -> None:
         df = history_length_per_professional(dataset)
         buckets = calculate_bucket_size(df)
@@ -115,8 +139,199 @@ class TestProcessing:
         print(professionals)
         assert len(professionals) == total
 
+    def test_sample_professionals_per_bucket_counts(self, dataset: pd.DataFrame) -> None:
+        df = history_length_per_professional(dataset)
+        buckets = assign_sample_count(calculate_bucket_size(df), 50)
+
+        professionals = sample_professionals(df, buckets, 1)
+        sampled = df[df["professional_id"].isin(professionals)]
+        counts = sampled.groupby(["organization_id", "professional_cohort"], observed=True).size()
+
+        assert len(professionals) == 50
+        for row in buckets.itertuples():
+            assert counts[(row.organization_id, row.professional_cohort)] == row.expected_samples
+
+    def test_sample_professionals_is_reproducible(self, dataset: pd.DataFrame) -> None:
+        df = history_length_per_professional(dataset)
+        buckets = assign_sample_count(calculate_bucket_size(df), 50)
+
+        first = sample_professionals(df, buckets, 7)
+        second = sample_professionals(df, buckets, 7)
+
+        assert first == second
+
+    def test_bucket_can_be_redrawn_on_its_own(self, dataset: pd.DataFrame) -> None:
+        df = history_length_per_professional(dataset)
+        buckets = assign_sample_count(calculate_bucket_size(df), 50)
+        professionals = sample_professionals(df, buckets, 7)
+
+        # dropping the other buckets does not change the draw of a bucket
+        bucket = buckets.iloc[0]
+        redrawn = sample_from_bucket(
+            df,
+            {"organization_id": bucket["organization_id"], "professional_cohort": bucket["professional_cohort"]},
+            bucket["expected_samples"],
+            7,
+        )
+        alone = sample_professionals(df, buckets.iloc[:1], 7)
+
+        assert redrawn == alone
+        assert set(redrawn) <= set(professionals)
+
+    def test_sample_professionals_raises_on_small_bucket(self, dataset: pd.DataFrame) -> None:
+        df = history_length_per_professional(dataset)
+        buckets = assign_sample_count(calculate_bucket_size(df), 50)
+        buckets["expected_samples"] = buckets["expected_samples"] + 1000
+
+        with pytest.raises(ValueError):
+            sample_professionals(df, buckets)
+
+
+def random_buckets(rng: np.random.Generator) -> pd.DataFrame:
+    count = int(rng.integers(1, 300))
+    # mostly small buckets with a few large ones, like organizations of very different sizes
+    sizes = np.minimum(rng.geometric(0.05, count), 500)
+    std = rng.uniform(0, 30, count)
+    return pd.DataFrame(
+        {
+            "organization_id": [f"organization-{i}" for i in range(count)],
+            "professional_cohort": rng.choice(["2019-01-01", "2021-01-01", "2023-01-01"], count),
+            "bucket_size": sizes,
+            "avg_history_length": rng.uniform(1, 100, count),
+            "std_history_length": np.where(sizes > 1, std, np.nan),
+        }
+    )
+
+
+def reference_ceil_allocation(buckets: pd.DataFrame, sample_size: int) -> pd.DataFrame:
+    # the row by row implementation the vectorized ceil strategy replaced
+    buckets = buckets.assign(proportional_expected_samples=buckets["bucket_size"] / buckets["bucket_size"].sum())
+    buckets["proportional_expected_samples"] = buckets["proportional_expected_samples"] * sample_size
+    buckets = buckets.sort_values(by="proportional_expected_samples", ascending=False)
+    buckets["expected_samples"] = buckets["proportional_expected_samples"].apply(lambda x: math.ceil(x)).astype(int)
+    buckets["expected_samples"] = buckets["expected_samples"].apply(lambda x: x if x > 0 else 1)
+    buckets = buckets.sort_values(by=["expected_samples", "avg_history_length"], ascending=False)
+    buckets["cumulative_samples"] = buckets["expected_samples"].cumsum()
+
+    mask_under_threshold = buckets["cumulative_samples"] < sample_size
+    first_over_threshold = mask_under_threshold.sum()
+    last_entry = buckets.iloc[first_over_threshold : first_over_threshold + 1, :].copy()
+    last_entry["expected_samples"] = sample_size - (last_entry["cumulative_samples"] - last_entry["expected_samples"])
+    columns = ["organization_id", "professional_cohort", "expected_samples"]
+    return pd.concat([buckets.loc[mask_under_threshold, columns], last_entry.loc[:, columns]])
+
+
+class TestAllocation:
+    # property checks on random bucket tables, each seed is one example
+
+    @pytest.mark.parametrize("strategy", ALLOCATION_STRATEGIES)
+    def test_allocation_sums_to_the_sample_size(self, strategy: str) -> None:
+        for seed in range(100):
+            rng = np.random.default_rng(seed)
+            buckets = random_buckets(rng)
+            sample_size = int(rng.integers(1, buckets["bucket_size"].sum() + 1))
+
+            allocated = assign_sample_count(buckets, sample_size, strategy)
+
+            assert allocated["expected_samples"].sum() == min(sample_size, buckets["bucket_size"].sum())
+            assert (allocated["expected_samples"] > 0).all()
+            sizes = allocated.merge(buckets, on=["organization_id", "professional_cohort"])
+            assert (sizes["expected_samples"] <= sizes["bucket_size"]).all()
+            assert not allocated.duplicated(["organization_id", "professional_cohort"]).any()
+
+    def test_ceil_matches_the_row_by_row_allocation(self) -> None:
+        for seed in range(100):
+            rng = np.random.default_rng(seed)
+            buckets = random_buckets(rng)
+            sample_size = int(rng.integers(1, buckets["bucket_size"].sum()))
+
+            pd.testing.assert_frame_equal(
+                assign_sample_count(buckets, sample_size), reference_ceil_allocation(buckets, sample_size)
+            )
+
+    def test_largest_remainder_is_within_one_of_the_shares(self) -> None:
+        for seed in range(100):
+            rng = np.random.default_rng(seed)
+            buckets = random_buckets(rng)
+            sample_size = int(rng.integers(1, buckets["bucket_size"].sum()))
+
+            allocated = buckets.merge(
+                assign_sample_count(buckets, sample_size, "largest_remainder"),
+                on=["organization_id", "professional_cohort"],
+                how="left",
+            ).fillna({"expected_samples": 0})
+            shares = allocated["bucket_size"] / allocated["bucket_size"].sum() * sample_size
+
+            assert (allocated["expected_samples"] >= np.floor(shares)).all()
+            assert (allocated["expected_samples"] <= np.ceil(shares)).all()
+
+    def test_neyman_weighs_by_spread(self) -> None:
+        buckets = pd.DataFrame(
+            {
+                "organization_id": ["a", "b", "c"],
+                "professional_cohort": ["2023-01-01"] * 3,
+                "bucket_size": [100, 100, 10],
+                "avg_history_length": [10.0, 10.0, 10.0],
+                "std_history_length": [1.0, 3.0, 100.0],
+            }
+        )
+
+        allocated = assign_sample_count(buckets, 40, "neyman").set_index("organization_id")["expected_samples"]
+
+        # c would get 1000 / 1400 of the sample, more than it has, so it is taken whole and a and b share the rest 1:3
+        assert allocated.to_dict() == {"c": 10, "b": 22, "a": 8}
+
+    def test_neyman_needs_the_spread(self) -> None:
+        buckets = pd.DataFrame(
+            {
+                "organization_id": ["a"],
+                "professional_cohort": ["2023-01-01"],
+                "bucket_size": [10],
+                "avg_history_length": [2.0],
+            }
+        )
+
+        with pytest.raises(ValueError, match="std_history_length"):
+            assign_sample_count(buckets, 5, "neyman")
+
+    def test_unknown_strategy(self, dataset: pd.DataFrame) -> None:
+        buckets = calculate_bucket_size(history_length_per_professional(dataset))
+
+        with pytest.raises(ValueError, match="Unknown allocation strategy"):
+            assign_sample_count(buckets, 5, "random")
+
+    @pytest.mark.parametrize("strategy", ALLOCATION_STRATEGIES)
+    def test_sample_records_the_strategy(self, dataset: pd.DataFrame, strategy: str) -> None:
+        result = sample(dataset, 30, seed=3, allocation=strategy)
+
+        assert len(result.sampled_professionals) == 30
+        assert result.configuration["allocation"] == strategy
+
 
 class TestSampler:
+    def test_sample_on_time_index(self, dataset: pd.DataFrame) -> None:
+        sampled = sample(index_by_time(dataset), 30, after=date(2022, 1, 1), until=date(2024, 4, 1))
+
+        assert len(sampled.sampled_professionals) == 30
+        assert len(set(sampled.samples["professional_id"].to_list())) == 30
+
+    def test_sample_is_reproducible_from_seed(self, dataset: pd.DataFrame) -> None:
+        first = sample(dataset, 30, seed=42)
+        second = sample(dataset.sample(frac=1, random_state=1), 30, seed=42)
+
+        assert first.configuration["seed"] == 42
+        assert first.sampled_professionals == second.sampled_professionals
+
+    def test_sample_carries_history_tables(self, dataset: pd.DataFrame) -> None:
+        after, until = date(2022, 1, 1), date(2024, 4, 1)
+        sampled = sample(dataset, 30, after=after, until=until)
+
+        expected = history_length_per_professional(filter_events(dataset, after, until))
+        pd.testing.assert_frame_equal(sampled.population_history, expected)
+
+        assert sorted(sampled.sample_history["professional_id"].to_list()) == sorted(sampled.sampled_professionals)
+        assert sampled.sample_history["history_length"].sum() == len(sampled.samples)
+
     def test_sample(self, dataset: pd.DataFrame) -> None:
         sampled = sample(dataset, 30, excluded_ids=["8e129b1d-43bc-4d70-ad2f-dd924c0b3b03"])
 
@@ -0,0 +1,70 @@
+import tracemalloc
+from datetime import date
+
+import pytest
+
+from sampler.parser import parse_events
+from sampler.process import sample
+from sampler.profiling import Profiler
+
+
+def test_stage_records_time_memory_and_rows() -> None:
+    profiler = Profiler()
+    tracemalloc.start()
+    try:
+        with profiler.stage("build", rows_in=3) as stage:
+            data = [0] * 100_000
+            stage.rows_out = len(data)
+    finally:
+        tracemalloc.stop()
+
+    (record,) = profiler.stages
+    assert record.name == "build"
+    assert (record.rows_in, record.rows_out) == (3, 100_000)
+    assert record.wall_seconds > 0
+    assert record.traced_peak_bytes is not None
+    assert record.traced_peak_bytes >= 800_000
+
+
+def test_stage_is_recorded_when_it_fails() -> None:
+    profiler = Profiler()
+    with pytest.raises(ValueError), profiler.stage("broken"):
+        raise ValueError
+
+    assert [stage.name for stage in profiler.stages] == ["broken"]
+    assert profiler.stages[0].traced_peak_bytes is None
+
+
+def test_scopes_share_the_stages() -> None:
+    profiler = Profiler()
+    with profiler.scope("wave_1").stage("filter"):
+        pass
+    with profiler.stage("save"):
+        pass
+
+    report = profiler.to_dict()
+    assert [stage["name"] for stage in report["stages"]] == ["wave_1/filter", "save"]
+    assert report["wall_seconds"] == pytest.approx(sum(stage["wall_seconds"] for stage in report["stages"]))
+
+
+def test_sample_records_its_stages() -> None:
+    df = parse_events("./tests/data/example_data_20240306.csv")
+    profiler = Profiler()
+
+    result = sample(df, 30, date(2022, 1, 1), date(2024, 4, 1), profiler=profiler)
+
+    stages = {stage.name: stage for stage in profiler.stages}
+    assert list(stages) == [
+        "filter",
+        "history",
+        "buckets",
+        "assign_sample_count",
+        "sampling",
+        "event_types",
+        "anonymization",
+    ]
+    assert stages["filter"].rows_in == len(df)
+    assert stages["history"].rows_out == len(result.population_history)
+    assert stages["sampling"].rows_out == 30
+    assert result.samples is not None
+    assert stages["anonymization"].rows_out == len(result.samples)
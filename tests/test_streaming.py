@@ -0,0 +1,90 @@
+from datetime import date
+
+import pandas as pd
+
+from sampler.metrics import summarize_histogram
+from sampler.parser import CATEGORICAL_COLUMNS, iter_events
+from sampler.process import filter_events, history_length_per_professional, sample
+from sampler.profiling import Profiler
+from sampler.streaming import merge_histories, sample_streaming
+
+FILENAME = "./tests/data/example_data_20240306.csv"
+
+
+def test_iter_events_matches_parse_events(dataset: pd.DataFrame) -> None:
+    chunks = list(iter_events(FILENAME, 1000))
+
+    assert len(chunks) == 8
+    # every chunk has its own categories, so the concatenation falls back to plain strings
+    pd.testing.assert_frame_equal(
+        pd.concat(chunks), dataset.astype(dict.fromkeys(CATEGORICAL_COLUMNS, object))
+    )
+
+
+def test_merge_histories_matches_full_history(dataset: pd.DataFrame) -> None:
+    chunks = [dataset.iloc[start : start + 1000] for start in range(0, len(dataset), 1000)]
+    merged = merge_histories(history_length_per_professional(chunk) for chunk in chunks)
+    expected = history_length_per_professional(dataset)
+
+    assert merged["history_length"].sum() == len(dataset)
+    pd.testing.assert_frame_equal(merged, expected.drop(columns="index"))
+
+
+def test_sample_streaming(dataset: pd.DataFrame, tmp_path: str) -> None:
+    output_filename = f"{tmp_path}/sampled_anonymized_dataset.csv"
+    after, until = date(2022, 1, 1), date(2024, 4, 1)
+
+    result = sample_streaming(FILENAME, 30, output_filename, chunksize=1000, after=after, until=until)
+    samples = pd.read_csv(output_filename)
+
+    assert result.samples is None
+    assert len(result.sampled_professionals) == 30
+    assert len(set(samples["professional_id"].to_list())) == 30
+
+    filtered = filter_events(dataset, after, until)
+    expected_rows = filtered["professional_id"].isin(result.sampled_professionals).sum()
+    assert len(samples) == expected_rows
+    assert not samples["professional_id"].isin(result.sampled_professionals).any()
+
+    assert result.sample_history is not None
+    assert result.sample_history["history_length"].sum() == expected_rows
+
+
+def test_pipelined_sample_streaming_matches_sequential(tmp_path: str) -> None:
+    options = {"chunksize": 500, "after": date(2022, 1, 1), "until": date(2024, 4, 1), "seed": 9, "id_key": b"pipe"}
+    sequential = sample_streaming(FILENAME, 30, f"{tmp_path}/sequential.csv", **options)
+    profiler = Profiler()
+    pipelined = sample_streaming(
+        FILENAME, 30, f"{tmp_path}/pipelined.csv", pipeline_queue_size=2, profiler=profiler, **options
+    )
+
+    assert pipelined.sampled_professionals == sequential.sampled_professionals
+    assert pipelined.id_mappings == sequential.id_mappings
+    with open(f"{tmp_path}/pipelined.csv") as pipelined_file, open(f"{tmp_path}/sequential.csv") as sequential_file:
+        assert pipelined_file.read() == sequential_file.read()
+
+    stages = {stage.name: stage for stage in profiler.stages}
+    history_steps = stages["history"].pipeline
+    assert history_steps is not None
+    assert [step["name"] for step in history_steps] == ["read", "validate", "history", "accumulate"]
+    assert all(step["chunks"] == 16 for step in history_steps)
+    output_steps = stages["anonymization"].pipeline
+    assert output_steps is not None
+    assert [step["name"] for step in output_steps] == ["read", "validate", "anonymize", "write"]
+
+
+def test_event_types_are_summed_over_the_chunks(dataset: pd.DataFrame, tmp_path: str) -> None:
+    options = {"after": date(2022, 1, 1), "until": date(2024, 4, 1), "seed": 4}
+    expected = sample(dataset, 30, **options)
+    result = sample_streaming(FILENAME, 30, f"{tmp_path}/sampled.csv", chunksize=700, **options)
+
+    for histogram, expected_histogram in [
+        (result.population_event_types, expected.population_event_types),
+        (result.sample_event_types, expected.sample_event_types),
+    ]:
+        assert histogram is not None
+        assert expected_histogram is not None
+        pd.testing.assert_frame_equal(
+            summarize_histogram(histogram).astype({"event_type": object}),
+            summarize_histogram(expected_histogram).astype({"event_type": object}),
+        )
@@ -0,0 +1,97 @@
+import os
+
+import pandas as pd
+import pytest
+
+from sampler.writers import append_frame, atomic_path, write_column, write_frame, write_json
+
+
+@pytest.fixture
+def df() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "professional_id": ["a", "b", "c"],
+            "ts": pd.to_datetime(["2023-01-01T10:00:00", "2023-01-02T10:00:00", "2023-01-03T10:00:00"]),
+        }
+    )
+
+
+@pytest.mark.parametrize("output_format", ["csv", "csv.gz"])
+def test_write_frame_csv(df: pd.DataFrame, tmp_path: str, output_format: str) -> None:
+    filename = write_frame(df, f"{tmp_path}/dataset", output_format, chunksize=2)
+
+    assert filename == f"{tmp_path}/dataset.{output_format}"
+    pd.testing.assert_frame_equal(pd.read_csv(filename, parse_dates=["ts"]), df)
+
+
+@pytest.mark.parametrize("output_format", ["parquet", "arrow"])
+def test_write_frame_columnar(df: pd.DataFrame, tmp_path: str, output_format: str) -> None:
+    pytest.importorskip("pyarrow")
+    filename = write_frame(df, f"{tmp_path}/dataset", output_format)
+
+    read = pd.read_parquet if output_format == "parquet" else pd.read_feather
+    pd.testing.assert_frame_equal(read(filename), df)
+
+
+def test_write_frame_rejects_unknown_format(df: pd.DataFrame, tmp_path: str) -> None:
+    with pytest.raises(ValueError):
+        write_frame(df, f"{tmp_path}/dataset", "xlsx")
+
+
+@pytest.mark.parametrize("output_format", ["csv", "csv.gz"])
+def test_append_frame(df: pd.DataFrame, tmp_path: str, output_format: str) -> None:
+    write_frame(df[:2], f"{tmp_path}/dataset", output_format)
+    filename = append_frame(df[2:], f"{tmp_path}/dataset", output_format)
+
+    pd.testing.assert_frame_equal(pd.read_csv(filename, parse_dates=["ts"]), df)
+
+
+def test_append_frame_truncates_on_failure(df: pd.DataFrame, tmp_path: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    filename = write_frame(df, f"{tmp_path}/dataset")
+    with open(filename, "rb") as file:
+        before = file.read()
+
+    def failing_to_csv(self: pd.DataFrame, path: str, **kwargs: object) -> None:
+        with open(path, "a") as file:
+            file.write("d,2023-01-")
+        raise OSError
+
+    monkeypatch.setattr(pd.DataFrame, "to_csv", failing_to_csv)
+    with pytest.raises(OSError):
+        append_frame(df, f"{tmp_path}/dataset")
+
+    with open(filename, "rb") as file:
+        assert file.read() == before
+
+
+def test_atomic_path_keeps_previous_file_on_failure(tmp_path: str) -> None:
+    filename = f"{tmp_path}/out.json"
+    write_json({"version": 1}, filename)
+
+    with pytest.raises(RuntimeError), atomic_path(filename) as tmp_filename:
+        with open(tmp_filename, "w") as file:
+            file.write("{")
+        raise RuntimeError
+
+    with open(filename) as file:
+        assert file.read() == '{\n    "version": 1\n}'
+    assert os.listdir(tmp_path) == ["out.json"]
+
+
+def test_atomic_path_applies_the_umask(tmp_path: str) -> None:
+    # the permissions of a file created the usual way
+    with open(f"{tmp_path}/plain.json", "w") as file:
+        file.write("{}")
+
+    write_json({}, f"{tmp_path}/out.json")
+
+    assert os.stat(f"{tmp_path}/out.json").st_mode == os.stat(f"{tmp_path}/plain.json").st_mode
+
+
+def test_write_column_and_json(tmp_path: str) -> None:
+    write_column(["a", "b"], "professional_id", f"{tmp_path}/ids.csv")
+    write_json({"excluded_ids": {"x": 1}.keys()}, f"{tmp_path}/config.json")
+
+    assert pd.read_csv(f"{tmp_path}/ids.csv")["professional_id"].to_list() == ["a", "b"]
+    with open(f"{tmp_path}/config.json") as file:
+        assert '"x"' in file.read()